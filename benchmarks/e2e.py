@@ -0,0 +1,208 @@
+"""
+End-to-end benchmarks of gpt-cli against the local fake Assistants API server.
+
+Drives the real AssistantThread and ChatSession through the OpenAI client, so request counts,
+polling waste and rendering cost are measured as the CLI pays for them. Prints one JSON object
+per benchmark.
+
+    python benchmarks/e2e.py --turns 20 --latency 0.02 --run_duration 0.5
+
+Compare tail latency with and without hedging when some requests hang:
+
+    python benchmarks/e2e.py --only turn --turns 200 --straggler_rate 0.02 --straggler_latency 3
+    python benchmarks/e2e.py --only turn --turns 200 --straggler_rate 0.02 --straggler_latency 3 --hedge
+"""
+
+import argparse
+import io
+import json
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+import httpx
+from openai import OpenAI
+from rich.console import Console
+
+from gptcli.assistant import AssistantThread
+from gptcli.cassette import RecordingTransport, ReplayTransport, cassette_path
+from gptcli.cli import StreamingMarkdownPrinter
+from gptcli.fake_server import FakeAssistantsServer, FakeServerConfig
+from gptcli.hedging import Hedger
+from gptcli.session import ChatListener, ChatSession
+
+
+# Replayed requests never reach the network, any URL will do
+REPLAY_URL = "http://127.0.0.1:1/v1"
+
+
+def percentile(values, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def make_assistant(
+    base_url: str, poll_interval: float, transport: Optional[httpx.BaseTransport] = None
+) -> AssistantThread:
+    client = OpenAI(
+        api_key="fake",
+        base_url=base_url,
+        max_retries=0,
+        http_client=httpx.Client(transport=transport) if transport else None,
+    )
+    assistant = AssistantThread({"id": "asst_bench"}, openai_client=client)
+    assistant.poll_interval = poll_interval
+    return assistant
+
+
+def run_turns(session: ChatSession, turns: int) -> List[float]:
+    latencies = []
+    for i in range(turns):
+        started = time.perf_counter()
+        session.process_input(f"question {i}", {})
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def bench_turns(args) -> dict:
+    config = FakeServerConfig(
+        latency=args.latency,
+        run_duration=args.run_duration,
+        straggler_rate=args.straggler_rate,
+        straggler_latency=args.straggler_latency,
+        seed=0,
+    )
+    transport = RecordingTransport(cassette_path(args.record)) if args.record else None
+    with FakeAssistantsServer(config) as server:
+        assistant = make_assistant(server.url, args.poll_interval, transport)
+        if args.hedge:
+            assistant.hedger = Hedger()
+        session = ChatSession(assistant, ChatListener())
+        server.reset_counts()
+        latencies = run_turns(session, args.turns)
+        counts = dict(server.request_counts)
+    if transport is not None:
+        transport.close()
+    return {
+        "benchmark": "turn",
+        "turns": args.turns,
+        "p50_seconds": round(percentile(latencies, 0.5), 4),
+        "p95_seconds": round(percentile(latencies, 0.95), 4),
+        "p99_seconds": round(percentile(latencies, 0.99), 4),
+        "mean_seconds": round(statistics.mean(latencies), 4),
+        "api_calls_per_turn": round(sum(counts.values()) / args.turns, 2),
+        "polls_per_turn": round(counts.get("runs.retrieve", 0) / args.turns, 2),
+        "api_calls": counts,
+        "hedges": assistant.hedger.stats.hedges if assistant.hedger else 0,
+        "hedges_won": assistant.hedger.stats.hedges_won if assistant.hedger else 0,
+    }
+
+
+def bench_turn_replay(args) -> dict:
+    """
+    Replay a cassette recorded with `--only turn --record DIR` without waiting, so only the
+    time spent in the CLI itself is left.
+    """
+    transport = ReplayTransport(cassette_path(args.replay))
+    session = ChatSession(make_assistant(REPLAY_URL, 0, transport), ChatListener())
+    latencies = run_turns(session, args.turns)
+    return {
+        "benchmark": "turn_replay",
+        "turns": args.turns,
+        "p50_seconds": round(percentile(latencies, 0.5), 6),
+        "p95_seconds": round(percentile(latencies, 0.95), 6),
+        "mean_seconds": round(statistics.mean(latencies), 6),
+        "unused_responses": transport.remaining(),
+    }
+
+
+def bench_long_thread(args) -> dict:
+    config = FakeServerConfig(latency=args.latency)
+    with FakeAssistantsServer(config) as server:
+        assistant = make_assistant(server.url, args.poll_interval)
+        thread_id = server.seed_thread(args.thread_messages)
+        assistant.thread = assistant.openai_client.beta.threads.retrieve(thread_id)
+        server.reset_counts()
+        started = time.perf_counter()
+        messages = assistant.fetch_messages(since_last_user_message=False)
+        elapsed = time.perf_counter() - started
+        requests = server.request_counts["messages.list"]
+    return {
+        "benchmark": "long_thread_fetch",
+        "messages": len(messages),
+        "seconds": round(elapsed, 4),
+        "requests": requests,
+    }
+
+
+def bench_startup(args) -> dict:
+    def time_import(module: str) -> List[float]:
+        timings = []
+        for _ in range(args.startup_runs):
+            started = time.perf_counter()
+            subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+            timings.append(time.perf_counter() - started)
+        return timings
+
+    timings = time_import("gptcli.gpt")
+    daemon_client_timings = time_import("gptcli.daemon_client")
+    return {
+        "benchmark": "startup",
+        "runs": args.startup_runs,
+        "p50_seconds": round(percentile(timings, 0.5), 4),
+        "min_seconds": round(min(timings), 4),
+        "daemon_client_p50_seconds": round(percentile(daemon_client_timings, 0.5), 4),
+    }
+
+
+def bench_markdown(args) -> dict:
+    console = Console(file=io.StringIO(), width=100)
+    tokens = [f"word{i % 50} " if i % 40 else "\n\n- item\n" for i in range(args.render_tokens)]
+    started = time.perf_counter()
+    with StreamingMarkdownPrinter(console, markdown=True) as printer:
+        for token in tokens:
+            printer.print(token)
+    elapsed = time.perf_counter() - started
+    return {
+        "benchmark": "markdown_render",
+        "tokens": args.render_tokens,
+        "seconds": round(elapsed, 4),
+        "ms_per_token": round(elapsed * 1000 / args.render_tokens, 3),
+    }
+
+
+BENCHMARKS = {
+    "turn": bench_turns,
+    "turn_replay": bench_turn_replay,
+    "long_thread_fetch": bench_long_thread,
+    "startup": bench_startup,
+    "markdown_render": bench_markdown,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", choices=list(BENCHMARKS), action="append")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every request.")
+    parser.add_argument("--run_duration", type=float, default=0.5)
+    parser.add_argument("--straggler_rate", type=float, default=0.0, help="Fraction of requests that hang.")
+    parser.add_argument("--straggler_latency", type=float, default=3.0)
+    parser.add_argument("--hedge", action="store_true", help="Hedge slow polls and listings in the turn benchmark.")
+    parser.add_argument("--poll_interval", type=float, default=AssistantThread.poll_interval)
+    parser.add_argument("--thread_messages", type=int, default=1000)
+    parser.add_argument("--startup_runs", type=int, default=5)
+    parser.add_argument("--render_tokens", type=int, default=1000)
+    parser.add_argument("--record", metavar="DIR", help="Record the turn benchmark's traffic.")
+    parser.add_argument("--replay", metavar="DIR", help="Run turn_replay on this cassette.")
+    args = parser.parse_args()
+
+    default = [name for name in BENCHMARKS if name != "turn_replay" or args.replay]
+    for name in args.only or default:
+        print(json.dumps(BENCHMARKS[name](args)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+"""
+Drive many concurrent scripted chat sessions and report how the host holds up.
+
+Each simulated user is a thread running a real ChatSession: it sends a prompt, waits for the
+reply, thinks, and repeats. Concurrency ramps through the given levels and one JSON object is
+printed per level with throughput, turn latency percentiles, error rate, open sockets, CPU and
+RSS. Runs against the local fake server unless --base_url is given. The fake server runs in its
+own process, so the sockets, CPU and RSS reported are the client's alone.
+
+    python benchmarks/loadtest.py --concurrency 10,50,100,200 --duration 30
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import resource
+import threading
+import time
+from typing import List, Optional
+
+from openai import OpenAI
+
+from gptcli.assistant import AssistantThread
+from gptcli.fake_server import FakeAssistantsServer, FakeServerConfig
+from gptcli.session import ChatListener, ChatSession
+
+
+def serve_fake_server(config: FakeServerConfig, urls: "multiprocessing.Queue", stop):
+    server = FakeAssistantsServer(config).start()
+    urls.put(server.url)
+    stop.wait()
+    server.stop()
+
+
+def start_fake_server(config: FakeServerConfig):
+    """
+    Start the fake server in a child process, and return its URL and a function that stops it.
+    """
+    urls: multiprocessing.Queue = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=serve_fake_server, args=(config, urls, stop), name="gptcli-fake-server", daemon=True
+    )
+    process.start()
+    url = urls.get(timeout=30)
+
+    def stop_server():
+        stop.set()
+        process.join()
+
+    return url, stop_server
+
+
+def percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * fraction))], 4)
+
+
+def open_sockets() -> int:
+    count = 0
+    for fd in os.listdir("/proc/self/fd"):
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                count += 1
+        except OSError:
+            pass
+    return count
+
+
+def rss_bytes() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+class ErrorCountingListener(ChatListener):
+    def __init__(self, results: "LevelResults"):
+        self.results = results
+        self.failed = False
+
+    def on_error(self, error: Exception):
+        self.failed = True
+        self.results.record_error(type(error).__name__)
+
+
+class LevelResults:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: List[float] = []
+        self.errors: dict = {}
+
+    def record_turn(self, seconds: float):
+        with self.lock:
+            self.latencies.append(seconds)
+
+    def record_error(self, name: str):
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class SimulatedUser(threading.Thread):
+    def __init__(self, index: int, args, client_factory, results: LevelResults, stop: threading.Event):
+        super().__init__(name=f"loadtest-user-{index}", daemon=True)
+        self.args = args
+        self.client_factory = client_factory
+        self.results = results
+        self.stop_event = stop
+        self.random = random.Random(index)
+
+    def run(self):
+        listener = ErrorCountingListener(self.results)
+        try:
+            # Creating the assistant handle and thread is part of the load too.
+            assistant = AssistantThread(
+                {"id": self.args.assistant_id}, openai_client=self.client_factory()
+            )
+            session = ChatSession(assistant, listener)
+        except Exception as e:
+            self.results.record_error(type(e).__name__)
+            return
+        assistant.poll_interval = self.args.poll_interval
+        prompt = ("lorem ipsum " * (self.args.prompt_chars // 12 + 1))[: self.args.prompt_chars]
+
+        # Spread the first requests so a level doesn't start with a thundering herd.
+        self.stop_event.wait(self.random.uniform(0, self.args.think_time))
+        while not self.stop_event.is_set():
+            started = time.perf_counter()
+            listener.failed = False
+            try:
+                session.process_input(prompt, {})
+            except Exception as e:
+                # ChatSession only reports errors from the run itself to its listener.
+                listener.on_error(e)
+            if not listener.failed:
+                self.results.record_turn(time.perf_counter() - started)
+            if self.args.think_time:
+                self.stop_event.wait(self.random.expovariate(1 / self.args.think_time))
+
+
+def run_level(concurrency: int, args, client_factory) -> dict:
+    results = LevelResults()
+    stop = threading.Event()
+    users = [SimulatedUser(i, args, client_factory, results, stop) for i in range(concurrency)]
+
+    peak_sockets = 0
+    peak_rss = 0
+    cpu_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    for user in users:
+        user.start()
+    while time.perf_counter() - started < args.duration:
+        peak_sockets = max(peak_sockets, open_sockets())
+        peak_rss = max(peak_rss, rss_bytes())
+        time.sleep(args.sample_interval)
+    stop.set()
+    for user in users:
+        user.join()
+    elapsed = time.perf_counter() - started
+    cpu_after = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_seconds = (cpu_after.ru_utime - cpu_before.ru_utime) + (
+        cpu_after.ru_stime - cpu_before.ru_stime
+    )
+
+    turns = len(results.latencies)
+    errors = sum(results.errors.values())
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "turns": turns,
+        "turns_per_second": round(turns / elapsed, 2),
+        "p50_seconds": percentile(results.latencies, 0.5),
+        "p95_seconds": percentile(results.latencies, 0.95),
+        "p99_seconds": percentile(results.latencies, 0.99),
+        "error_rate": round(errors / (turns + errors), 4) if turns + errors else 0.0,
+        "errors": results.errors,
+        "peak_open_sockets": peak_sockets,
+        "peak_rss_bytes": peak_rss,
+        "cpu_percent": round(100 * cpu_seconds / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--concurrency",
+        default="10,50,100",
+        help="Comma-separated concurrency levels to ramp through.",
+    )
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per level.")
+    parser.add_argument("--think_time", type=float, default=1.0, help="Mean seconds between turns.")
+    parser.add_argument("--prompt_chars", type=int, default=200)
+    parser.add_argument("--poll_interval", type=float, default=0.5)
+    parser.add_argument(
+        "--shared_client",
+        action="store_true",
+        help="Share one OpenAI client (and connection pool) between all sessions.",
+    )
+    parser.add_argument("--base_url", help="Endpoint to test instead of the local fake server.")
+    parser.add_argument("--api_key", default=os.environ.get("OPENAI_API_KEY", "fake"))
+    parser.add_argument("--assistant_id", default="asst_loadtest")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake server request latency.")
+    parser.add_argument("--run_duration", type=float, default=1.0, help="Fake server run duration.")
+    parser.add_argument("--error_rate", type=float, default=0.0, help="Fake server error rate.")
+    parser.add_argument("--sample_interval", type=float, default=0.5)
+    args = parser.parse_args()
+
+    stop_server = None
+    base_url = args.base_url
+    if base_url is None:
+        base_url, stop_server = start_fake_server(
+            FakeServerConfig(
+                latency=args.latency,
+                run_duration=args.run_duration,
+                error_rate=args.error_rate,
+            )
+        )
+
+    def new_client() -> OpenAI:
+        return OpenAI(api_key=args.api_key, base_url=base_url, max_retries=0)
+
+    if args.shared_client:
+        shared = new_client()
+        client_factory = lambda: shared  # noqa: E731
+    else:
+        client_factory = new_client
+
+    try:
+        for level in args.concurrency.split(","):
+            print(json.dumps(run_level(int(level), args, client_factory)), flush=True)
+    finally:
+        if stop_server is not None:
+            stop_server()
+
+
+if __name__ == "__main__":
+    main()
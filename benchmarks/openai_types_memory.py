@@ -0,0 +1,89 @@
+"""
+Measure the memory needed to hold many thread messages.
+
+Builds N messages from API-shaped dicts with gptcli.openai_types and compares against the SDK's
+pydantic models. Prints one JSON object per scenario.
+
+    python benchmarks/openai_types_memory.py --messages 100000
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+from openai.types.beta.threads import ThreadMessage as SDKThreadMessage
+
+from gptcli.openai_types import ThreadMessage
+
+
+def make_message(i: int) -> dict:
+    return {
+        "id": f"msg_{i:024d}",
+        "object": "thread.message",
+        "created_at": 1703532865 + i,
+        "thread_id": "thread_RSkXNj7NpXmAdgUTDc8Fm3XX",
+        "role": "assistant" if i % 2 else "user",
+        "content": [
+            {
+                "type": "text",
+                "text": {"value": f"This is message number {i}.", "annotations": []},
+            }
+        ],
+        "file_ids": [],
+        "assistant_id": "asst_jCP75X9phRfVjZ8Q4iBistYT",
+        "run_id": "run_ZuVSExmplLDv2Z76FJNRXEzw",
+        "metadata": {},
+    }
+
+
+def measure(name: str, count: int, build) -> dict:
+    gc.collect()
+    # Trace the raw dicts as well, in case the built objects keep referencing them.
+    tracemalloc.start()
+    raw = [make_message(i) for i in range(count)]
+    started = time.perf_counter()
+    messages = build(raw)
+    elapsed = time.perf_counter() - started
+    del raw
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return {
+        "scenario": name,
+        "messages": count,
+        "build_seconds": round(elapsed, 3),
+        "retained_bytes": current,
+        "bytes_per_message": round(current / count),
+    }
+
+
+def build_slotted(raw):
+    return [ThreadMessage.from_dict(item) for item in raw]
+
+
+def build_sdk(raw):
+    return [SDKThreadMessage(**item) for item in raw]
+
+
+def build_from_sdk(raw):
+    return [ThreadMessage.from_sdk(message) for message in build_sdk(raw)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=100_000)
+    args = parser.parse_args()
+
+    for name, build in [
+        ("slotted", build_slotted),
+        ("sdk models", build_sdk),
+        ("converted from sdk", build_from_sdk),
+    ]:
+        print(json.dumps(measure(name, args.messages, build)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Measure how many tokens per second the response streamer chain can deliver.
+
+Runs a stream of tokens through CompositeChatListener with the terminal renderer (writing to an
+in-memory console) and a few background listeners, with and without token coalescing, and
+prints one JSON object per scenario.
+
+    python benchmarks/streamer_throughput.py --tokens 20000
+"""
+
+import argparse
+import io
+import json
+import time
+
+from rich.console import Console
+
+from gptcli.cli import CLIChatListener
+from gptcli.composite import AsyncChatListener, CompositeChatListener
+from gptcli.session import ChatListener, CoalescePolicy, ResponseStreamer
+
+
+class CountingStreamer(ResponseStreamer):
+    def __init__(self):
+        self.calls = 0
+
+    def on_next_token(self, token: str):
+        self.calls += 1
+
+
+class CountingListener(ChatListener):
+    def __init__(self, coalesce_policy=None):
+        self.coalesce_policy = coalesce_policy
+        self.streamers = []
+
+    def response_streamer(self):
+        streamer = CountingStreamer()
+        self.streamers.append(streamer)
+        return streamer
+
+
+def make_cli_listener(markdown: bool, coalesce: bool) -> CLIChatListener:
+    listener = CLIChatListener(markdown)
+    listener.console = Console(file=io.StringIO(), width=100)
+    if not coalesce:
+        listener.coalesce_policy = None
+    return listener
+
+
+def run(name: str, listeners, tokens: int) -> dict:
+    composite = CompositeChatListener(listeners)
+    started = time.perf_counter()
+    with composite.response_streamer() as stream:
+        for i in range(tokens):
+            stream.on_next_token(f" tok{i % 100}")
+    elapsed = time.perf_counter() - started
+    for listener in listeners:
+        if isinstance(listener, AsyncChatListener):
+            listener.on_chat_end()
+    return {
+        "scenario": name,
+        "tokens": tokens,
+        "seconds": round(elapsed, 4),
+        "tokens_per_second": round(tokens / elapsed),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument(
+        "--markdown_tokens",
+        type=int,
+        default=2000,
+        help="Markdown re-rendering is quadratic without coalescing, so it gets a shorter stream.",
+    )
+    args = parser.parse_args()
+
+    background = lambda: [  # noqa: E731
+        AsyncChatListener(CountingListener(CoalescePolicy(interval=0.25, max_chars=65536)))
+        for _ in range(3)
+    ]
+    scenarios = [
+        ("null listeners", lambda: [CountingListener() for _ in range(4)], args.tokens),
+        (
+            "null listeners, coalesced",
+            lambda: [CountingListener(CoalescePolicy(interval=0.02)) for _ in range(4)],
+            args.tokens,
+        ),
+        ("plain text", lambda: [make_cli_listener(False, False)], args.tokens),
+        ("plain text, coalesced", lambda: [make_cli_listener(False, True)], args.tokens),
+        (
+            "plain text + background listeners, coalesced",
+            lambda: [make_cli_listener(False, True), *background()],
+            args.tokens,
+        ),
+        ("markdown", lambda: [make_cli_listener(True, False)], args.markdown_tokens),
+        ("markdown, coalesced", lambda: [make_cli_listener(True, True)], args.markdown_tokens),
+    ]
+    for name, listeners, tokens in scenarios:
+        print(json.dumps(run(name, listeners(), tokens)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,47 @@
+import copy
+import logging
+import os
 import sys
+import threading
 import time
+from concurrent.futures import Future, ThreadPoolExecutor
 from attr import dataclass
-from typing import Dict, TypedDict, List
-from openai import OpenAI
+from typing import Callable, Dict, Optional, TypedDict, List
+from openai import OpenAI, OpenAIError
 
 from gptcli.types import Message
-from gptcli.openai_types import ThreadMessage, ThreadRun
+from gptcli import metrics
+from gptcli.downloads import Downloader, GeneratedFile
+from gptcli.hedging import Hedger
+from gptcli.openai_types import Content, MessageText, ThreadMessage, ThreadRun
+from gptcli.rollover import (
+    SUMMARY_INSTRUCTIONS,
+    RolloverPolicy,
+    count_tokens,
+    format_seed_message,
+    recent_turns,
+    split_message,
+)
+from gptcli.tools import ToolRegistry
+from gptcli.trace import span
+from gptcli.wal import PendingRun, RunLog
+
+logger = logging.getLogger("gptcli-assistant")
+
+# How many messages a thread is created with in one request. Longer seeds are appended after.
+MAX_SEED_MESSAGES = 32
+# A run in one of these states will never complete
+RUN_FAILED_STATUSES = ("failed", "cancelled", "expired")
+
+# Called with the old thread id, the new thread id and the summary the new thread was seeded with
+RolloverCallback = Callable[[str, str, str], None]
+
+class RunFailedError(OpenAIError):
+    def __init__(self, run):
+        self.run = run
+        reason = f": {run.last_error.message}" if run.last_error else ""
+        super().__init__(f"The run {run.status}{reason}")
+
 
 class AssistantConfig(TypedDict, total=False):
     id: str
@@ -18,6 +54,18 @@ CONFIG_DEFAULTS = {
 DEFAULT_ASSISTANTS: Dict[str, AssistantConfig] = {}
 
 
+def resolve_assistant_config(name: str, config: AssistantConfig) -> AssistantConfig:
+    config = config.copy()
+    if name in DEFAULT_ASSISTANTS:
+        # Merge the config with the default config
+        # If a key is in both, use the value from the config
+        default_config = DEFAULT_ASSISTANTS[name]
+        for key in [*config.keys(), *default_config.keys()]:
+            if config.get(key) is None:
+                config[key] = default_config[key]
+    return config
+
+
 class AssistantThread():
     """
     A class to represent an assistant thread.
@@ -27,68 +75,223 @@ class AssistantThread():
     In future we can decouple Assistants from Threads: 
     - create an Assistant class that can contain multiple AssistantThreads.
     """
-    def __init__(self, config: AssistantConfig):
+    # Seconds between two status checks of a run.
+    poll_interval: float = 2
+    # When to move the conversation to a fresh, summarized thread. None never does.
+    rollover_policy: Optional[RolloverPolicy] = None
+    # Hedges slow status polls and message listings. None sends every request once.
+    hedger: Optional[Hedger] = None
+    # Runs the function tools that runs call. None answers every call with an error.
+    tool_registry: Optional[ToolRegistry] = None
+    # Downloads the files and images answers cite. None only lists them.
+    downloader: Optional[Downloader] = None
+    # Records the runs being waited for, so a later process can read their answers if this one dies
+    run_log: Optional[RunLog] = None
+
+    def __init__(
+        self,
+        config: AssistantConfig,
+        openai_client: Optional[OpenAI] = None,
+        assistant_handle=None,
+    ):
         self.config = config
-        self.openai_client = OpenAI()
-        self.assistant_handle = self.openai_client.beta.assistants.retrieve(config.get("id"))
+        self.openai_client = openai_client or OpenAI()
+        self.assistant_handle = assistant_handle or self.openai_client.beta.assistants.retrieve(
+            config.get("id")
+        )
         self.last_user_message_id = None
+        self.last_run_id = None
+        self.last_response_message_ids: List[str] = []
+        self.rollover_callbacks: List[RolloverCallback] = []
+        # The files and images answers have cited, for `:download`
+        self.generated_files: List[GeneratedFile] = []
+        self.last_user_message: Optional[Message] = None
+        # The run recorded in `run_log`, until its answer has been read
+        self._logged_run: Optional[PendingRun] = None
+        # A run an earlier process started on this thread, to wait for instead of starting one
+        self.resumed_run: Optional[PendingRun] = None
         self.init_messages()
 
     @classmethod
-    def from_config(cls, name: str, config: AssistantConfig):
-        config = config.copy()
-        if name in DEFAULT_ASSISTANTS:
-            # Merge the config with the default config
-            # If a key is in both, use the value from the config
-            default_config = DEFAULT_ASSISTANTS[name]
-            for key in [*config.keys(), *default_config.keys()]:
-                if config.get(key) is None:
-                    config[key] = default_config[key]
-
-        return cls(config)
+    def from_config(
+        cls, name: str, config: AssistantConfig, openai_client: Optional[OpenAI] = None
+    ):
+        return cls(resolve_assistant_config(name, config), openai_client)
 
     def init_messages(self) -> List[Message]:
         """
         Create a new OpenAI thread and return the default messages.
         """
         self.thread = self.openai_client.beta.threads.create()  
+        self._reset_history()
 
         return self.config.get("messages", [])[:]
 
+    def _reset_history(self, history: Optional[List[Message]] = None, seed: Optional[str] = None):
+        # What the current thread holds, as far as the rollover policy is concerned
+        self.history: List[Message] = history or []
+        self.thread_message_count = len(split_message(seed)) if seed else 0
+        self.thread_token_count = self._count_tokens(seed) if seed else 0
+        self._pending_rollover: Optional[Future] = None
+        # A failed rollover is retried after 2, 4, 8, ... more messages
+        self._rollover_failures = 0
+        self._rollover_retry_at = 0
+
+    def _count_tokens(self, text: str) -> int:
+        # Loading the tokenizer isn't free, only pay for it when a token limit is set
+        if self.rollover_policy is None or self.rollover_policy.max_tokens is None:
+            return 0
+        return count_tokens(text)
 
-    def add_message(self, our_message: Message) -> ThreadMessage:
+    def _record(self, message: Message):
+        self.history.append(message)
+        self.thread_message_count += 1
+        self.thread_token_count += self._count_tokens(message["content"])
+
+
+    def add_message(
+        self, our_message: Message, file_ids: Optional[List[str]] = None
+    ) -> ThreadMessage:
         """
-        Send a message to the chatgpt Thread associated with this assistant and return the response.
+        Send a message, with any attached (already uploaded) files, to the chatgpt Thread associated with this assistant and return the response.
         """
-        their_message = self.openai_client.beta.threads.messages.create(
-            thread_id=self.thread.id,
-            role=our_message['role'],
-            content=our_message['content'],
-        )
+        self._adopt_rollover()
+        with span("add_message"):
+            their_message = self.openai_client.beta.threads.messages.create(
+                thread_id=self.thread.id,
+                role=our_message['role'],
+                content=our_message['content'],
+                file_ids=file_ids or [],
+            )
         self.last_user_message_id = their_message.id
+        self.last_user_message = our_message
+        self._record(our_message)
         return their_message
 
     def run_thread(self) -> ThreadRun:
         """
         Start a Run on the chatgpt Thread associated with this assistant and wait for it to complete.
         """
-        run = self.openai_client.beta.threads.runs.create(
-            thread_id=self.thread.id,
-            assistant_id=self.assistant_handle.id,
-        )
-        # TODO move out of this function. Use async primitive instead.
-        while run.status != "completed":
-            time.sleep(2)
-            run = self.openai_client.beta.threads.runs.retrieve(run.id, thread_id=self.thread.id)
+        if self.resumed_run is not None:
+            return self._wait_for_resumed_run()
+        if self._pending_rollover is not None:
+            # A thread runs one thing at a time, let the summary finish first
+            with span("rollover.wait"):
+                self._pending_rollover.exception()
+        with span("runs.create"):
+            run = self.openai_client.beta.threads.runs.create(
+                thread_id=self.thread.id,
+                assistant_id=self.assistant_handle.id,
+            )
+        # An earlier answer that never got read is superseded by this one
+        self._end_logged_run()
+        if self.run_log is not None and self.last_user_message is not None:
+            self._logged_run = self.run_log.begin(
+                self.thread.id, run.id, self.assistant_handle.id, self.last_user_message_id, self.last_user_message
+            )
+        try:
+            run = self._wait_for_run(run, self.thread.id)
+        except BaseException:
+            # We're still here, so the answer isn't lost: the session reports the error
+            self._end_logged_run()
+            raise
+        self.last_run_id = run.id
+        return run
+
+    def resume_thread(self, pending: PendingRun):
+        """
+        Continue the thread of a run an earlier process started but didn't read the answer of.
+        The next `run_thread` waits for that run instead of starting another one.
+        """
+        with span("threads.retrieve"):
+            self.thread = self.openai_client.beta.threads.retrieve(pending.thread_id)
+        self._reset_history()
+        self.last_user_message_id = pending.message_id
+        self.last_user_message = pending.user_message
+        self.last_run_id = None
+        self.last_response_message_ids = []
+        self._record(pending.user_message)
+        self.resumed_run = self.run_log.claim(pending) if self.run_log is not None else pending
 
+    def _wait_for_resumed_run(self) -> ThreadRun:
+        pending, self.resumed_run = self.resumed_run, None
+        assert pending is not None
+        self._logged_run = pending if self.run_log is not None else None
+        try:
+            with span("runs.retrieve"):
+                run = self.openai_client.beta.threads.runs.retrieve(pending.run_id, thread_id=pending.thread_id)
+            run = self._wait_for_run(run, pending.thread_id)
+        except BaseException:
+            self._end_logged_run()
+            raise
+        self.last_run_id = run.id
         return run
 
+    def _end_logged_run(self):
+        if self._logged_run is not None and self.run_log is not None:
+            self.run_log.end(self._logged_run)
+        self._logged_run = None
+
+    def _wait_for_run(self, run, thread_id: str):
+        # TODO move out of this function. Use async primitive instead.
+        started = time.monotonic()
+        polls = 0
+        # Runs we stopped waiting for, because of an API error or Ctrl-C, count as "abandoned"
+        status = "abandoned"
+        metrics.run_started()
+        try:
+            while run.status != "completed":
+                if run.status == "requires_action":
+                    run = self._submit_tool_outputs(run, thread_id)
+                    continue
+                if run.status in RUN_FAILED_STATUSES:
+                    status = run.status
+                    raise RunFailedError(run)
+                with span("run_thread.wait"):
+                    time.sleep(self.poll_interval)
+                with span("run_thread.poll", run.status):
+                    run = self._read(
+                        "runs.retrieve", self.openai_client.beta.threads.runs.retrieve, run.id, thread_id=thread_id
+                    )
+                polls += 1
+            status = run.status
+            return run
+        finally:
+            metrics.run_finished(self.assistant_handle.id, status, time.monotonic() - started, polls)
+
+    def _submit_tool_outputs(self, run, thread_id: str):
+        tool_calls = run.required_action.submit_tool_outputs.tool_calls
+        registry = self.tool_registry or ToolRegistry({})
+        with span("tools.run", str(len(tool_calls))):
+            outputs = registry.run_calls(tool_calls)
+        # All outputs at once, the run can't continue before it has all of them
+        with span("runs.submit_tool_outputs"):
+            return self.openai_client.beta.threads.runs.submit_tool_outputs(
+                run.id, thread_id=thread_id, tool_outputs=outputs
+            )
+
+    def _read(self, name: str, function, *args, **kwargs):
+        """
+        Make a read-only API call, hedged if the assistant has a hedger.
+        """
+        if self.hedger is None:
+            return function(*args, **kwargs)
+        return self.hedger.call(name, function, *args, **kwargs)
+
+    def _list_messages(self, thread_id: str) -> list:
+        # Page by page, so a slow page is hedged on its own
+        page = self._read("messages.list", self.openai_client.beta.threads.messages.list, thread_id=thread_id)
+        messages = list(page.data)
+        while page.has_next_page():
+            page = self._read("messages.list", page.get_next_page)
+            messages += page.data
+        return messages
+
     def fetch_messages(self, since_last_user_message: bool) -> List[ThreadMessage]:
         # TODO keep SyncCursorPage instead of immediately converting to list? 
         # May become a problem when threads become long enough to split into multiple pages
-        messages = list(self.openai_client.beta.threads.messages.list(
-            thread_id=self.thread.id
-        ))
+        with span("fetch_messages"):
+            messages = self._list_messages(self.thread.id)
         # Messages come back in reverse chronological order. We reverse them.
         messages.reverse()
 
@@ -100,39 +303,261 @@ class AssistantThread():
             if last_message_index == -1:
                 raise ValueError("last_message_id not found in messages")
             messages = messages[last_message_index+1:]
+            if self.last_run_id is not None:
+                # Earlier answers to the same message, or a summary, aren't part of this answer
+                messages = [message for message in messages if message.run_id == self.last_run_id]
+            self.last_response_message_ids = [message.id for message in messages]
 
+        messages = [ThreadMessage.from_sdk(message) for message in messages]
+        if since_last_user_message:
+            # The answer is read, a crash from now on doesn't lose it
+            self._end_logged_run()
+            response = "".join(thread_message_to_text(messages))
+            self._record({"role": "assistant", "content": response})
+            self._maybe_start_rollover()
         return self.add_citations_to_messages(messages)
+
+    def discard_answer(self):
+        """
+        Forget the answer to the last message, before answering it again. A rollover started
+        after that answer would carry it over to the next thread, so it is dropped as well.
+        """
+        if self._pending_rollover is not None:
+            # Its summary run has to be over before the thread can run again
+            with span("rollover.wait"):
+                self._pending_rollover.exception()
+            self._pending_rollover = None
+        while self.history and self.history[-1]["role"] == "assistant":
+            self.history.pop()
+
+    def _maybe_start_rollover(self):
+        policy = self.rollover_policy
+        if policy is None or self._pending_rollover is not None:
+            return
+        if not policy.exceeded(self.thread_message_count, self.thread_token_count):
+            return
+        if self.thread_message_count < self._rollover_retry_at:
+            return
+        # Summarize while the user reads the answer and types the next message
+        future: Future = Future()
+        thread_id = self.thread.id
+        kept_turns = recent_turns(self.history, policy.keep_turns)
+
+        def roll_over():
+            try:
+                future.set_result(self._roll_over(thread_id, kept_turns))
+            except BaseException as e:
+                future.set_exception(e)
+
+        self._pending_rollover = future
+        threading.Thread(target=roll_over, name="gptcli-rollover", daemon=True).start()
+
+    def _roll_over(self, thread_id: str, kept_turns: List[Message]):
+        """
+        Summarize the thread and create its successor. Returns the new thread, the summary and the kept turns.
+        """
+        with span("rollover.summarize"):
+            run = self.openai_client.beta.threads.runs.create(
+                thread_id=thread_id,
+                assistant_id=self.assistant_handle.id,
+                instructions=SUMMARY_INSTRUCTIONS,
+            )
+            self._wait_for_run(run, thread_id)
+            latest = self.openai_client.beta.threads.messages.list(thread_id=thread_id, limit=1)
+            if not latest.data or latest.data[0].run_id != run.id:
+                raise ValueError(f"The summary run of thread {thread_id} wrote no message")
+            summary = "".join(thread_message_to_text([ThreadMessage.from_sdk(latest.data[0])]))
+        seed = format_seed_message(summary, kept_turns)
+        with span("rollover.threads.create"):
+            thread = self._create_seeded_thread(seed)
+        return thread, summary, kept_turns, seed
+
+    def _adopt_rollover(self):
+        """
+        Switch to the summarized thread if a rollover was started, waiting for it if needed.
+        """
+        future = self._pending_rollover
+        if future is None:
+            return
+        try:
+            with span("rollover.wait"):
+                thread, summary, kept_turns, seed = future.result()
+        except Exception:
+            # Keep going on the long thread, and try again after a few more turns
+            logger.exception("Failed to roll over thread %s", self.thread.id)
+            self._pending_rollover = None
+            self._rollover_failures += 1
+            self._rollover_retry_at = self.thread_message_count + 2 ** self._rollover_failures
+            return
+        old_thread_id = self.thread.id
+        self.thread = thread
+        self._reset_history(kept_turns, seed)
+        for callback in self.rollover_callbacks:
+            callback(old_thread_id, thread.id, summary)
     
-    def add_citations_to_messages(self, messages):  
+    def add_citations_to_messages(self, messages: List[ThreadMessage]) -> List[ThreadMessage]:
         messages_with_citations = []
         for message in messages:
-            # Extract the message content
-            # Assumes one text message per message
-            if len(message.content) > 1:
-                raise ValueError("Unimplemented: More than one text message per message")
-            message_content = message.content[0].text
-            annotations = message_content.annotations
-            citations = []
-
-            # Iterate over the annotations and add footnotes
-            for index, annotation in enumerate(annotations):
-                # Replace the text with a footnote
-                message_content.value = message_content.value.replace(annotation.text, f' [{index}]')
-
-                # Gather citations based on annotation attributes
-                if (file_citation := getattr(annotation, 'file_citation', None)):
-                    cited_file = self.openai_client.files.retrieve(file_citation.file_id)
-                    searchable_quote = ' '.join(file_citation.quote.split()[:6])
-                    citations.append(f'[{index}] {cited_file.filename} - (Search: "{searchable_quote}")')
-                elif (file_path := getattr(annotation, 'file_path', None)):
-                    cited_file = self.openai_client.files.retrieve(file_path.file_id)
-                    citations.append(f'[{index}] Click <here> to download {cited_file.filename}')
-
-            # Add footnotes to the end of the message before displaying to user
-            message_content.value += '\n\n' + '\n'.join(citations)
-            messages_with_citations.append(message_content.value)
-        
-        return messages
+            contents = [self._add_citations(content) for content in message.content]
+            messages_with_citations.append(message.replace_content(contents))
+
+        return messages_with_citations
+
+    def _add_citations(self, content: Content) -> Content:
+        if content.image_file is not None:
+            # Shown as text, since that's all the terminal displays
+            file_id = content.image_file.file_id
+            note = self._generated_file_note(GeneratedFile(file_id, f"{file_id}.png", None))
+            return Content("text", MessageText(f"Image: {note}\n", ()))
+
+        message_content = content.text
+        annotations = message_content.annotations
+        value = message_content.value
+        citations = []
+
+        # Iterate over the annotations and add footnotes
+        for index, annotation in enumerate(annotations):
+            # Replace the text with a footnote
+            value = value.replace(annotation.text, f' [{index}]')
+
+            # Gather citations based on annotation attributes
+            if (file_citation := getattr(annotation, 'file_citation', None)):
+                cited_file = self.retrieve_file(file_citation.file_id)
+                searchable_quote = ' '.join(file_citation.quote.split()[:6])
+                citations.append(f'[{index}] {cited_file.filename} - (Search: "{searchable_quote}")')
+            elif (file_path := getattr(annotation, 'file_path', None)):
+                cited_file = self.retrieve_file(file_path.file_id)
+                note = self._generated_file_note(
+                    GeneratedFile(file_path.file_id, cited_file.filename, cited_file.bytes)
+                )
+                citations.append(f'[{index}] {note}')
+
+        # Add footnotes to the end of the message before displaying to user
+        value += '\n\n' + '\n'.join(citations)
+        return Content(content.type, message_content.replace(value))
+
+    def _generated_file_note(self, file: GeneratedFile) -> str:
+        if file.file_id not in [known.file_id for known in self.generated_files]:
+            self.generated_files.append(file)
+        name = os.path.basename(file.filename)
+        if self.downloader is None:
+            return f"Click <here> to download {name}"
+        if not self.downloader.auto:
+            return f"{name} - `:download` to save it"
+        download = self.downloader.download(file.file_id, file.filename, file.size)
+        return f"{name} - saving to {download.path}"
+
+    def fork(self, count: int) -> List["AssistantThread"]:
+        """
+        Copy the conversation up to and including the last user message into `count` new threads,
+        to generate alternative answers to it concurrently. Answers given after that message are left out.
+        """
+        with span("fork.fetch"):
+            messages = self._list_messages(self.thread.id)
+        messages.reverse()
+        user_indexes = [index for index, message in enumerate(messages) if message.role == "user"]
+        if not user_indexes:
+            raise ValueError("Nothing to fork: the thread has no user message")
+        question = ThreadMessage.from_sdk(messages[user_indexes[-1]])
+        earlier: List[Message] = [
+            {"role": message.role, "content": "".join(thread_message_to_text([message]))}
+            for message in map(ThreadMessage.from_sdk, messages[: user_indexes[-1]])
+        ]
+        our_question: Message = {
+            "role": "user",
+            "content": "".join(content.text.value for content in question.content if content.type == "text"),
+        }
+
+        def create_fork(_) -> "AssistantThread":
+            fork = self.branch(earlier)
+            # Alternative answers are only worth having while the session is there to pick one
+            fork.run_log = None
+            fork.add_message(our_question, list(question.file_ids))
+            return fork
+
+        with ThreadPoolExecutor(max_workers=count, thread_name_prefix="gptcli-fork") as executor:
+            return list(executor.map(create_fork, range(count)))
+
+    def branch(self, turns: List[Message]) -> "AssistantThread":
+        """
+        A copy of this assistant on a new thread that continues the conversation after `turns`.
+        Threads can only be seeded with user messages, so the turns are quoted in as few
+        messages as the size limit allows, all sent with the request that creates the thread.
+        """
+        seed = format_seed_message(None, turns) if turns else None
+        with span("branch.threads.create"):
+            branch = self._copy_on(self._create_seeded_thread(seed))
+        branch._reset_history(turns[:], seed)
+        return branch
+
+    def reopen(self, thread_id: str) -> "AssistantThread":
+        """
+        A copy of this assistant continuing the existing thread `thread_id`, like a branch forked
+        in an earlier session. Its messages are in `history`.
+        """
+        with span("reopen.threads.retrieve"):
+            branch = self._copy_on(self.openai_client.beta.threads.retrieve(thread_id))
+        messages = branch._list_messages(thread_id)
+        messages.reverse()
+        history: List[Message] = [
+            {"role": message.role, "content": "".join(thread_message_to_text([message])).rstrip("\n")}
+            for message in map(ThreadMessage.from_sdk, messages)
+        ]
+        branch._reset_history(history)
+        # The rollover policy counts what the thread already holds
+        branch.thread_message_count = len(history)
+        branch.thread_token_count = sum(branch._count_tokens(message["content"]) for message in history)
+        return branch
+
+    def _copy_on(self, thread) -> "AssistantThread":
+        """
+        A copy of this assistant, with its settings and client, on `thread`.
+        """
+        branch = copy.copy(self)
+        branch.rollover_callbacks = []
+        branch.thread = thread
+        branch.last_user_message_id = None
+        branch.last_run_id = None
+        branch.last_response_message_ids = []
+        branch.generated_files = []
+        branch._logged_run = None
+        branch.resumed_run = None
+        return branch
+
+    def _create_seeded_thread(self, seed: Optional[str]):
+        """
+        Create a thread starting with `seed`, in as few messages as the size limit allows.
+        """
+        chunks = split_message(seed) if seed else []
+        thread = self.openai_client.beta.threads.create(
+            messages=[{"role": "user", "content": chunk} for chunk in chunks[:MAX_SEED_MESSAGES]]
+        )
+        # Messages are ordered by creation, so the rest have to be sent one after the other
+        for chunk in chunks[MAX_SEED_MESSAGES:]:
+            with span("seed.messages.create"):
+                self.openai_client.beta.threads.messages.create(thread.id, role="user", content=chunk)
+        return thread
+
+    def adopt(self, fork: "AssistantThread"):
+        """
+        Continue the conversation on a thread returned by `fork`.
+        """
+        self.thread = fork.thread
+        self.last_user_message_id = fork.last_user_message_id
+        self.last_run_id = fork.last_run_id
+        self.last_response_message_ids = fork.last_response_message_ids
+        self.history = fork.history
+        self.thread_message_count = fork.thread_message_count
+        self.thread_token_count = fork.thread_token_count
+        self._pending_rollover = fork._pending_rollover
+
+    def delete_thread(self):
+        with span("threads.delete", self.thread.id):
+            self.openai_client.beta.threads.delete(self.thread.id)
+
+    def retrieve_file(self, file_id: str):
+        with span("files.retrieve", file_id):
+            return self.openai_client.files.retrieve(file_id)
 
     def get_thread_id(self):
         return self.thread.id
@@ -145,13 +570,15 @@ class AssistantGlobalArgs:
     assistant_name: str
 
 def init_assistant(
-    args: AssistantGlobalArgs, custom_assistants: Dict[str, AssistantConfig]
+    args: AssistantGlobalArgs,
+    custom_assistants: Dict[str, AssistantConfig],
+    openai_client: Optional[OpenAI] = None,
 ) -> AssistantThread:
     name = args.assistant_name
     if name in custom_assistants:
-        assistant = AssistantThread.from_config(name, custom_assistants[name])
+        assistant = AssistantThread.from_config(name, custom_assistants[name], openai_client)
     elif name in DEFAULT_ASSISTANTS:
-        assistant = AssistantThread.from_config(name, DEFAULT_ASSISTANTS[name])
+        assistant = AssistantThread.from_config(name, DEFAULT_ASSISTANTS[name], openai_client)
     else:
         print(f"Unknown assistant: {name}")
         sys.exit(1)
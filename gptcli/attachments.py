@@ -0,0 +1,197 @@
+"""
+Upload local files so they can be attached to messages.
+
+Files are streamed from disk in chunks while they upload, several at a time. Uploaded files are
+remembered by the SHA-256 of their content, so attaching an unchanged file again reuses its
+file id instead of uploading it again.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from openai import OpenAI
+
+from gptcli.config import DEFAULT_UPLOAD_CACHE_PATH
+from gptcli import metrics
+from gptcli.trace import span
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Called with (path, bytes sent, total bytes) as an upload progresses.
+ProgressCallback = Callable[[str, int, int], None]
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadResult(NamedTuple):
+    path: str
+    file_id: str
+    size: int
+    cached: bool
+    seconds: float
+
+    @property
+    def bytes_per_second(self) -> Optional[float]:
+        if self.cached or not self.seconds:
+            return None
+        return self.size / self.seconds
+
+
+class UploadCache:
+    """
+    A JSON file mapping `<purpose>:<sha256>` to the id of the uploaded file.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_UPLOAD_CACHE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, str]] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    @staticmethod
+    def key(purpose: str, sha256: str) -> str:
+        return f"{purpose}:{sha256}"
+
+    def get(self, purpose: str, sha256: str) -> Optional[str]:
+        with self.lock:
+            entry = self.entries.get(self.key(purpose, sha256))
+        metrics.cache_lookup("uploads", entry is not None)
+        return entry["file_id"] if entry else None
+
+    def put(self, purpose: str, sha256: str, file_id: str, filename: str):
+        with self.lock:
+            self.entries[self.key(purpose, sha256)] = {"file_id": file_id, "filename": filename}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self.lock:
+            data = json.dumps(self.entries, indent=1)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+class ProgressReader:
+    """
+    Wraps a binary file and reports how much of it has been read.
+
+    httpx streams multipart file fields by reading them in chunks, so the upload never holds the
+    whole file in memory and the reads track the bytes sent.
+    """
+
+    def __init__(self, file, path: str, total: int, progress: Optional[ProgressCallback]):
+        self.file = file
+        self.path = path
+        self.total = total
+        self.progress = progress
+
+    def fileno(self) -> int:
+        return self.file.fileno()
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.file.tell()
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.file.read(size)
+        if self.progress is not None:
+            self.progress(self.path, self.file.tell(), self.total)
+        return chunk
+
+
+class Uploader:
+    def __init__(
+        self,
+        openai_client: OpenAI,
+        cache: Optional[UploadCache] = None,
+        max_workers: int = 4,
+        purpose: str = "assistants",
+    ):
+        self.openai_client = openai_client
+        self.cache = cache or UploadCache(None)
+        self.max_workers = max_workers
+        self.purpose = purpose
+
+    def _upload_one(self, path: str, sha256: str, progress: Optional[ProgressCallback]) -> UploadResult:
+        size = os.path.getsize(path)
+        started = time.perf_counter()
+        with span("files.create", path), open(path, "rb") as f:
+            uploaded = self.openai_client.files.create(
+                file=(os.path.basename(path), ProgressReader(f, path, size, progress)),
+                purpose=self.purpose,
+            )
+        self.cache.put(self.purpose, sha256, uploaded.id, os.path.basename(path))
+        return UploadResult(path, uploaded.id, size, False, time.perf_counter() - started)
+
+    def upload(self, paths: List[str], progress: Optional[ProgressCallback] = None) -> List[UploadResult]:
+        """
+        Upload `paths` and return their results in the same order.
+
+        Files whose content was uploaded before, or appears twice in `paths`, are uploaded once.
+        """
+        paths = [os.path.expanduser(path) for path in paths]
+        for path in paths:
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"No such file: {path}")
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="gptcli-upload"
+        ) as executor:
+            hashes = list(executor.map(file_sha256, paths))
+            results: Dict[str, UploadResult] = {}
+            pending = {}
+            for path, sha256 in zip(paths, hashes):
+                if sha256 in results or sha256 in pending:
+                    continue
+                file_id = self.cache.get(self.purpose, sha256)
+                if file_id is not None:
+                    results[sha256] = UploadResult(path, file_id, os.path.getsize(path), True, 0.0)
+                    if progress is not None:
+                        progress(path, results[sha256].size, results[sha256].size)
+                else:
+                    pending[sha256] = executor.submit(self._upload_one, path, sha256, progress)
+            try:
+                for sha256, future in pending.items():
+                    results[sha256] = future.result()
+            finally:
+                # Keep whatever did upload, even if another file failed.
+                self.cache.save()
+
+        ordered = []
+        for path, sha256 in zip(paths, hashes):
+            result = results[sha256]
+            if result.path != path:
+                # The same content under another name was uploaded once
+                result = result._replace(path=path, cached=True, seconds=0.0)
+            ordered.append(result)
+        return ordered
+
+
+def format_upload_results(results: List[UploadResult]) -> str:
+    lines = ["Attached to your next message:", ""]
+    for result in results:
+        size = f"{result.size / 1024:.1f} KiB"
+        if result.bytes_per_second is None:
+            detail = f"{size}, already uploaded"
+        else:
+            detail = f"{size}, {result.bytes_per_second / 1024 / 1024:.2f} MiB/s"
+        lines.append(f"- `{os.path.basename(result.path)}` - `{result.file_id}` ({detail})")
+    return "\n".join(lines) + "\n"
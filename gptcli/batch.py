@@ -0,0 +1,437 @@
+"""
+Run large prompt sets through an assistant with workers on several machines.
+
+A batch lives in a directory that every worker can reach through a shared filesystem, no other
+service is needed:
+
+    batch.json                  the assistant and the number of items in every shard
+    items/<shard>.jsonl         the prompts, `{"id": ..., "prompt": ...}` per line
+    leases/<shard>.<generation> who is working on a shard, and until when
+    results/<shard>.jsonl       the answers of a finished shard
+    results/<shard>.part-<gen>  answers written so far by the holder of lease generation <gen>
+
+Workers claim a shard by writing its next lease generation to a temporary file and hard-linking
+it into place, which fails if the generation exists, so only one of them can win and a lease is
+never seen half written. A lease is renewed while its shard is worked on. Once it expires, because its
+worker died or hung, any worker can claim the next generation and picks up where the answers in
+the earlier `.part-` files stop. Results are only ever replaced as a whole with `os.replace`, so
+a shard that is finished twice is still written once and readers never see half a file.
+
+Lease expiry compares wall clocks across machines, so clocks must agree to well within the
+lease duration.
+"""
+
+import json
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from gptcli.assistant import AssistantThread, thread_message_to_text
+
+BATCH_FILE = "batch.json"
+DEFAULT_SHARD_SIZE = 100
+DEFAULT_LEASE_SECONDS = 300.0
+
+
+def _write_json_atomic(path: str, data: Any):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_prompts(path: str) -> Iterable[Dict[str, Any]]:
+    """
+    Read prompts from a `.jsonl` file of `{"prompt": ..., "id": ...}` objects (`id` is optional)
+    or from a text file with one prompt per line.
+    """
+    with open(path) as f:
+        for index, line in enumerate(f):
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                yield {"id": str(item.get("id", index)), "prompt": item["prompt"]}
+            else:
+                yield {"id": str(index), "prompt": line}
+
+
+class Lease(NamedTuple):
+    shard: str
+    generation: int
+    worker: str
+    expires_at: float
+
+
+class BatchStatus(NamedTuple):
+    shards: int
+    items: int
+    done_shards: int
+    done_items: int
+    errors: int
+    # (shard, worker, seconds left) for every live lease
+    leases: List[Tuple[str, str, float]]
+    expired_leases: int
+
+
+class BatchDirectory:
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        with open(os.path.join(path, BATCH_FILE)) as f:
+            self.meta = json.load(f)
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        assistant: str,
+        items: Iterable[Dict[str, Any]],
+        shard_size: int = DEFAULT_SHARD_SIZE,
+    ) -> "BatchDirectory":
+        if os.path.exists(os.path.join(path, BATCH_FILE)):
+            raise ValueError(f"{path} already contains a batch")
+        for name in ("items", "leases", "results"):
+            os.makedirs(os.path.join(path, name), exist_ok=True)
+
+        shards: Dict[str, int] = {}
+        shard: List[Dict[str, Any]] = []
+
+        def write_shard():
+            shard_id = f"{len(shards):06d}"
+            with open(os.path.join(path, "items", f"{shard_id}.jsonl"), "w") as f:
+                for item in shard:
+                    f.write(json.dumps(item) + "\n")
+            shards[shard_id] = len(shard)
+
+        for item in items:
+            shard.append(item)
+            if len(shard) == shard_size:
+                write_shard()
+                shard = []
+        if shard:
+            write_shard()
+
+        # batch.json is written last, a directory without it is not a batch yet.
+        _write_json_atomic(
+            os.path.join(path, BATCH_FILE),
+            {"assistant": assistant, "created_at": time.time(), "shards": shards},
+        )
+        return cls(path)
+
+    @property
+    def assistant(self) -> str:
+        return self.meta["assistant"]
+
+    @property
+    def shards(self) -> Dict[str, int]:
+        return self.meta["shards"]
+
+    def items(self, shard: str) -> List[Dict[str, Any]]:
+        with open(os.path.join(self.path, "items", f"{shard}.jsonl")) as f:
+            return [json.loads(line) for line in f]
+
+    def result_path(self, shard: str) -> str:
+        return os.path.join(self.path, "results", f"{shard}.jsonl")
+
+    def part_path(self, shard: str, generation: int) -> str:
+        return os.path.join(self.path, "results", f"{shard}.part-{generation}")
+
+    def lease_path(self, shard: str, generation: int) -> str:
+        return os.path.join(self.path, "leases", f"{shard}.{generation}")
+
+    def is_done(self, shard: str) -> bool:
+        return os.path.exists(self.result_path(shard))
+
+    def _generations(self, shard: str) -> List[int]:
+        generations = []
+        for name in os.listdir(os.path.join(self.path, "leases")):
+            prefix, _, generation = name.rpartition(".")
+            if prefix == shard and generation.isdigit():
+                generations.append(int(generation))
+        return sorted(generations)
+
+    def current_lease(self, shard: str) -> Optional[Lease]:
+        generations = self._generations(shard)
+        if not generations:
+            return None
+        generation = generations[-1]
+        try:
+            with open(self.lease_path(shard, generation)) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            # Released right now, treat it as live until the next look.
+            return Lease(shard, generation, "", float("inf"))
+        except (OSError, ValueError, KeyError):
+            # Left unreadable by a crashed worker (or an older version that wrote leases in place):
+            # it lasts as long as a default lease from when it was last written.
+            try:
+                written_at = os.path.getmtime(self.lease_path(shard, generation))
+            except FileNotFoundError:
+                return Lease(shard, generation, "", float("inf"))
+            return Lease(shard, generation, "", written_at + DEFAULT_LEASE_SECONDS)
+        return Lease(shard, generation, data["worker"], data["expires_at"])
+
+    def acquire(self, shard: str, worker: str, lease_seconds: float) -> Optional[Lease]:
+        """
+        Claim `shard` for `worker` unless it is finished or someone else holds a live lease on it.
+        """
+        if self.is_done(shard):
+            return None
+        current = self.current_lease(shard)
+        if current is not None and current.expires_at > self.clock():
+            return None
+        generation = current.generation + 1 if current is not None else 0
+        lease = Lease(shard, generation, worker, self.clock() + lease_seconds)
+        path = self.lease_path(shard, generation)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"worker": worker, "expires_at": lease.expires_at, "acquired_at": self.clock()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.link(tmp_path, path)
+        except FileExistsError:
+            # Another worker claimed this generation first
+            return None
+        finally:
+            os.unlink(tmp_path)
+        if self.is_done(shard):
+            # Finished between our first check and the claim
+            self.release(lease)
+            return None
+        return lease
+
+    def renew(self, lease: Lease, lease_seconds: float) -> Optional[Lease]:
+        """
+        Extend `lease`, or return None if it has been taken over.
+        """
+        current = self.current_lease(lease.shard)
+        if current is None or current.generation != lease.generation:
+            return None
+        renewed = lease._replace(expires_at=self.clock() + lease_seconds)
+        _write_json_atomic(
+            self.lease_path(lease.shard, lease.generation),
+            {"worker": lease.worker, "expires_at": renewed.expires_at},
+        )
+        return renewed
+
+    def release(self, lease: Lease):
+        for generation in self._generations(lease.shard):
+            if generation <= lease.generation:
+                try:
+                    os.unlink(self.lease_path(lease.shard, generation))
+                except FileNotFoundError:
+                    pass
+
+    def partial_results(self, shard: str) -> Dict[str, Dict[str, Any]]:
+        """
+        Answers written by earlier holders of `shard` that didn't finish it.
+        """
+        results: Dict[str, Dict[str, Any]] = {}
+        prefix = f"{shard}.part-"
+        for name in os.listdir(os.path.join(self.path, "results")):
+            if not name.startswith(prefix):
+                continue
+            with open(os.path.join(self.path, "results", name)) as f:
+                for line in f:
+                    try:
+                        result = json.loads(line)
+                    except json.JSONDecodeError:
+                        # The last line of a worker that died mid-write
+                        continue
+                    if "error" not in result:
+                        results[result["id"]] = result
+        return results
+
+    def finish(self, lease: Lease, results: List[Dict[str, Any]]):
+        path = self.result_path(lease.shard)
+        tmp_path = f"{path}.{lease.generation}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w") as f:
+            for result in results:
+                f.write(json.dumps(result) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        for name in os.listdir(os.path.join(self.path, "results")):
+            if name.startswith(f"{lease.shard}.part-"):
+                os.unlink(os.path.join(self.path, "results", name))
+        self.release(lease)
+
+    def status(self) -> BatchStatus:
+        now = self.clock()
+        done_shards = done_items = errors = expired = 0
+        leases = []
+        for shard, count in self.shards.items():
+            if self.is_done(shard):
+                done_shards += 1
+                with open(self.result_path(shard)) as f:
+                    for line in f:
+                        done_items += 1
+                        errors += "error" in json.loads(line)
+                continue
+            done_items += len(self.partial_results(shard))
+            lease = self.current_lease(shard)
+            if lease is None:
+                continue
+            if lease.expires_at > now:
+                leases.append((shard, lease.worker, lease.expires_at - now))
+            else:
+                expired += 1
+        return BatchStatus(
+            shards=len(self.shards),
+            items=sum(self.shards.values()),
+            done_shards=done_shards,
+            done_items=done_items,
+            errors=errors,
+            leases=leases,
+            expired_leases=expired,
+        )
+
+
+def run_prompt(assistant: AssistantThread, prompt: str) -> str:
+    """
+    Answer `prompt` in a new thread of `assistant`.
+    """
+    assistant.init_messages()
+    assistant.add_message({"role": "user", "content": prompt})
+    assistant.run_thread()
+    messages = assistant.fetch_messages(since_last_user_message=True)
+    return "".join(thread_message_to_text(messages)).strip()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class BatchWorker:
+    def __init__(
+        self,
+        directory: BatchDirectory,
+        assistant_factory: Callable[[], AssistantThread],
+        worker_id: Optional[str] = None,
+        concurrency: int = 4,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+        idle_wait: float = 5.0,
+        on_progress: Optional[Callable[[str, int, int], None]] = None,
+    ):
+        self.directory = directory
+        self.assistant_factory = assistant_factory
+        self.worker_id = worker_id or default_worker_id()
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.idle_wait = idle_wait
+        self.on_progress = on_progress
+        self.local = threading.local()
+        self.stopped = threading.Event()
+
+    def _assistant(self) -> AssistantThread:
+        if not hasattr(self.local, "assistant"):
+            self.local.assistant = self.assistant_factory()
+        return self.local.assistant
+
+    def _answer(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.time()
+        try:
+            response = run_prompt(self._assistant(), item["prompt"])
+        except Exception as e:
+            return {"id": item["id"], "error": f"{type(e).__name__}: {e}", "worker": self.worker_id}
+        return {
+            "id": item["id"],
+            "response": response,
+            "thread_id": self._assistant().get_thread_id(),
+            "seconds": round(time.time() - started, 3),
+            "worker": self.worker_id,
+        }
+
+    def _keep_leased(self, lease: Lease, done: threading.Event, lost: threading.Event):
+        while not done.wait(self.lease_seconds / 3):
+            renewed = self.directory.renew(lease, self.lease_seconds)
+            if renewed is None or self.directory.is_done(lease.shard):
+                lost.set()
+                return
+            lease = renewed
+
+    def process(self, lease: Lease) -> bool:
+        """
+        Answer every prompt of the leased shard and return whether its results were written.
+        """
+        items = self.directory.items(lease.shard)
+        earlier = self.directory.partial_results(lease.shard)
+        todo = [item for item in items if item["id"] not in earlier]
+        results = dict(earlier)
+
+        done, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(
+            target=self._keep_leased, args=(lease, done, lost), daemon=True
+        )
+        heartbeat.start()
+        try:
+            with open(self.directory.part_path(lease.shard, lease.generation), "a") as part, \
+                    ThreadPoolExecutor(self.concurrency, thread_name_prefix="gptcli-batch") as executor:
+                for result in executor.map(self._answer, todo):
+                    part.write(json.dumps(result) + "\n")
+                    part.flush()
+                    results[result["id"]] = result
+                    if self.on_progress is not None:
+                        self.on_progress(lease.shard, len(results), len(items))
+                    if lost.is_set() or self.stopped.is_set():
+                        executor.shutdown(wait=False, cancel_futures=True)
+                        return False
+        finally:
+            done.set()
+            heartbeat.join()
+
+        if lost.is_set():
+            return False
+        self.directory.finish(lease, [results[item["id"]] for item in items])
+        return True
+
+    def run(self) -> int:
+        """
+        Work on shards until every shard has results. Returns how many shards this worker finished.
+        """
+        finished = 0
+        shards = list(self.directory.shards)
+        # Start at a random shard so workers that start together don't all race for the first one.
+        offset = random.randrange(len(shards)) if shards else 0
+        shards = shards[offset:] + shards[:offset]
+        while not self.stopped.is_set():
+            pending = [shard for shard in shards if not self.directory.is_done(shard)]
+            if not pending:
+                return finished
+            claimed = False
+            for shard in pending:
+                if self.stopped.is_set():
+                    break
+                lease = self.directory.acquire(shard, self.worker_id, self.lease_seconds)
+                if lease is None:
+                    continue
+                claimed = True
+                finished += self.process(lease)
+            if not claimed:
+                # Everything left is leased by someone else, wait for it to finish or expire.
+                self.stopped.wait(self.idle_wait)
+        return finished
+
+    def stop(self):
+        self.stopped.set()
+
+
+def format_batch_status(status: BatchStatus) -> str:
+    percent = 100 * status.done_items / status.items if status.items else 100.0
+    lines = [
+        f"Items: {status.done_items}/{status.items} ({percent:.1f}%), {status.errors} errors",
+        f"Shards: {status.done_shards}/{status.shards} done, {len(status.leases)} leased, {status.expired_leases} with expired leases",
+    ]
+    for shard, worker, seconds_left in sorted(status.leases):
+        lines.append(f"  shard {shard}: {worker} (lease expires in {seconds_left:.0f}s)")
+    return "\n".join(lines)
@@ -0,0 +1,88 @@
+"""
+Remembers which threads were forked from which, and after how many turns.
+
+Thread ids are all the API knows about a conversation, so without this a branch can't be traced
+back to the conversation it came from once the session that forked it has ended.
+
+Several CLIs may fork at the same time, so the file is read again and merged before each save
+rather than overwritten with what this process knows.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from gptcli.config import DEFAULT_BRANCH_STORE_PATH
+
+
+logger = logging.getLogger("gptcli-branches")
+
+
+class Branch(NamedTuple):
+    thread_id: str
+    parent_thread_id: str
+    assistant_id: str
+    # How many turns of the parent the branch starts from
+    turns: int
+    created_at: float
+
+
+class BranchStore:
+    """
+    A JSON file listing the branches forked so far.
+    """
+
+    def __init__(self, path: Optional[str] = DEFAULT_BRANCH_STORE_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.branches: List[Branch] = self._load()
+
+    def _load(self) -> List[Branch]:
+        if not self.path or not os.path.exists(self.path):
+            return []
+        try:
+            with open(self.path) as f:
+                return [Branch(**entry) for entry in json.load(f)]
+        except (OSError, ValueError, TypeError) as e:
+            logger.warning("Ignoring the unreadable branch store %s: %s", self.path, e)
+            return []
+
+    def refresh(self):
+        """
+        Add the branches other processes have saved since this store was loaded.
+        """
+        saved = self._load()
+        with self.lock:
+            merged: Dict[str, Branch] = {branch.thread_id: branch for branch in saved}
+            merged.update((branch.thread_id, branch) for branch in self.branches)
+            self.branches = sorted(merged.values(), key=lambda branch: branch.created_at)
+
+    def add(self, thread_id: str, parent_thread_id: str, assistant_id: str, turns: int) -> Branch:
+        branch = Branch(thread_id, parent_thread_id, assistant_id, turns, time.time())
+        with self.lock:
+            self.branches.append(branch)
+        self.save()
+        return branch
+
+    def parent_of(self, thread_id: str) -> Optional[Branch]:
+        with self.lock:
+            return next((branch for branch in self.branches if branch.thread_id == thread_id), None)
+
+    def children_of(self, thread_id: str) -> List[Branch]:
+        with self.lock:
+            return [branch for branch in self.branches if branch.parent_thread_id == thread_id]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.refresh()
+        with self.lock:
+            data = json.dumps([branch._asdict() for branch in self.branches], indent=1)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,180 @@
+"""
+Record the HTTP traffic of a session to a cassette and replay it later without the network.
+
+A cassette is a gzipped JSON-lines file with one interaction (request line, response status,
+headers, body and how long it took) per line. It is flushed after every interaction, so the
+cassette of a session that crashed or hung is still readable. Request headers are not recorded,
+so cassettes never contain API keys.
+
+Replaying serves the recorded responses in order for each method and URL, which reproduces
+polling sequences exactly. `time_scale` stretches or compresses the recorded response times:
+1.0 replays in real time, 0 as fast as possible.
+"""
+
+import base64
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import httpx
+from openai import OpenAI
+
+from gptcli.metrics import MetricsTransport
+
+CASSETTE_FILENAME = "cassette.jsonl.gz"
+# httpx has already decoded and de-chunked the body we record
+DROPPED_RESPONSE_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CassetteMismatchError(Exception):
+    pass
+
+
+def cassette_path(directory: str) -> str:
+    return os.path.join(os.path.expanduser(directory), CASSETTE_FILENAME)
+
+
+def _request_key(method: str, url: httpx.URL) -> Tuple[str, str]:
+    path = url.raw_path.decode("ascii")
+    return method, path
+
+
+def _encode_body(data: bytes) -> Dict[str, str]:
+    try:
+        return {"text": data.decode("utf-8")}
+    except UnicodeDecodeError:
+        return {"base64": base64.b64encode(data).decode("ascii")}
+
+
+def _decode_body(body: Dict[str, str]) -> bytes:
+    if "base64" in body:
+        return base64.b64decode(body["base64"])
+    return body["text"].encode("utf-8")
+
+
+class RecordingTransport(httpx.BaseTransport):
+    def __init__(self, path: str, transport: Optional[httpx.BaseTransport] = None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.transport = transport or httpx.HTTPTransport()
+        self.file = gzip.open(path, "wt", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        sent_at = time.monotonic()
+        response = self.transport.handle_request(request)
+        try:
+            content = response.read()
+        finally:
+            response.close()
+        elapsed = time.monotonic() - sent_at
+
+        method, path = _request_key(request.method, request.url)
+        content_type = request.headers.get("content-type", "")
+        interaction: Dict[str, Any] = {
+            "at": round(sent_at - self.started, 4),
+            "elapsed": round(elapsed, 4),
+            "method": method,
+            "path": path,
+            "status": response.status_code,
+            "headers": [
+                [key, value]
+                for key, value in response.headers.items()
+                if key.lower() not in DROPPED_RESPONSE_HEADERS
+            ],
+            "body": _encode_body(content),
+        }
+        if content_type.startswith("application/json"):
+            # Kept to make cassettes easier to read and diff, replay doesn't match on it
+            interaction["request"] = request.content.decode("utf-8")
+
+        with self.lock:
+            self.file.write(json.dumps(interaction) + "\n")
+            self.file.flush()
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=interaction["headers"],
+            content=content,
+            request=request,
+        )
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+        self.transport.close()
+
+
+def read_cassette(path: str) -> List[Dict[str, Any]]:
+    interactions = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                interactions.append(json.loads(line))
+        except (EOFError, json.JSONDecodeError):
+            # The recording session died mid-write, keep everything before it
+            pass
+    return interactions
+
+
+class ReplayTransport(httpx.BaseTransport):
+    def __init__(self, path: str, time_scale: float = 0.0, sleep=time.sleep):
+        self.time_scale = time_scale
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.queues: Dict[Tuple[str, str], Deque[Dict[str, Any]]] = defaultdict(deque)
+        for interaction in read_cassette(path):
+            self.queues[interaction["method"], interaction["path"]].append(interaction)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        key = _request_key(request.method, request.url)
+        with self.lock:
+            queue = self.queues.get(key)
+            if not queue:
+                raise CassetteMismatchError(f"No recorded response left for {key[0]} {key[1]}")
+            interaction = queue.popleft()
+        if self.time_scale:
+            self.sleep(interaction["elapsed"] * self.time_scale)
+        return httpx.Response(
+            status_code=interaction["status"],
+            headers=interaction["headers"],
+            content=_decode_body(interaction["body"]),
+            request=request,
+        )
+
+    def remaining(self) -> int:
+        with self.lock:
+            return sum(len(queue) for queue in self.queues.values())
+
+
+def make_openai_client(
+    record: Optional[str] = None,
+    replay: Optional[str] = None,
+    time_scale: float = 0.0,
+    measure: bool = False,
+) -> Optional[OpenAI]:
+    """
+    Return an OpenAI client that records to or replays from the cassette in the given
+    directory, and whose requests are counted in the metrics if `measure` is set. Returns
+    None when none of these is requested.
+    """
+    if record and replay:
+        raise ValueError("Cannot record and replay at the same time")
+    transport: Optional[httpx.BaseTransport] = None
+    if record:
+        transport = RecordingTransport(cassette_path(record))
+    elif replay:
+        transport = ReplayTransport(cassette_path(replay), time_scale)
+    if measure:
+        transport = MetricsTransport(transport)
+    if transport is None:
+        return None
+    return OpenAI(
+        # Nothing leaves the machine on replay, but the client still insists on a key.
+        api_key=os.environ.get("OPENAI_API_KEY") or ("replay" if replay else None),
+        http_client=httpx.Client(transport=transport),
+    )
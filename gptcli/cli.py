@@ -1,22 +1,40 @@
+import os
 import re
-from prompt_toolkit import PromptSession
+import threading
+from prompt_toolkit import PromptSession, print_formatted_text
+from prompt_toolkit.application import run_in_terminal
+from prompt_toolkit.formatted_text import FormattedText
 from prompt_toolkit.history import FileHistory
 from prompt_toolkit.key_binding import KeyBindings, KeyPressEvent
 from prompt_toolkit.key_binding.bindings import named_commands
+from rich.columns import Columns
 from rich.console import Console
 from rich.live import Live
 from rich.markdown import Markdown
+from rich.panel import Panel
+from rich.progress import (
+    BarColumn,
+    DownloadColumn,
+    Progress,
+    TaskID,
+    TextColumn,
+    TransferSpeedColumn,
+)
 from typing import Any, Dict, Optional, Tuple
 
 from rich.text import Text
+from gptcli.trace import span
+from gptcli.types import Message
 from gptcli.session import (
     ALL_COMMANDS,
     COMMAND_CLEAR,
     COMMAND_QUIT,
     COMMAND_RERUN,
     ChatListener,
+    CoalescePolicy,
     InvalidArgumentError,
     ResponseStreamer,
+    UploadProgress,
     UserInputProvider,
 )
 
@@ -49,9 +67,10 @@ class StreamingMarkdownPrinter:
         self.current_text += text
         if self.markdown:
             assert self.live
-            content = Markdown(self.current_text, style="green")
-            self.live.update(content)
-            self.live.refresh()
+            with span("markdown.render"):
+                content = Markdown(self.current_text, style="green")
+                self.live.update(content)
+                self.live.refresh()
         else:
             self.console.print(Text(text, style="green"), end="")
 
@@ -83,12 +102,85 @@ class CLIResponseStreamer(ResponseStreamer):
         self.printer.__exit__(*args)
 
 
+class CLIUploadProgress(UploadProgress):
+    def __init__(self, console: Console):
+        self.progress = Progress(
+            TextColumn("{task.description}"),
+            BarColumn(),
+            DownloadColumn(),
+            TransferSpeedColumn(),
+            console=console,
+            transient=True,
+        )
+        self.tasks: Dict[str, TaskID] = {}
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.progress.__enter__()
+        return self
+
+    def on_progress(self, path: str, sent: int, total: int):
+        # Uploads report from several threads at once
+        with self.lock:
+            if path not in self.tasks:
+                self.tasks[path] = self.progress.add_task(os.path.basename(path), total=total)
+        self.progress.update(self.tasks[path], completed=sent)
+
+    def __exit__(self, *args):
+        self.progress.__exit__(*args)
+
+
+class CandidateColumns:
+    """
+    Alternative answers of `:rerun <k>` side by side, filled in as they arrive.
+    """
+
+    def __init__(self, console: Console, count: int, markdown: bool):
+        self.console = console
+        self.markdown = markdown
+        self.answers: Dict[int, Optional[Message]] = {}
+        self.count = count
+        self.live = Live(self._render(), console=console, auto_refresh=False)
+        self.live.__enter__()
+
+    def _render(self) -> Columns:
+        width = max(20, self.console.width // self.count - 1)
+        panels = []
+        for index in range(self.count):
+            message = self.answers.get(index)
+            if message is not None:
+                body: Any = Markdown(message["content"]) if self.markdown else Text(message["content"])
+            else:
+                body = Text("failed" if index in self.answers else "…", style="dim")
+            panels.append(Panel(body, title=f"[bold]{index + 1}[/bold]", width=width))
+        return Columns(panels)
+
+    def add(self, index: int, message: Optional[Message]) -> bool:
+        """
+        Show one answer and return whether all of them arrived.
+        """
+        self.answers[index] = message
+        self.live.update(self._render(), refresh=True)
+        if len(self.answers) == self.count:
+            self.live.__exit__(None, None, None)
+            return True
+        return False
+
+
 class CLIChatListener(ChatListener):
-    def __init__(self, markdown: bool):
+    # Re-rendering markdown is expensive, so refresh the terminal at most ~30 times per second.
+    coalesce_policy = CoalescePolicy(interval=1 / 30)
+
+    def __init__(self, markdown: bool, welcome: bool = True):
         self.markdown = markdown
+        # Threads opened with `:new` don't repeat the welcome message
+        self.welcome = welcome
         self.console = Console()
+        self.candidates: Optional[CandidateColumns] = None
 
     def on_chat_start(self):
+        if not self.welcome:
+            return
         console = Console(width=80)
         console.print(Markdown(TERMINAL_WELCOME))
 
@@ -101,6 +193,17 @@ class CLIChatListener(ChatListener):
         else:
             self.console.print("[bold]Nothing to re-run.[/bold]")
 
+    def on_rerun_candidate(self, index: int, count: int, message: Optional[Message]):
+        if self.candidates is None:
+            self.candidates = CandidateColumns(self.console, count, self.markdown)
+        if self.candidates.add(index, message):
+            self.candidates = None
+
+    def on_thread_rollover(self, old_thread_id: str, new_thread_id: str, summary: str):
+        self.console.print(
+            f"[dim]The conversation was summarized and continues in a new thread ({new_thread_id}).[/dim]"
+        )
+
     def on_error(self, e: Exception):
         if isinstance(e, InvalidArgumentError):
             self.console.print(f"[red]{e.message}[/red]")
@@ -110,6 +213,9 @@ class CLIChatListener(ChatListener):
     def response_streamer(self) -> ResponseStreamer:
         return CLIResponseStreamer(self.console, self.markdown)
 
+    def upload_progress(self) -> UploadProgress:
+        return CLIUploadProgress(self.console)
+
 
 def parse_args(input: str) -> Tuple[str, Dict[str, Any]]:
     args = {}
@@ -130,10 +236,15 @@ class CLIFileHistory(FileHistory):
 
 
 class CLIUserInputProvider(UserInputProvider):
-    def __init__(self, history_filename) -> None:
+    def __init__(self, history_filename, estimator=None) -> None:
         self.prompt_session = PromptSession[str](
             history=CLIFileHistory(history_filename)
         )
+        # Shows the size of the draft in the bottom toolbar, see gptcli.cost.DraftEstimator
+        self.estimator = estimator
+        if estimator is not None:
+            self.prompt_session.default_buffer.on_text_changed += lambda buffer: estimator.update(buffer.text)
+            estimator.on_update = self.prompt_session.app.invalidate
 
     def get_user_input(self) -> Tuple[str, Dict[str, Any]]:
         while (next_user_input := self._request_input()) == "":
@@ -142,6 +253,15 @@ class CLIUserInputProvider(UserInputProvider):
         user_input, args = self._parse_input(next_user_input)
         return user_input, args
 
+    def notify(self, message: str):
+        text = FormattedText([("bold", message)])
+        app = self.prompt_session.app
+        if app.is_running:
+            # Print above the prompt without disturbing what is being typed
+            app.loop.call_soon_threadsafe(run_in_terminal, lambda: print_formatted_text(text))
+        else:
+            print_formatted_text(text)
+
     def prompt(self, multiline=False):
         bindings = KeyBindings()
 
@@ -173,6 +293,9 @@ class CLIUserInputProvider(UserInputProvider):
                 event.current_buffer.text = COMMAND_RERUN[0]
                 event.current_buffer.validate_and_handle()
 
+        if self.estimator is not None:
+            # The thread may have changed since the last prompt
+            self.estimator.update("")
         try:
             return self.prompt_session.prompt(
                 "> " if not multiline else "multiline> ",
@@ -180,6 +303,7 @@ class CLIUserInputProvider(UserInputProvider):
                 multiline=multiline,
                 enable_open_in_editor=True,
                 key_bindings=bindings,
+                bottom_toolbar=self.estimator.toolbar if self.estimator is not None else None,
             )
         except KeyboardInterrupt:
             return ""
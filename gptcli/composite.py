@@ -1,9 +1,17 @@
 
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from attr import dataclass
 from gptcli.types import Message
-from gptcli.session import ChatListener, ResponseStreamer
+from gptcli.session import ChatListener, CoalescePolicy, ResponseStreamer, UploadProgress
+from gptcli.metrics import unwatch_queue_depth, watch_queue_depth
+from gptcli.trace import span
 
 
-from typing import List
+from typing import Deque, Dict, List, Optional, Tuple
 
 
 class CompositeResponseStreamer(ResponseStreamer):
@@ -17,50 +25,343 @@ class CompositeResponseStreamer(ResponseStreamer):
 
     def on_next_token(self, token: str):
         for streamer in self.streamers:
-            streamer.on_next_token(token)
+            with span("on_next_token", type(streamer).__name__):
+                streamer.on_next_token(token)
 
     def __exit__(self, *args):
         for streamer in self.streamers:
             streamer.__exit__(*args)
 
 
+class CompositeUploadProgress(UploadProgress):
+    def __init__(self, progresses: List[UploadProgress]):
+        self.progresses = progresses
+
+    def __enter__(self):
+        for progress in self.progresses:
+            progress.__enter__()
+        return self
+
+    def on_progress(self, path: str, sent: int, total: int):
+        for progress in self.progresses:
+            progress.on_progress(path, sent, total)
+
+    def __exit__(self, *args):
+        for progress in self.progresses:
+            progress.__exit__(*args)
+
+
+class CoalescingResponseStreamer(ResponseStreamer):
+    """
+    Buffers tokens and forwards them to `streamer` in chunks according to `policy`.
+
+    The buffer is always flushed on `__exit__`, including when the stream is interrupted.
+    """
+
+    def __init__(self, streamer: ResponseStreamer, policy: CoalescePolicy, clock=time.monotonic):
+        self.streamer = streamer
+        self.policy = policy
+        self.clock = clock
+        self.buffer: List[str] = []
+        self.buffered_chars = 0
+        self.last_flush = 0.0
+
+    def __enter__(self):
+        self.streamer.__enter__()
+        self.last_flush = self.clock()
+        return self
+
+    def on_next_token(self, token: str):
+        self.buffer.append(token)
+        self.buffered_chars += len(token)
+        if (
+            self.policy.max_chars and self.buffered_chars >= self.policy.max_chars
+        ) or self.clock() - self.last_flush >= self.policy.interval:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            chunk = "".join(self.buffer)
+            self.buffer = []
+            self.buffered_chars = 0
+            self.streamer.on_next_token(chunk)
+        self.last_flush = self.clock()
+
+    def __exit__(self, *args):
+        try:
+            self.flush()
+        finally:
+            self.streamer.__exit__(*args)
+
+
 class CompositeChatListener(ChatListener):
     def __init__(self, listeners: List[ChatListener]):
         self.listeners = listeners
 
     def on_chat_start(self):
         for listener in self.listeners:
-            listener.on_chat_start()
+            with span("on_chat_start", type(listener).__name__):
+                listener.on_chat_start()
 
     def on_chat_clear(self):
         for listener in self.listeners:
-            listener.on_chat_clear()
+            with span("on_chat_clear", type(listener).__name__):
+                listener.on_chat_clear()
 
     def on_chat_rerun(self, success: bool):
         for listener in self.listeners:
-            listener.on_chat_rerun(success)
+            with span("on_chat_rerun", type(listener).__name__):
+                listener.on_chat_rerun(success)
+
+    def on_rerun_candidate(self, index: int, count: int, message: Optional[Message]):
+        for listener in self.listeners:
+            with span("on_rerun_candidate", type(listener).__name__):
+                listener.on_rerun_candidate(index, count, message)
 
     def on_error(self, e: Exception):
         for listener in self.listeners:
-            listener.on_error(e)
+            with span("on_error", type(listener).__name__):
+                listener.on_error(e)
+
+    def on_thread_rollover(self, old_thread_id: str, new_thread_id: str, summary: str):
+        for listener in self.listeners:
+            with span("on_thread_rollover", type(listener).__name__):
+                listener.on_thread_rollover(old_thread_id, new_thread_id, summary)
 
     def response_streamer(self) -> ResponseStreamer:
-        return CompositeResponseStreamer(
-            [listener.response_streamer() for listener in self.listeners]
+        # Listeners sharing a coalescing policy share one buffer, so a token costs one call per
+        # policy instead of one call per listener.
+        streamers: List[ResponseStreamer] = []
+        groups: Dict[CoalescePolicy, List[ResponseStreamer]] = {}
+        for listener in self.listeners:
+            if listener.coalesce_policy is None:
+                streamers.append(listener.response_streamer())
+            else:
+                groups.setdefault(listener.coalesce_policy, []).append(
+                    listener.response_streamer()
+                )
+        for policy, group in groups.items():
+            streamers.append(
+                CoalescingResponseStreamer(
+                    group[0] if len(group) == 1 else CompositeResponseStreamer(group),
+                    policy,
+                )
+            )
+        return CompositeResponseStreamer(streamers)
+
+    def upload_progress(self) -> UploadProgress:
+        return CompositeUploadProgress(
+            [listener.upload_progress() for listener in self.listeners]
         )
 
     def on_chat_message(self, message: Message):
         for listener in self.listeners:
-            listener.on_chat_message(message)
+            with span("on_chat_message", type(listener).__name__):
+                listener.on_chat_message(message)
 
     def on_chat_response(
         self, messages: List[Message], response: Message
     ):
         for listener in self.listeners:
-            listener.on_chat_response(messages, response)
+            with span("on_chat_response", type(listener).__name__):
+                listener.on_chat_response(messages, response)
     
     def on_chat_end(
         self
     ):
         for listener in self.listeners:
-            listener.on_chat_end()
+            with span("on_chat_end", type(listener).__name__):
+                listener.on_chat_end()
+
+
+BACKPRESSURE_BLOCK = "block"
+BACKPRESSURE_DROP = "drop"
+BACKPRESSURE_COALESCE = "coalesce"
+BACKPRESSURE_POLICIES = (BACKPRESSURE_BLOCK, BACKPRESSURE_DROP, BACKPRESSURE_COALESCE)
+
+_STREAM_ENTER = "stream_enter"
+_STREAM_TOKEN = "stream_token"
+_STREAM_EXIT = "stream_exit"
+# Events that are never dropped, otherwise the listener would see unbalanced calls.
+_LIFECYCLE_EVENTS = ("on_chat_end", "on_rerun_candidate", _STREAM_ENTER, _STREAM_EXIT)
+
+
+@dataclass
+class ListenerMetrics:
+    events: int = 0
+    dropped: int = 0
+    coalesced: int = 0
+    blocked_seconds: float = 0.0
+    max_queue_depth: int = 0
+    slow_events: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class AsyncResponseStreamer(ResponseStreamer):
+    def __init__(self, listener: "AsyncChatListener", stream_id: int):
+        self.listener = listener
+        self.stream_id = stream_id
+
+    def __enter__(self):
+        self.listener._put(_STREAM_ENTER, (self.stream_id,))
+        return self
+
+    def on_next_token(self, token: str):
+        self.listener._put(_STREAM_TOKEN, (self.stream_id, token))
+
+    def __exit__(self, *args):
+        self.listener._put(_STREAM_EXIT, (self.stream_id, args))
+
+
+class AsyncChatListener(ChatListener):
+    """
+    Delivers events to `listener` on a worker thread through a bounded queue.
+
+    Events reach the wrapped listener in the order they were sent. When the queue is full, the
+    backpressure policy decides what happens: `block` waits for room, `drop` discards the event
+    and `coalesce` merges streamed tokens into the previous pending token before falling back
+    to blocking. Lifecycle events (`on_chat_end`, entering and leaving a response stream) are
+    never dropped.
+    """
+
+    def __init__(
+        self,
+        listener: ChatListener,
+        max_queue_size: int = 1024,
+        backpressure: str = BACKPRESSURE_BLOCK,
+        slow_threshold: float = 0.1,
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(
+                f"Unknown backpressure policy: {backpressure}. Allowed values: {BACKPRESSURE_POLICIES}"
+            )
+        self.listener = listener
+        self.coalesce_policy = listener.coalesce_policy
+        self.max_queue_size = max_queue_size
+        self.backpressure = backpressure
+        self.slow_threshold = slow_threshold
+        self.metrics = ListenerMetrics()
+        self.logger = logging.getLogger("gptcli-listeners")
+        self.name = type(listener).__name__
+
+        self._queue: Deque[Tuple[str, tuple]] = deque()
+        self._condition = threading.Condition()
+        self._stream_ids = itertools.count()
+        self._closed = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"gptcli-listener-{self.name}", daemon=True
+        )
+        self._thread.start()
+        self._depth_watch = watch_queue_depth(self.name, lambda: len(self._queue))
+
+    def _put(self, event: str, args: tuple):
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._queue) >= self.max_queue_size:
+                if not self._make_room(event, args):
+                    return
+            self._queue.append((event, args))
+            self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, len(self._queue))
+            self._condition.notify_all()
+
+    def _make_room(self, event: str, args: tuple) -> bool:
+        """
+        Apply the backpressure policy to a full queue. Returns whether `event` still has to be queued.
+        """
+        if self.backpressure == BACKPRESSURE_DROP and event not in _LIFECYCLE_EVENTS:
+            self.metrics.dropped += 1
+            return False
+        if self.backpressure == BACKPRESSURE_COALESCE and event == _STREAM_TOKEN:
+            last_event, last_args = self._queue[-1]
+            if last_event == _STREAM_TOKEN and last_args[0] == args[0]:
+                self._queue[-1] = (last_event, (args[0], last_args[1] + args[1]))
+                self.metrics.coalesced += 1
+                return False
+
+        started = time.monotonic()
+        while len(self._queue) >= self.max_queue_size:
+            self._condition.wait()
+        self.metrics.blocked_seconds += time.monotonic() - started
+        return True
+
+    def _run(self):
+        streamers: Dict[int, ResponseStreamer] = {}
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                event, args = self._queue.popleft()
+                self._condition.notify_all()
+
+            started = time.monotonic()
+            try:
+                self._dispatch(event, args, streamers)
+            except Exception:
+                self.logger.exception(f"{self.name} failed to handle {event}")
+            elapsed = time.monotonic() - started
+
+            self.metrics.events += 1
+            self.metrics.total_seconds += elapsed
+            self.metrics.max_seconds = max(self.metrics.max_seconds, elapsed)
+            if elapsed > self.slow_threshold:
+                self.metrics.slow_events += 1
+
+            if event == "on_chat_end":
+                return
+
+    def _dispatch(self, event: str, args: tuple, streamers: Dict[int, ResponseStreamer]):
+        if event == _STREAM_ENTER:
+            streamers[args[0]] = self.listener.response_streamer().__enter__()
+        elif event == _STREAM_TOKEN:
+            streamers[args[0]].on_next_token(args[1])
+        elif event == _STREAM_EXIT:
+            streamers.pop(args[0]).__exit__(*args[1])
+        else:
+            getattr(self.listener, event)(*args)
+
+    def on_chat_start(self):
+        self._put("on_chat_start", ())
+
+    def on_chat_clear(self):
+        self._put("on_chat_clear", ())
+
+    def on_chat_rerun(self, success: bool):
+        self._put("on_chat_rerun", (success,))
+
+    def on_rerun_candidate(self, index: int, count: int, message: Optional[Message]):
+        self._put("on_rerun_candidate", (index, count, message))
+
+    def on_error(self, e: Exception):
+        self._put("on_error", (e,))
+
+    def on_thread_rollover(self, old_thread_id: str, new_thread_id: str, summary: str):
+        self._put("on_thread_rollover", (old_thread_id, new_thread_id, summary))
+
+    def response_streamer(self) -> ResponseStreamer:
+        return AsyncResponseStreamer(self, next(self._stream_ids))
+
+    def on_chat_message(self, message: Message):
+        self._put("on_chat_message", (message,))
+
+    def on_chat_response(self, messages: List[Message], response: Message):
+        self._put("on_chat_response", (messages, response))
+
+    def on_chat_end(self, timeout: Optional[float] = 10.0):
+        """
+        Deliver everything still queued, then stop the worker. Waits at most `timeout` seconds.
+        """
+        self._put("on_chat_end", ())
+        with self._condition:
+            self._closed = True
+        self._thread.join(timeout)
+        unwatch_queue_depth(self._depth_watch)
+        if self._thread.is_alive():
+            self.logger.warning(
+                f"{self.name} did not finish handling its events within {timeout}s"
+            )
+        if self.metrics.slow_events or self.metrics.dropped:
+            self.logger.warning(f"{self.name}: {self.metrics}")
+        else:
+            self.logger.debug(f"{self.name}: {self.metrics}")
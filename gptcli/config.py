@@ -1,19 +1,36 @@
 """
 This module is responsible for reading the config file.
+
+It is also where the default paths of everything gpt-cli stores live, for the modules that use
+them to import. It only imports what reading the config needs, so that the `--daemon` client,
+which starts by reading it, doesn't load the OpenAI SDK.
 """
 
+from __future__ import annotations
+
 import os
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional
 from attr import dataclass
 import yaml
 
-from gptcli.assistant import AssistantConfig
+if TYPE_CHECKING:
+    from gptcli.assistant import AssistantConfig
+    from gptcli.tools import ToolConfig
 
 
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".config", "gpt-cli")
 CONFIG_FILE_PATHS = [
-    os.path.join(os.path.expanduser("~"), ".config", "gpt-cli", "gpt.yml"),
+    os.path.join(CONFIG_DIR, "gpt.yml"),
     os.path.join(os.path.expanduser("~"), ".gptrc"),
 ]
+DEFAULT_TRANSCRIPT_DIR = os.path.join(CONFIG_DIR, "logs")
+DEFAULT_SEARCH_INDEX_PATH = os.path.join(CONFIG_DIR, "search.db")
+DEFAULT_EXPORT_DIR = os.path.join(CONFIG_DIR, "export")
+DEFAULT_UPLOAD_CACHE_PATH = os.path.join(CONFIG_DIR, "uploads.json")
+DEFAULT_DOWNLOAD_DIR = os.path.join(CONFIG_DIR, "downloads")
+DEFAULT_RUN_LOG_DIR = os.path.join(CONFIG_DIR, "runs")
+DEFAULT_BRANCH_STORE_PATH = os.path.join(CONFIG_DIR, "branches.json")
+DEFAULT_SOCKET_PATH = os.path.join(CONFIG_DIR, "daemon.sock")
 
 
 @dataclass
@@ -25,6 +42,36 @@ class GptCliConfig:
     openai_api_key: Optional[str] = os.environ.get("OPENAI_API_KEY")
     log_file: Optional[str] = None
     log_level: str = "INFO"
+    transcript_dir: str = DEFAULT_TRANSCRIPT_DIR
+    transcript_durability: str = "turn"
+    transcript_fsync_interval: float = 5.0
+    transcript_max_bytes: Optional[int] = None
+    transcript_compression: Optional[str] = None
+    listener_dispatch: str = "async"
+    listener_queue_size: int = 1024
+    listener_backpressure: str = "block"
+    search_index_path: Optional[str] = DEFAULT_SEARCH_INDEX_PATH
+    export_dir: str = DEFAULT_EXPORT_DIR
+    upload_cache_path: Optional[str] = DEFAULT_UPLOAD_CACHE_PATH
+    upload_concurrency: int = 4
+    download_dir: Optional[str] = DEFAULT_DOWNLOAD_DIR
+    auto_download: bool = False
+    download_concurrency: int = 4
+    run_log_dir: Optional[str] = DEFAULT_RUN_LOG_DIR
+    branch_store_path: Optional[str] = DEFAULT_BRANCH_STORE_PATH
+    daemon_socket: str = DEFAULT_SOCKET_PATH
+    daemon_spare_threads: int = 1
+    thread_max_messages: Optional[int] = None
+    thread_max_tokens: Optional[int] = None
+    thread_keep_turns: int = 2
+    hedge_budget: float = 0.05
+    hedge_quantile: float = 0.95
+    request_timeout: Optional[float] = None
+    tokenizer_cache_dir: Optional[str] = None
+    tools: Dict[str, ToolConfig] = {}
+    tool_concurrency: int = 8
+    metrics_port: Optional[int] = None
+    metrics_host: str = "127.0.0.1"
     assistants: Dict[str, AssistantConfig] = {}
 
 
@@ -2,15 +2,20 @@
 This module is responsible for calculating the cost of a chat session.
 """
 
-import tiktoken
 import logging
+import threading
+
+import tiktoken
 
+from gptcli import metrics
+from gptcli.encodings import encoding_for_model, get_encoding
+from gptcli.rollover import ENCODING
 from gptcli.types import Message
 from gptcli.session import ChatListener
 from gptcli.assistant import AssistantThread
 
 from rich.console import Console
-from typing import List, Optional
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
 
 
 def num_tokens_from_messages(messages: List[Message], model: str) -> Optional[int]:
@@ -138,8 +143,40 @@ class PriceChatListener(ChatListener):
             style="dim",
         )
 
+class UsageMetricsChatListener(ChatListener):
+    """
+    Records estimated tokens and spend of every response in the metrics (see gptcli.metrics).
+    Counting encodes the whole thread, so this listener belongs off the session thread.
+    """
+
+    def __init__(self, assistant: AssistantThread):
+        self.assistant = assistant
+        self.logger = logging.getLogger("gptcli-price")
+
+    def on_chat_response(self, messages: List[Message], response: Message):
+        model = getattr(self.assistant.assistant_handle, "model", None)
+        try:
+            encoding = encoding_for_model(model) if model else get_encoding(ENCODING)
+            # Every run sends the whole thread as the prompt
+            prompt_tokens = count_message_tokens(encoding, messages)
+            completion_tokens = count_message_tokens(encoding, [response])
+        except (KeyError, ValueError, OSError) as e:
+            self.logger.debug(f"Can't count the tokens of the response: {e}")
+            return
+        price = None
+        if model:
+            prompt_price = price_per_token(model, prompt=True)
+            response_price = price_per_token(model, prompt=False)
+            if prompt_price is not None and response_price is not None:
+                price = prompt_price * prompt_tokens + response_price * completion_tokens
+        metrics.record_usage(self.assistant.get_assistant_id(), prompt_tokens, completion_tokens, price)
+
+
 def num_tokens_from_messages_openai(messages: List[Message], model: str) -> int:
-    encoding = tiktoken.encoding_for_model(model)
+    return count_message_tokens(encoding_for_model(model), messages)
+
+
+def count_message_tokens(encoding: tiktoken.Encoding, messages: List[Message]) -> int:
     num_tokens = 0
     for message in messages:
         # every message follows <im_start>{role/name}\n{content}<im_end>\n
@@ -154,4 +191,118 @@ def num_tokens_from_messages_openai(messages: List[Message], model: str) -> int:
 
 
 def num_tokens_from_completion_openai(completion: Message, model: str) -> int:
-    return num_tokens_from_messages_openai([completion], model)
\ No newline at end of file
+    return num_tokens_from_messages_openai([completion], model)
+
+class DraftEstimate(NamedTuple):
+    draft_tokens: int
+    thread_tokens: int
+    # Price of sending the thread and the draft as the next prompt, if the model's pricing is known
+    price: Optional[float]
+
+
+def format_estimate(estimate: DraftEstimate) -> str:
+    text = f"Draft: {estimate.draft_tokens:,} tokens | Thread: {estimate.thread_tokens:,} tokens"
+    if estimate.price is not None:
+        text += f" | Next message: ~${estimate.price:.3f}"
+    return text
+
+
+class DraftEstimator:
+    """
+    Estimates the size and price of the message being typed, sent with the thread it goes to.
+
+    `update` is called by the UI on every change and returns right away. Counting happens on a
+    background thread once typing pauses for `debounce` seconds, and lines that were counted
+    before aren't encoded again, so editing or appending to a long draft stays cheap.
+    """
+
+    # How many distinct lines to remember the token counts of
+    max_cached_lines = 10_000
+
+    def __init__(
+        self,
+        thread: Callable[[], Tuple[Optional[str], List[Message]]],
+        debounce: float = 0.15,
+    ):
+        # Returns the model and the messages of the thread the draft will be sent to
+        self.thread = thread
+        self.debounce = debounce
+        # Called on the background thread whenever `estimate` changed
+        self.on_update: Callable[[], None] = lambda: None
+        self.estimate: Optional[DraftEstimate] = None
+        self.logger = logging.getLogger("gptcli-price")
+        self._draft = ""
+        self._version = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._line_tokens: Dict[str, int] = {}
+        self._line_encoding: Optional[str] = None
+        self._thread_tokens: Tuple[Optional[List[Message]], int] = (None, 0)
+        self._worker = threading.Thread(target=self._run, name="gptcli-estimate", daemon=True)
+        self._worker.start()
+
+    def update(self, draft: str):
+        with self._condition:
+            self._draft = draft
+            self._version += 1
+            self._condition.notify()
+
+    def toolbar(self) -> str:
+        estimate = self.estimate
+        return format_estimate(estimate) if estimate is not None else "Counting tokens..."
+
+    def _run(self):
+        counted = 0
+        while True:
+            with self._condition:
+                while self._version == counted and not self._closed:
+                    self._condition.wait()
+                # Wait for a pause in typing
+                while not self._closed:
+                    version = self._version
+                    self._condition.wait(self.debounce)
+                    if self._version == version:
+                        break
+                if self._closed:
+                    return
+                counted, draft = self._version, self._draft
+            try:
+                self.estimate = self.compute(draft)
+            except Exception as e:
+                self.logger.debug(f"Can't estimate the draft: {e}")
+                continue
+            self.on_update()
+
+    def compute(self, draft: str) -> DraftEstimate:
+        model, messages = self.thread()
+        try:
+            encoding = encoding_for_model(model) if model else get_encoding(ENCODING)
+        except KeyError:
+            encoding = get_encoding(ENCODING)
+
+        cached_messages, thread_tokens = self._thread_tokens
+        # Threads get new message lists on every change, so an identical list has the same count
+        if messages is not cached_messages:
+            thread_tokens = count_message_tokens(encoding, messages)
+            self._thread_tokens = (messages, thread_tokens)
+
+        if len(self._line_tokens) > self.max_cached_lines or encoding.name != self._line_encoding:
+            self._line_tokens.clear()
+            self._line_encoding = encoding.name
+        draft_tokens = 0
+        for line in draft.splitlines(keepends=True):
+            tokens = self._line_tokens.get(line)
+            if tokens is None:
+                tokens = self._line_tokens[line] = len(encoding.encode(line, disallowed_special=()))
+            draft_tokens += tokens
+
+        price = None
+        token_price = price_per_token(model, prompt=True) if model else None
+        if token_price is not None:
+            price = token_price * (thread_tokens + draft_tokens)
+        return DraftEstimate(draft_tokens, thread_tokens, price)
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
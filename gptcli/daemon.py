@@ -0,0 +1,333 @@
+"""
+A background process that keeps assistant sessions warm for short-lived CLI invocations.
+
+`openai-assistants-cli serve` holds one OpenAI client (and its connection pool), the retrieved
+assistant handles, a few pre-created threads and a cache of file lookups. CLI invocations started
+with `--daemon` attach to it over a Unix socket and drive their session through it instead of
+creating a client, retrieving the assistant and creating a thread themselves.
+
+The protocol is JSON lines. Each request is `{"id": n, "method": ..., "params": {...}}` and gets
+exactly one response, `{"id": n, "result": ...}` or `{"id": n, "error": {"type": ..., "message": ...}}`.
+Sessions opened on a connection are dropped when it closes.
+"""
+
+import json
+import logging
+import os
+import socketserver
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional
+
+from openai import OpenAI, OpenAIError
+
+from gptcli.assistant import (
+    DEFAULT_ASSISTANTS,
+    AssistantConfig,
+    AssistantThread,
+    resolve_assistant_config,
+)
+from gptcli import metrics
+from gptcli.config import DEFAULT_SOCKET_PATH
+from gptcli import daemon_client
+from gptcli.daemon_client import daemon_is_running
+from gptcli.openai_types import ThreadMessage, ThreadRun
+from gptcli.tools import ToolRegistry
+from gptcli.types import Message
+
+
+class DaemonError(daemon_client.DaemonClientError, OpenAIError):
+    """
+    A DaemonClientError that the chat session handles like any other OpenAI error.
+    """
+
+
+class WarmAssistantThread(AssistantThread):
+    """
+    An AssistantThread that takes its client, assistant handle, threads and file lookups from the daemon.
+    """
+
+    def __init__(self, config: AssistantConfig, daemon: "AssistantDaemon"):
+        self.daemon = daemon
+        super().__init__(
+            config,
+            daemon.openai_client,
+            assistant_handle=daemon.assistant_handle(config.get("id")),
+        )
+        self.tool_registry = daemon.tool_registry
+
+    def init_messages(self) -> List[Message]:
+        self.thread = self.daemon.take_thread()
+        self._reset_history()
+        return self.config.get("messages", [])[:]
+
+    def retrieve_file(self, file_id: str):
+        return self.daemon.retrieve_file(file_id)
+
+
+class AssistantDaemon:
+    def __init__(
+        self,
+        assistants: Dict[str, AssistantConfig],
+        socket_path: str = DEFAULT_SOCKET_PATH,
+        openai_client: Optional[OpenAI] = None,
+        spare_threads: int = 1,
+        tool_registry: Optional[ToolRegistry] = None,
+    ):
+        self.assistants = assistants
+        self.tool_registry = tool_registry
+        self.socket_path = socket_path
+        self.openai_client = openai_client or OpenAI()
+        self.spare_threads = spare_threads
+        self.logger = logging.getLogger("gptcli-daemon")
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, AssistantThread] = {}
+        self.assistant_handles: Dict[str, Any] = {}
+        self.files: Dict[str, Any] = {}
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="gptcli-daemon")
+        self.thread_pool: Deque[Future] = deque()
+        self.server: Optional[socketserver.ThreadingUnixStreamServer] = None
+
+    def assistant_handle(self, assistant_id: str):
+        with self.lock:
+            handle = self.assistant_handles.get(assistant_id)
+        metrics.cache_lookup("assistants", handle is not None)
+        if handle is None:
+            handle = self.openai_client.beta.assistants.retrieve(assistant_id)
+            with self.lock:
+                self.assistant_handles[assistant_id] = handle
+        return handle
+
+    def take_thread(self):
+        """
+        Return a pre-created OpenAI thread, and start creating its replacement.
+        """
+        with self.lock:
+            future = self.thread_pool.popleft() if self.thread_pool else None
+            self._refill_threads()
+        metrics.cache_lookup("spare_threads", future is not None)
+        if future is not None:
+            try:
+                return future.result()
+            except OpenAIError:
+                self.logger.exception("Failed to pre-create a thread")
+        return self.openai_client.beta.threads.create()
+
+    def _refill_threads(self):
+        # Called with the lock held
+        while len(self.thread_pool) < self.spare_threads:
+            self.thread_pool.append(self.executor.submit(self.openai_client.beta.threads.create))
+
+    def retrieve_file(self, file_id: str):
+        # File metadata doesn't change, so lookups are cached for the daemon's lifetime.
+        with self.lock:
+            cached = self.files.get(file_id)
+        if cached is None:
+            cached = self.openai_client.files.retrieve(file_id)
+            with self.lock:
+                self.files[file_id] = cached
+        return cached
+
+    def warm_up(self):
+        with self.lock:
+            self._refill_threads()
+        for name, config in self.assistants.items():
+            assistant_id = resolve_assistant_config(name, config).get("id")
+            if assistant_id:
+                self.executor.submit(self.assistant_handle, assistant_id)
+
+    # Request handlers
+
+    def _session(self, params: Dict[str, Any]) -> AssistantThread:
+        with self.lock:
+            session = self.sessions.get(params["session"])
+        if session is None:
+            raise KeyError(f"Unknown session {params['session']}")
+        return session
+
+    def handle_ping(self, params, owned: List[str]):
+        with self.lock:
+            return {"pid": os.getpid(), "sessions": len(self.sessions)}
+
+    def handle_open(self, params, owned: List[str]):
+        name = params["assistant"]
+        if name in self.assistants:
+            config = self.assistants[name]
+        elif name in DEFAULT_ASSISTANTS:
+            config = DEFAULT_ASSISTANTS[name]
+        else:
+            raise KeyError(f"Unknown assistant: {name}")
+        assistant = WarmAssistantThread(resolve_assistant_config(name, config), self)
+        assistant.poll_interval = params.get("poll_interval", assistant.poll_interval)
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = assistant
+        owned.append(session_id)
+        return {
+            "session": session_id,
+            "config": assistant.config,
+            "assistant_id": assistant.get_assistant_id(),
+            "thread_id": assistant.get_thread_id(),
+            "messages": assistant.config.get("messages", [])[:],
+        }
+
+    def handle_init_messages(self, params, owned: List[str]):
+        assistant = self._session(params)
+        messages = assistant.init_messages()
+        return {"thread_id": assistant.get_thread_id(), "messages": messages}
+
+    def handle_add_message(self, params, owned: List[str]):
+        message = self._session(params).add_message(params["message"], params.get("file_ids"))
+        return ThreadMessage.from_sdk(message).to_dict()
+
+    def handle_run_thread(self, params, owned: List[str]):
+        run = self._session(params).run_thread()
+        return ThreadRun.from_sdk(run).to_dict()
+
+    def handle_fetch_messages(self, params, owned: List[str]):
+        assistant = self._session(params)
+        messages = assistant.fetch_messages(params["since_last_user_message"])
+        return {
+            "messages": [message.to_dict() for message in messages],
+            "last_response_message_ids": assistant.last_response_message_ids,
+        }
+
+    def handle_close(self, params, owned: List[str]):
+        with self.lock:
+            self.sessions.pop(params["session"], None)
+        if params["session"] in owned:
+            owned.remove(params["session"])
+        return None
+
+    def handle_shutdown(self, params, owned: List[str]):
+        assert self.server is not None
+        # shutdown() waits for serve_forever to return, so it can't run on a handler thread
+        threading.Thread(target=self.server.shutdown, daemon=True).start()
+        return None
+
+    def handle_request(self, request: Dict[str, Any], owned: List[str]) -> Dict[str, Any]:
+        handler = getattr(self, "handle_" + str(request.get("method")), None)
+        try:
+            if handler is None:
+                raise ValueError(f"Unknown method {request.get('method')}")
+            result = handler(request.get("params") or {}, owned)
+        except Exception as e:
+            if not isinstance(e, (OpenAIError, KeyError, ValueError)):
+                self.logger.exception(f"Failed to handle {request.get('method')}")
+            return {"id": request.get("id"), "error": {"type": type(e).__name__, "message": str(e)}}
+        return {"id": request.get("id"), "result": result}
+
+    def serve_forever(self):
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                owned: List[str] = []
+                try:
+                    for line in self.rfile:
+                        response = daemon.handle_request(json.loads(line), owned)
+                        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+                finally:
+                    with daemon.lock:
+                        for session_id in owned:
+                            daemon.sessions.pop(session_id, None)
+
+        if os.path.exists(self.socket_path):
+            if daemon_is_running(self.socket_path):
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+
+        server = socketserver.ThreadingUnixStreamServer(self.socket_path, Handler)
+        server.daemon_threads = True
+        os.chmod(self.socket_path, 0o600)
+        self.server = server
+        self.warm_up()
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            os.unlink(self.socket_path)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DaemonClient(daemon_client.DaemonClient):
+    error_class = DaemonError
+
+
+class _Handle:
+    def __init__(self, id: str):
+        self.id = id
+
+
+class DaemonAssistantThread:
+    """
+    Stands in for AssistantThread in a ChatSession, forwarding every call to a session in the daemon.
+    """
+
+    def __init__(self, client: DaemonClient, assistant_name: str):
+        self.client = client
+        self.assistant_name = assistant_name
+        self.session_id: Optional[str] = None
+        self.config: AssistantConfig = {}
+        self.assistant_handle: Optional[_Handle] = None
+        self.thread: Optional[_Handle] = None
+        self.last_user_message_id: Optional[str] = None
+        self.last_run_id: Optional[str] = None
+        self.last_response_message_ids: List[str] = []
+        # Threads in the daemon don't roll over, nothing calls these
+        self.rollover_callbacks: List[Any] = []
+        # Open the session right away, like AssistantThread, so the ids are there for the listeners
+        self.init_messages()
+
+    def init_messages(self) -> List[Message]:
+        if self.session_id is None:
+            result = self.client.call("open", assistant=self.assistant_name)
+            self.session_id = result["session"]
+            self.config = result["config"]
+            self.assistant_handle = _Handle(result["assistant_id"])
+        else:
+            result = self.client.call("init_messages", session=self.session_id)
+        self.thread = _Handle(result["thread_id"])
+        return result["messages"]
+
+    def add_message(
+        self, our_message: Message, file_ids: Optional[List[str]] = None
+    ) -> ThreadMessage:
+        result = self.client.call(
+            "add_message", session=self.session_id, message=our_message, file_ids=file_ids
+        )
+        self.last_user_message_id = result["id"]
+        return ThreadMessage.from_dict(result)
+
+    def run_thread(self) -> ThreadRun:
+        result = self.client.call("run_thread", session=self.session_id)
+        self.last_run_id = result["id"]
+        return ThreadRun.from_dict(result)
+
+    def fetch_messages(self, since_last_user_message: bool) -> List[ThreadMessage]:
+        result = self.client.call(
+            "fetch_messages",
+            session=self.session_id,
+            since_last_user_message=since_last_user_message,
+        )
+        self.last_response_message_ids = result["last_response_message_ids"]
+        return [ThreadMessage.from_dict(message) for message in result["messages"]]
+
+    def get_thread_id(self):
+        assert self.thread is not None
+        return self.thread.id
+
+    def get_assistant_id(self):
+        assert self.assistant_handle is not None
+        return self.assistant_handle.id
+
+    def close(self):
+        if self.session_id is not None:
+            self.client.call("close", session=self.session_id)
+            self.session_id = None
@@ -0,0 +1,153 @@
+"""
+The client side of the session daemon (see `gptcli.daemon`), and a plain chat loop that runs on it.
+
+It only imports the standard library and the config, not the OpenAI SDK or the terminal UI, so that
+`openai-assistants-cli --daemon` starts in milliseconds: the daemon has everything else loaded
+already.
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+from typing import Any, Dict, List, Optional
+
+from gptcli.config import (
+    CONFIG_FILE_PATHS,
+    DEFAULT_SOCKET_PATH,
+    GptCliConfig,
+    choose_config_file,
+    read_yaml_config,
+)
+
+QUIT_COMMANDS = (":quit", ":q")
+
+
+class DaemonClientError(Exception):
+    """
+    An error raised by the daemon while handling a request, re-raised in the client.
+    """
+
+    def __init__(self, error_type: str, message: str):
+        super().__init__(f"{error_type}: {message}")
+        self.error_type = error_type
+
+
+def daemon_is_running(socket_path: str) -> bool:
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(socket_path)
+        return True
+    except OSError:
+        return False
+
+
+class DaemonClient:
+    # The exception raised for errors reported by the daemon
+    error_class = DaemonClientError
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socket_path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.file = self.sock.makefile("rwb")
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    def call(self, method: str, **params) -> Any:
+        with self.lock:
+            self.next_id += 1
+            request = {"id": self.next_id, "method": method, "params": params}
+            self.file.write(json.dumps(request).encode("utf-8") + b"\n")
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise self.error_class("ConnectionError", "The daemon closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise self.error_class(response["error"]["type"], response["error"]["message"])
+        return response["result"]
+
+    def close(self):
+        self.file.close()
+        self.sock.close()
+
+
+def message_text(message: Dict[str, Any]) -> str:
+    """
+    The text of a message returned by `fetch_messages`.
+    """
+    return "".join(
+        content["text"]["value"] for content in message["content"] if content["type"] == "text"
+    )
+
+
+def chat(client: DaemonClient, assistant_name: str, input=input, output=sys.stdout):
+    """
+    Chat with `assistant_name` in a session of the daemon, in plain text, until `:q` or Ctrl-D.
+    """
+    session = client.call("open", assistant=assistant_name)["session"]
+    try:
+        while True:
+            try:
+                text = input("> ")
+            except (EOFError, KeyboardInterrupt):
+                break
+            if text.strip() in QUIT_COMMANDS:
+                break
+            if not text.strip():
+                continue
+            client.call("add_message", session=session, message={"role": "user", "content": text})
+            try:
+                client.call("run_thread", session=session)
+            except DaemonClientError as e:
+                print(f"Request failed: {e}", file=output)
+                continue
+            messages: List[Dict[str, Any]] = client.call(
+                "fetch_messages", session=session, since_last_user_message=True
+            )["messages"]
+            for message in messages:
+                print(message_text(message), file=output)
+            output.flush()
+    finally:
+        client.call("close", session=session)
+
+
+def thin_client_assistant(argv: List[str], config: GptCliConfig) -> Optional[str]:
+    """
+    The assistant to chat with if `argv` asks for nothing but a daemon session, else None.
+    """
+    if "--daemon" not in argv:
+        return None
+    positional = [arg for arg in argv if arg != "--daemon"]
+    if any(arg.startswith("-") for arg in positional) or len(positional) > 1:
+        return None
+    return positional[0] if positional else config.default_assistant
+
+
+def main(argv: Optional[List[str]] = None) -> bool:
+    """
+    Run `openai-assistants-cli --daemon [assistant]` without loading the rest of gpt-cli. Returns
+    False, without doing anything, if the arguments need the full CLI or no daemon is running.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    config_file_path = choose_config_file(CONFIG_FILE_PATHS)
+    config = read_yaml_config(config_file_path) if config_file_path else GptCliConfig()
+    assistant_name = thin_client_assistant(argv, config)
+    if assistant_name is None:
+        return False
+    try:
+        client = DaemonClient(os.path.expanduser(config.daemon_socket))
+    except OSError:
+        return False
+    try:
+        chat(client, assistant_name)
+    except DaemonClientError as e:
+        sys.exit(str(e))
+    finally:
+        client.close()
+    return True
@@ -0,0 +1,259 @@
+"""
+Download the files assistants generate.
+
+The files the code interpreter writes are cited with `file_path` annotations, and the images it
+draws are `image_file` contents of its messages. They are downloaded into `download_dir` in the
+background when asked for with `:download`, or, with `auto`, as soon as an answer cites them, so
+the conversation goes on while they arrive.
+
+Downloads stream to disk in chunks, several files at a time. A download writes to a `.part`
+file named after the file id and only takes its final name once complete, so an interrupted
+download, even from an earlier process, resumes with a `Range` request from where it stopped.
+Finished downloads are listed in a manifest with their size and SHA-256, and a file that is
+already on disk is not downloaded again.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+
+import httpx
+from openai import APIConnectionError, OpenAI, OpenAIError
+
+from gptcli.config import DEFAULT_DOWNLOAD_DIR
+from gptcli import metrics
+from gptcli.trace import span
+
+MANIFEST_FILENAME = ".manifest.json"
+CHUNK_SIZE = 1024 * 1024
+# How many times a download broken off mid-stream is resumed before giving up
+MAX_RESUMES = 3
+# Makes the SDK return the response before reading its body
+_STREAM_HEADER = "X-Stainless-Streamed-Raw-Response"
+
+logger = logging.getLogger("gptcli-downloads")
+
+# Called with (path, bytes received, total bytes or None) as a download progresses.
+ProgressCallback = Callable[[str, int, Optional[int]], None]
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadResult(NamedTuple):
+    file_id: str
+    path: str
+    size: int
+    # Whether the file was already on disk
+    cached: bool
+    # How many bytes an earlier, interrupted download had already written
+    resumed_from: int
+    seconds: float
+
+
+class GeneratedFile(NamedTuple):
+    file_id: str
+    filename: str
+    size: Optional[int]
+
+
+class Download(NamedTuple):
+    file_id: str
+    # Where the file will be once the download is done
+    path: str
+    future: "Future[DownloadResult]"
+
+
+class DownloadManifest:
+    """
+    A JSON file mapping the id of each downloaded file to its path, size and SHA-256.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries: Dict[str, Dict] = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def get(self, file_id: str) -> Optional[Dict]:
+        with self.lock:
+            return self.entries.get(file_id)
+
+    def put(self, file_id: str, path: str, size: int, sha256: str):
+        with self.lock:
+            self.entries[file_id] = {"path": path, "bytes": size, "sha256": sha256}
+
+    def paths(self) -> Set[str]:
+        with self.lock:
+            return {entry["path"] for entry in self.entries.values()}
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Downloads finish on several threads, which would share the temporary file
+        with self.lock:
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+def _existing_entry(entry: Optional[Dict]) -> bool:
+    return entry is not None and os.path.isfile(entry["path"]) and os.path.getsize(entry["path"]) == entry["bytes"]
+
+
+class Downloader:
+    def __init__(
+        self,
+        openai_client: OpenAI,
+        directory: str = DEFAULT_DOWNLOAD_DIR,
+        max_workers: int = 4,
+        auto: bool = False,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        self.openai_client = openai_client
+        self.directory = directory
+        # Whether cited files are downloaded right away rather than on `:download`
+        self.auto = auto
+        self.chunk_size = chunk_size
+        self.manifest = DownloadManifest(os.path.join(directory, MANIFEST_FILENAME))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gptcli-download")
+        self.lock = threading.Lock()
+        # Downloads started by this process, by file id
+        self.downloads: Dict[str, Download] = {}
+        # Paths promised to downloads that haven't finished yet
+        self.reserved: Set[str] = set()
+        self.progress: Optional[ProgressCallback] = None
+        # Told when a download finishes or fails
+        self.notify: Callable[[str], None] = lambda message: None
+
+    def _target_path(self, file_id: str, filename: str) -> str:
+        # Called with the lock held
+        entry = self.manifest.get(file_id)
+        if entry is not None:
+            return entry["path"]
+        name = os.path.basename(filename) or file_id
+        stem, extension = os.path.splitext(name)
+        taken = self.manifest.paths() | self.reserved
+        path = os.path.join(self.directory, name)
+        number = 1
+        while path in taken or os.path.exists(path):
+            number += 1
+            path = os.path.join(self.directory, f"{stem} ({number}){extension}")
+        return path
+
+    def download(self, file_id: str, filename: str, size: Optional[int] = None) -> Download:
+        """
+        Start downloading `file_id` in the background, unless it already is. `size` is the file's
+        size in bytes if known, so it needn't be retrieved first.
+        """
+        with self.lock:
+            download = self.downloads.get(file_id)
+            if download is not None and not (download.future.done() and download.future.exception()):
+                return download
+            path = self._target_path(file_id, filename)
+            self.reserved.add(path)
+            download = Download(file_id, path, self.executor.submit(self._download, file_id, path, size))
+            self.downloads[file_id] = download
+        download.future.add_done_callback(lambda future: self._on_done(download))
+        return download
+
+    def _on_done(self, download: Download):
+        with self.lock:
+            self.reserved.discard(download.path)
+        if download.future.cancelled():
+            return
+        error = download.future.exception()
+        if error is not None:
+            logger.warning("Download of %s failed: %s", download.file_id, error)
+            self.notify(f"Download of {os.path.basename(download.path)} failed: {error}")
+        elif not download.future.result().cached:
+            self.notify(f"Downloaded {download.path}")
+
+    def _part_path(self, file_id: str) -> str:
+        return os.path.join(self.directory, f".{file_id}.part")
+
+    def _download(self, file_id: str, path: str, size: Optional[int]) -> DownloadResult:
+        started = time.perf_counter()
+        entry = self.manifest.get(file_id)
+        metrics.cache_lookup("downloads", _existing_entry(entry))
+        if entry is not None and _existing_entry(entry):
+            return DownloadResult(file_id, entry["path"], entry["bytes"], True, 0, 0.0)
+        if size is None:
+            with span("files.retrieve", file_id):
+                size = self.openai_client.files.retrieve(file_id).bytes
+
+        os.makedirs(self.directory, exist_ok=True)
+        part_path = self._part_path(file_id)
+        resumed_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        resumes = 0
+        while True:
+            try:
+                with span("files.content", file_id):
+                    self._fetch(file_id, part_path, size)
+                break
+            except (httpx.HTTPError, APIConnectionError) as e:
+                # Whatever arrived stays in the part file for the next attempt
+                resumes += 1
+                if resumes > MAX_RESUMES:
+                    raise DownloadError(f"gave up after {MAX_RESUMES} attempts: {e}")
+                logger.info("Resuming the download of %s after: %s", file_id, e)
+
+        received = os.path.getsize(part_path)
+        if size is not None and received != size:
+            raise DownloadError(f"expected {size} bytes, got {received}")
+        sha256 = hashlib.sha256()
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                sha256.update(chunk)
+        os.replace(part_path, path)
+        self.manifest.put(file_id, path, received, sha256.hexdigest())
+        self.manifest.save()
+        return DownloadResult(file_id, path, received, False, resumed_from, time.perf_counter() - started)
+
+    def _fetch(self, file_id: str, part_path: str, size: Optional[int]):
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if size is not None and offset >= size:
+            return
+        headers = {_STREAM_HEADER: "true"}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+        content = self.openai_client.files.content(file_id, extra_headers=headers)
+        try:
+            if content.response.status_code != 206:
+                # The server sent the whole file
+                offset = 0
+            with open(part_path, "ab" if offset else "wb") as f:
+                for chunk in content.iter_bytes(self.chunk_size):
+                    f.write(chunk)
+                    offset += len(chunk)
+                    if self.progress is not None:
+                        self.progress(part_path, offset, size)
+        finally:
+            content.close()
+
+    def wait(self, timeout: Optional[float] = None) -> List[DownloadResult]:
+        """
+        Wait for the downloads started so far, and return the results of those that succeeded.
+        """
+        with self.lock:
+            downloads = list(self.downloads.values())
+        results = []
+        for download in downloads:
+            try:
+                results.append(download.future.result(timeout))
+            except (DownloadError, OpenAIError, OSError, httpx.HTTPError):
+                pass
+        return results
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,161 @@
+"""
+Load tokenizer encodings from a local cache instead of tiktoken's download.
+
+tiktoken fetches its BPE files over the network on first use and parses the base64 text at
+every process start. `openai-assistants-cli tokenizer build` writes each encoding once to
+`tokenizer_cache_dir` as `<name>.tkc`, a binary file whose tokens and ranks are sliced straight out
+of a memory map on load, with no base64 or line parsing:
+
+    header        magic, format version, number of tokens, number of special tokens, pattern length
+    pattern       the pre-tokenizer regex, UTF-8
+    ranks         uint32 rank of each token
+    offsets       uint32 start of each token in `tokens`, plus the end of the last one
+    tokens        the token bytes, back to back
+    special       rank (uint32), length (uint16) and UTF-8 text of each special token
+
+Once a cache directory is set, encodings are only loaded from it and the network is never used.
+tiktoken takes the ranks as a dict of bytes, so each process still copies every token out of the
+map and builds its own encoder from them; no file layout avoids that, and the memory isn't shared
+between processes. `prefetch` does it in the background while the session starts.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from typing import Dict, Optional
+
+import tiktoken
+import tiktoken.model
+
+from gptcli import metrics
+
+CACHE_SUFFIX = ".tkc"
+MAGIC = b"GPTCLITK"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sIIII")
+SPECIAL_TOKEN = struct.Struct("<IH")
+
+
+class EncodingNotCachedError(ValueError):
+    pass
+
+
+def cache_path(directory: str, name: str) -> str:
+    return os.path.join(os.path.expanduser(directory), name + CACHE_SUFFIX)
+
+
+def write_encoding_cache(encoding: tiktoken.Encoding, directory: str) -> str:
+    """
+    Write `encoding` to `directory` and return the path of the cache file.
+    """
+    ranked = sorted(encoding._mergeable_ranks.items(), key=lambda item: item[1])
+    pattern = encoding._pat_str.encode("utf-8")
+    offsets = [0]
+    for token, _ in ranked:
+        offsets.append(offsets[-1] + len(token))
+
+    parts = [
+        HEADER.pack(MAGIC, FORMAT_VERSION, len(ranked), len(encoding._special_tokens), len(pattern)),
+        pattern,
+        struct.pack(f"<{len(ranked)}I", *(rank for _, rank in ranked)),
+        struct.pack(f"<{len(offsets)}I", *offsets),
+        b"".join(token for token, _ in ranked),
+    ]
+    for text, rank in encoding._special_tokens.items():
+        data = text.encode("utf-8")
+        parts.append(SPECIAL_TOKEN.pack(rank, len(data)) + data)
+
+    path = cache_path(directory, encoding.name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Processes may be loading the previous version, replace it atomically
+    with open(path + ".tmp", "wb") as f:
+        f.write(b"".join(parts))
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def load_encoding_cache(path: str) -> tiktoken.Encoding:
+    with open(path, "rb") as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    magic, version, count, special_count, pattern_length = HEADER.unpack_from(view)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"{path} is not a tokenizer cache of version {FORMAT_VERSION}, rebuild it")
+    position = HEADER.size
+    pattern = bytes(view[position : position + pattern_length]).decode("utf-8")
+    position += pattern_length
+    ranks = view[position : position + 4 * count].cast("I").tolist()
+    position += 4 * count
+    offsets = view[position : position + 4 * (count + 1)].cast("I").tolist()
+    position += 4 * (count + 1)
+    tokens = data[position : position + offsets[-1]]
+    position += offsets[-1]
+
+    mergeable_ranks = dict(
+        zip([tokens[start:end] for start, end in zip(offsets, offsets[1:])], ranks)
+    )
+    special_tokens: Dict[str, int] = {}
+    for _ in range(special_count):
+        rank, length = SPECIAL_TOKEN.unpack_from(view, position)
+        position += SPECIAL_TOKEN.size
+        special_tokens[bytes(view[position : position + length]).decode("utf-8")] = rank
+        position += length
+
+    name = os.path.basename(path)[: -len(CACHE_SUFFIX)]
+    return tiktoken.Encoding(
+        name, pat_str=pattern, mergeable_ranks=mergeable_ranks, special_tokens=special_tokens
+    )
+
+
+_cache_dir: Optional[str] = None
+_encodings: Dict[str, tiktoken.Encoding] = {}
+_lock = threading.Lock()
+
+
+def set_cache_dir(directory: Optional[str]):
+    global _cache_dir
+    with _lock:
+        _cache_dir = directory
+        _encodings.clear()
+
+
+def get_encoding(name: str) -> tiktoken.Encoding:
+    """
+    The encoding called `name`, from the cache directory if one is set and from tiktoken otherwise.
+    """
+    with _lock:
+        encoding = _encodings.get(name)
+        metrics.cache_lookup("encodings", encoding is not None)
+        if encoding is not None:
+            return encoding
+        if _cache_dir is None:
+            encoding = tiktoken.get_encoding(name)
+        else:
+            path = cache_path(_cache_dir, name)
+            if not os.path.exists(path):
+                raise EncodingNotCachedError(
+                    f"The {name} encoding isn't in {_cache_dir}. Run `openai-assistants-cli tokenizer build {name}` "
+                    "on a machine with network access and copy the file over."
+                )
+            encoding = load_encoding_cache(path)
+        _encodings[name] = encoding
+        return encoding
+
+
+def encoding_for_model(model: str) -> tiktoken.Encoding:
+    return get_encoding(tiktoken.model.encoding_name_for_model(model))
+
+
+def prefetch(name: str):
+    """
+    Start loading an encoding in the background. Errors surface when it is first used.
+    """
+
+    def load():
+        try:
+            get_encoding(name)
+        except Exception:
+            pass
+
+    threading.Thread(target=load, name="gptcli-encoding", daemon=True).start()
@@ -0,0 +1,17 @@
+"""
+The `openai-assistants-cli` command.
+
+`--daemon` sessions are handed to the thin client in `gptcli.daemon_client` before the rest of
+gpt-cli (and the OpenAI SDK) is imported; everything else, including `--daemon` with other options
+or without a running daemon, goes to `gptcli.gpt`.
+"""
+
+from gptcli import daemon_client
+
+
+def main():
+    if daemon_client.main():
+        return
+    from gptcli.gpt import main as gpt_main
+
+    gpt_main()
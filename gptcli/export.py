@@ -0,0 +1,307 @@
+"""
+Export stored transcripts to a columnar dataset for analytics.
+
+The dataset has one row per message, with the turn, run and latency recorded next to it, and is
+partitioned Hive-style by UTC date and assistant (`date=2024-01-31/assistant_id=asst_.../*.parquet`),
+so any Parquet or Arrow reader (pyarrow, pandas, polars, DuckDB, Spark) can prune by either.
+
+Exports are incremental. `_export_state.json` in the output directory remembers how far each
+transcript segment was exported, keyed by its first record so that a segment is still recognized
+after it was rotated and compressed. Unchanged files aren't even opened.
+
+Requires the optional `pyarrow` package: pip install openai-assistants-cli[analytics]
+"""
+
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from gptcli.config import DEFAULT_EXPORT_DIR
+from gptcli.transcript import EVENT_MESSAGE, TranscriptReader
+
+EXPORT_STATE_FILE = "_export_state.json"
+FORMAT_PARQUET = "parquet"
+FORMAT_ARROW = "arrow"
+EXPORT_FORMATS = (FORMAT_PARQUET, FORMAT_ARROW)
+# Rows per record batch handed to the writer
+BATCH_ROWS = 64 * 1024
+PARTITION_COLUMNS = ("date", "assistant_id")
+
+
+class ExportResult(NamedTuple):
+    files: int
+    skipped_files: int
+    rows: int
+    seconds: float
+
+
+def require_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+        import pyarrow.dataset  # noqa: F401
+    except ImportError:
+        raise ValueError(
+            "Exporting requires the `pyarrow` package: pip install openai-assistants-cli[analytics]"
+        )
+
+
+def message_schema():
+    import pyarrow as pa
+
+    return pa.schema(
+        [
+            ("ts", pa.timestamp("ms", tz="UTC")),
+            ("date", pa.string()),
+            ("assistant_id", pa.string()),
+            ("thread_id", pa.string()),
+            ("transcript", pa.string()),
+            ("turn", pa.int64()),
+            ("role", pa.string()),
+            ("content", pa.large_string()),
+            ("content_chars", pa.int64()),
+            ("run_id", pa.string()),
+            ("message_ids", pa.list_(pa.string())),
+            ("latency_ms", pa.int64()),
+        ]
+    )
+
+
+def _partitioning():
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    return ds.partitioning(
+        pa.schema([(name, pa.string()) for name in PARTITION_COLUMNS]), flavor="hive"
+    )
+
+
+class ExportState:
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, EXPORT_STATE_FILE)
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        self.format: Optional[str] = data.get("format")
+        # Segment key -> offset of the first record that wasn't exported yet
+        self.offsets: Dict[str, int] = data.get("offsets", {})
+        # Path -> [size, mtime_ns] when it was last exported completely
+        self.files: Dict[str, List[int]] = data.get("files", {})
+
+    def save(self):
+        data = {"format": self.format, "offsets": self.offsets, "files": self.files}
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(data, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def _segment_key(reader: TranscriptReader) -> Optional[str]:
+    for _, record in reader.scan():
+        return hashlib.sha1(json.dumps(record, sort_keys=True).encode("utf-8")).hexdigest()
+    return None
+
+
+def _message_rows(
+    reader: TranscriptReader, offset: int, name: str
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    for end, record in reader.scan(offset):
+        if record.get("event") != EVENT_MESSAGE:
+            yield end, {}
+            continue
+        content = record.get("content", "")
+        yield end, {
+            "ts": int(record["ts"] * 1000),
+            "date": time.strftime("%Y-%m-%d", time.gmtime(record["ts"])),
+            "assistant_id": record.get("assistant_id", ""),
+            "thread_id": record.get("thread_id", ""),
+            "transcript": name,
+            "turn": record.get("turn"),
+            "role": record.get("role"),
+            "content": content,
+            "content_chars": len(content),
+            "run_id": record.get("run_id"),
+            "message_ids": [id for id in record.get("message_ids") or [] if id],
+            "latency_ms": record.get("latency_ms"),
+        }
+
+
+def export_transcripts(
+    transcript_paths: List[str], directory: str, format: str = FORMAT_PARQUET
+) -> ExportResult:
+    """
+    Append the messages of `transcript_paths` that weren't exported yet to the dataset in `directory`.
+    """
+    require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {format}. Allowed values: {list(EXPORT_FORMATS)}")
+    started = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    state = ExportState(directory)
+    if state.format not in (None, format):
+        raise ValueError(f"{directory} holds a {state.format} export, can't add {format} files to it")
+    state.format = format
+
+    schema = message_schema()
+    pending: Dict[str, List[int]] = {}
+    counts = {"files": 0, "skipped": 0, "rows": 0}
+
+    def batches() -> Iterator[Any]:
+        columns: Dict[str, List[Any]] = {name: [] for name in schema.names}
+        for path in transcript_paths:
+            stat = os.stat(path)
+            signature = [stat.st_size, stat.st_mtime_ns]
+            if state.files.get(path) == signature:
+                counts["skipped"] += 1
+                continue
+            counts["files"] += 1
+            reader = TranscriptReader(path)
+            key = _segment_key(reader)
+            if key is None:
+                continue
+            offset = state.offsets.get(key, 0)
+            for offset, row in _message_rows(reader, offset, os.path.basename(path)):
+                if not row:
+                    continue
+                for name in schema.names:
+                    columns[name].append(row[name])
+                if len(columns["ts"]) == BATCH_ROWS:
+                    counts["rows"] += BATCH_ROWS
+                    yield pa.RecordBatch.from_pydict(columns, schema=schema)
+                    columns = {name: [] for name in schema.names}
+            state.offsets[key] = offset
+            pending[path] = signature
+        if columns["ts"]:
+            counts["rows"] += len(columns["ts"])
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+    ds.write_dataset(
+        batches(),
+        directory,
+        schema=schema,
+        format="parquet" if format == FORMAT_PARQUET else "ipc",
+        partitioning=_partitioning(),
+        # Every export adds new files next to the earlier ones
+        basename_template=f"part-{time.time_ns()}-{{i}}.{format}",
+        existing_data_behavior="overwrite_or_ignore",
+    )
+    # Only remember progress once the data is safely written
+    state.files.update(pending)
+    state.save()
+    return ExportResult(
+        counts["files"], counts["skipped"], counts["rows"], time.perf_counter() - started
+    )
+
+
+def open_dataset(directory: str):
+    require_pyarrow()
+    import pyarrow.dataset as ds
+
+    format = ExportState(directory).format or FORMAT_PARQUET
+    return ds.dataset(
+        directory,
+        # Without files to infer it from, the dataset would have no columns
+        schema=message_schema(),
+        format="parquet" if format == FORMAT_PARQUET else "ipc",
+        partitioning=_partitioning(),
+    )
+
+
+def compute_stats(directory: str, since: Optional[str] = None, until: Optional[str] = None):
+    """
+    Per-assistant usage aggregates over the exported messages whose UTC date (YYYY-MM-DD) is
+    within [since, until]. Only the columns needed are read, and partitions outside the range aren't.
+    """
+    require_pyarrow()
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    columns = ["assistant_id", "thread_id", "role", "content_chars", "latency_ms"]
+    if not os.path.isdir(directory):
+        table = message_schema().empty_table().select(columns)
+    else:
+        condition = None
+        if since is not None:
+            condition = ds.field("date") >= since
+        if until is not None:
+            upper = ds.field("date") <= until
+            condition = upper if condition is None else condition & upper
+        table = open_dataset(directory).to_table(columns=columns, filter=condition)
+
+    totals = table.group_by("assistant_id").aggregate(
+        [("thread_id", "count_distinct"), ("role", "count")]
+    )
+    turns = (
+        table.filter(pc.equal(table["role"], "user"))
+        .group_by("assistant_id")
+        .aggregate([("role", "count")])
+    )
+    answers = (
+        table.filter(pc.equal(table["role"], "assistant"))
+        .group_by("assistant_id")
+        .aggregate(
+            [
+                ("content_chars", "mean"),
+                ("latency_ms", "tdigest", pc.TDigestOptions(q=[0.5, 0.95])),
+            ]
+        )
+    )
+    stats = (
+        pa.table(
+            {
+                "assistant_id": totals["assistant_id"],
+                "conversations": totals["thread_id_count_distinct"],
+                "messages": totals["role_count"],
+            }
+        )
+        .join(
+            pa.table({"assistant_id": turns["assistant_id"], "turns": turns["role_count"]}),
+            "assistant_id",
+        )
+        .join(
+            pa.table(
+                {
+                    "assistant_id": answers["assistant_id"],
+                    "mean_answer_chars": answers["content_chars_mean"],
+                    "p50_latency_ms": pc.list_element(answers["latency_ms_tdigest"], 0),
+                    "p95_latency_ms": pc.list_element(answers["latency_ms_tdigest"], 1),
+                }
+            ),
+            "assistant_id",
+        )
+    )
+    return stats.sort_by([("messages", "descending")]).select(
+        [
+            "assistant_id",
+            "conversations",
+            "turns",
+            "messages",
+            "mean_answer_chars",
+            "p50_latency_ms",
+            "p95_latency_ms",
+        ]
+    )
+
+
+def format_stats(stats) -> str:
+    if stats.num_rows == 0:
+        return "No exported messages."
+
+    def cell(value) -> str:
+        if value is None:
+            return "-"
+        if isinstance(value, float):
+            return f"{value:,.0f}"
+        return str(value)
+
+    header = ["Assistant", "Conversations", "Turns", "Messages", "Avg answer chars", "p50 latency ms", "p95 latency ms"]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for row in stats.to_pylist():
+        lines.append("| " + " | ".join(cell(value) for value in row.values()) + " |")
+    return "\n".join(lines)
@@ -0,0 +1,586 @@
+"""
+A local stand-in for the parts of the OpenAI Assistants API that gpt-cli uses.
+
+The server keeps threads, messages, runs and files in memory. Latencies, run durations,
+pagination and errors are configurable, so the real `OpenAI` client can be pointed at it to
+test and benchmark the CLI without network access or credentials:
+
+    server = FakeAssistantsServer(FakeServerConfig(run_duration=0.5)).start()
+    client = OpenAI(api_key="fake", base_url=server.url)
+"""
+
+import email.parser
+import email.policy
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from attr import Factory, dataclass
+
+
+def default_response(thread_messages: List[Dict[str, Any]]) -> str:
+    user_messages = [message for message in thread_messages if message["role"] == "user"]
+    if not user_messages:
+        return "Hello!"
+    return "Echo: " + user_messages[-1]["content"][0]["text"]["value"]
+
+
+def no_tool_calls(thread_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return []
+
+
+def no_generated_files(thread_messages: List[Dict[str, Any]]) -> Dict[str, bytes]:
+    return {}
+
+
+@dataclass
+class FakeServerConfig:
+    # Seconds added to every request, and per-route overrides (e.g. {"runs.retrieve": 0.2}).
+    latency: float = 0.0
+    route_latency: Dict[str, float] = Factory(dict)
+    # Probability that a request hangs for `straggler_latency` extra seconds, to model tail latency.
+    straggler_rate: float = 0.0
+    straggler_latency: float = 5.0
+    # Seconds between creating a run and its completion. 0 completes runs on creation.
+    run_duration: float = 0.0
+    # Default page size of list endpoints.
+    page_size: int = 20
+    # Probability that any request fails with `error_status`.
+    error_rate: float = 0.0
+    error_status: int = 500
+    # Builds the assistant's reply from the thread's messages.
+    respond: Callable[[List[Dict[str, Any]]], str] = default_response
+    # The function calls ({"name": ..., "arguments": {...}}) a run makes before it answers. The tool
+    # outputs are appended to the answer.
+    tool_calls: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]] = no_tool_calls
+    # The files a run writes ({filename: content}), cited in its answer. PNG files are sent as images.
+    generated_files: Callable[[List[Dict[str, Any]]], Dict[str, bytes]] = no_generated_files
+    # Probability that a run fails instead of answering.
+    run_failure_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}_{uuid.uuid4().hex[:24]}"
+
+
+class _State:
+    def __init__(self):
+        self.threads: Dict[str, Dict[str, Any]] = {}
+        self.messages: Dict[str, List[Dict[str, Any]]] = {}
+        self.runs: Dict[str, Dict[str, Any]] = {}
+        self.run_started: Dict[str, float] = {}
+        self.files: Dict[str, Tuple[Dict[str, Any], bytes]] = {}
+        # Run id -> the tool outputs submitted for it
+        self.tool_outputs: Dict[str, List[Dict[str, Any]]] = {}
+
+
+ROUTES: List[Tuple[str, str, str]] = [
+    ("GET", r"/v1/assistants/(?P<assistant_id>[^/]+)", "assistants.retrieve"),
+    ("POST", r"/v1/threads", "threads.create"),
+    ("GET", r"/v1/threads/(?P<thread_id>[^/]+)", "threads.retrieve"),
+    ("DELETE", r"/v1/threads/(?P<thread_id>[^/]+)", "threads.delete"),
+    ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/messages", "messages.create"),
+    ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/messages", "messages.list"),
+    ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs", "runs.create"),
+    ("GET", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)", "runs.retrieve"),
+    ("POST", r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/cancel", "runs.cancel"),
+    (
+        "POST",
+        r"/v1/threads/(?P<thread_id>[^/]+)/runs/(?P<run_id>[^/]+)/submit_tool_outputs",
+        "runs.submit_tool_outputs",
+    ),
+    ("POST", r"/v1/files", "files.create"),
+    ("GET", r"/v1/files/(?P<file_id>[^/]+)", "files.retrieve"),
+    ("GET", r"/v1/files/(?P<file_id>[^/]+)/content", "files.content"),
+]
+_COMPILED_ROUTES = [(method, re.compile(pattern + "$"), name) for method, pattern, name in ROUTES]
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Load tests open hundreds of connections at once, the default backlog is 5.
+    request_queue_size = 1024
+
+
+class FakeAssistantsServer:
+    def __init__(self, config: Optional[FakeServerConfig] = None, port: int = 0):
+        self.config = config or FakeServerConfig()
+        self.state = _State()
+        self.lock = threading.Lock()
+        self.request_counts: Counter = Counter()
+        self.random = random.Random(self.config.seed)
+        self._fail_next: List[int] = []
+        self.httpd = _HTTPServer(("127.0.0.1", port), self._handler_class())
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeAssistantsServer":
+        self.thread = threading.Thread(
+            target=self.httpd.serve_forever, name="gptcli-fake-server", daemon=True
+        )
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeAssistantsServer":
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def inject_errors(self, count: int = 1, status: int = 500):
+        """
+        Make the next `count` requests fail with `status`.
+        """
+        with self.lock:
+            self._fail_next.extend([status] * count)
+
+    def reset_counts(self):
+        with self.lock:
+            self.request_counts.clear()
+
+    def seed_thread(self, message_count: int) -> str:
+        """
+        Create a thread that already holds `message_count` alternating user/assistant messages.
+        """
+        with self.lock:
+            thread = self._create_thread({})
+            for i in range(message_count):
+                role = "user" if i % 2 == 0 else "assistant"
+                self._append_message(thread["id"], role, f"Message {i} " + "lorem ipsum " * 20)
+        return thread["id"]
+
+    def add_file(self, filename: str, data: bytes, purpose: str = "assistants_output") -> str:
+        """
+        Store a file as if the assistant had generated it and return its id.
+        """
+        file = {
+            "id": _new_id("file"),
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "status_details": None,
+        }
+        with self.lock:
+            self.state.files[file["id"]] = (file, data)
+        return file["id"]
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                server._handle(self, "GET")
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+            def do_DELETE(self):
+                server._handle(self, "DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _handle(self, request: BaseHTTPRequestHandler, method: str):
+        parsed = urlparse(request.path)
+        length = int(request.headers.get("Content-Length") or 0)
+        body = request.rfile.read(length) if length else b""
+        route, params = self._match(method, parsed.path)
+
+        with self.lock:
+            self.request_counts[route or "unknown"] += 1
+            forced_status = self._fail_next.pop(0) if self._fail_next else None
+            straggler = bool(self.config.straggler_rate) and self.random.random() < self.config.straggler_rate
+        delay = self.config.route_latency.get(route or "", self.config.latency)
+        if straggler:
+            delay += self.config.straggler_latency
+        if delay:
+            time.sleep(delay)
+
+        try:
+            if route is None:
+                raise ApiError(404, f"Unknown route {method} {parsed.path}")
+            if forced_status is not None:
+                raise ApiError(forced_status, "Injected error")
+            if self.config.error_rate and self.random.random() < self.config.error_rate:
+                raise ApiError(self.config.error_status, "Injected error")
+            query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+            result = getattr(self, "_" + route.replace(".", "_"))(
+                request, params, query, body
+            )
+        except Exception as e:
+            status = e.status if isinstance(e, ApiError) else 500
+            message = e.message if isinstance(e, ApiError) else repr(e)
+            self._send_json(
+                request,
+                status,
+                {"error": {"message": message, "type": "fake_server_error", "code": None}},
+            )
+            return
+
+        if isinstance(result, tuple):
+            self._send_bytes(request, *result)
+        else:
+            self._send_json(request, 200, result)
+
+    def _match(self, method: str, path: str):
+        for route_method, pattern, name in _COMPILED_ROUTES:
+            if route_method != method:
+                continue
+            match = pattern.match(path)
+            if match:
+                return name, match.groupdict()
+        return None, {}
+
+    def _send_json(self, request: BaseHTTPRequestHandler, status: int, payload: Any):
+        data = json.dumps(payload).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def _send_bytes(
+        self,
+        request: BaseHTTPRequestHandler,
+        status: int,
+        data: bytes,
+        headers: Dict[str, str],
+    ):
+        request.send_response(status)
+        request.send_header("Content-Type", "application/octet-stream")
+        request.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    # State helpers, called with the lock held
+
+    def _thread(self, thread_id: str) -> Dict[str, Any]:
+        if thread_id not in self.state.threads:
+            raise ApiError(404, f"No thread found with id '{thread_id}'.")
+        return self.state.threads[thread_id]
+
+    def _create_thread(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        thread = {
+            "id": _new_id("thread"),
+            "object": "thread",
+            "created_at": int(time.time()),
+            "metadata": payload.get("metadata") or {},
+        }
+        self.state.threads[thread["id"]] = thread
+        self.state.messages[thread["id"]] = []
+        for message in payload.get("messages") or []:
+            self._append_message(
+                thread["id"], message.get("role", "user"), message["content"], message.get("file_ids")
+            )
+        return thread
+
+    def _append_message(
+        self,
+        thread_id: str,
+        role: str,
+        content: str,
+        file_ids: Optional[List[str]] = None,
+        assistant_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        annotations: Optional[List[Dict[str, Any]]] = None,
+        image_file_ids: Optional[List[str]] = None,
+    ) -> Dict[str, Any]:
+        message = {
+            "id": _new_id("msg"),
+            "object": "thread.message",
+            "created_at": int(time.time()),
+            "thread_id": thread_id,
+            "role": role,
+            "content": [
+                *({"type": "image_file", "image_file": {"file_id": file_id}} for file_id in image_file_ids or []),
+                {"type": "text", "text": {"value": content, "annotations": annotations or []}},
+            ],
+            "file_ids": file_ids or [],
+            "assistant_id": assistant_id,
+            "run_id": run_id,
+            "metadata": {},
+        }
+        self.state.messages[thread_id].append(message)
+        return message
+
+    def _advance_run(self, run: Dict[str, Any]):
+        if run["status"] not in ("queued", "in_progress"):
+            return
+        elapsed = time.monotonic() - self.state.run_started[run["id"]]
+        if elapsed < self.config.run_duration:
+            run["status"] = "in_progress"
+            run["started_at"] = run["started_at"] or int(time.time())
+            return
+        self._complete_run(run)
+
+    def _complete_run(self, run: Dict[str, Any]):
+        messages = self.state.messages[run["thread_id"]]
+        run["started_at"] = run["started_at"] or int(time.time())
+        if run["id"] not in self.state.tool_outputs:
+            calls = self.config.tool_calls(messages)
+            if calls:
+                run["status"] = "requires_action"
+                run["required_action"] = {
+                    "type": "submit_tool_outputs",
+                    "submit_tool_outputs": {
+                        "tool_calls": [
+                            {
+                                "id": _new_id("call"),
+                                "type": "function",
+                                "function": {"name": call["name"], "arguments": json.dumps(call["arguments"])},
+                            }
+                            for call in calls
+                        ]
+                    },
+                }
+                return
+        if self.config.run_failure_rate and self.random.random() < self.config.run_failure_rate:
+            run["status"] = "failed"
+            run["failed_at"] = int(time.time())
+            run["last_error"] = {"code": "server_error", "message": "Sorry, something went wrong."}
+            return
+        reply = self.config.respond(messages)
+        outputs = self.state.tool_outputs.get(run["id"])
+        if outputs:
+            reply += "\n" + "\n".join(output["output"] for output in outputs)
+        annotations: List[Dict[str, Any]] = []
+        image_file_ids: List[str] = []
+        for filename, data in self.config.generated_files(messages).items():
+            file = self._add_file(f"/mnt/data/{filename}", data, "assistants_output")
+            if filename.endswith(".png"):
+                image_file_ids.append(file["id"])
+                continue
+            link = f"sandbox:/mnt/data/{filename}"
+            reply += " " + link
+            annotations.append(
+                {
+                    "type": "file_path",
+                    "text": link,
+                    "start_index": len(reply) - len(link),
+                    "end_index": len(reply),
+                    "file_path": {"file_id": file["id"]},
+                }
+            )
+        self._append_message(
+            run["thread_id"],
+            "assistant",
+            reply,
+            assistant_id=run["assistant_id"],
+            run_id=run["id"],
+            annotations=annotations,
+            image_file_ids=image_file_ids,
+        )
+        run["status"] = "completed"
+        run["started_at"] = run["started_at"] or int(time.time())
+        run["completed_at"] = int(time.time())
+
+    # Route handlers
+
+    def _assistants_retrieve(self, request, params, query, body):
+        return {
+            "id": params["assistant_id"],
+            "object": "assistant",
+            "created_at": int(time.time()),
+            "name": "Fake assistant",
+            "description": None,
+            "model": "gpt-4-1106-preview",
+            "instructions": "",
+            "tools": [],
+            "file_ids": [],
+            "metadata": {},
+        }
+
+    def _threads_create(self, request, params, query, body):
+        with self.lock:
+            return self._create_thread(json.loads(body or b"{}"))
+
+    def _threads_retrieve(self, request, params, query, body):
+        with self.lock:
+            return self._thread(params["thread_id"])
+
+    def _threads_delete(self, request, params, query, body):
+        with self.lock:
+            self._thread(params["thread_id"])
+            del self.state.threads[params["thread_id"]]
+            del self.state.messages[params["thread_id"]]
+        return {"id": params["thread_id"], "object": "thread.deleted", "deleted": True}
+
+    def _messages_create(self, request, params, query, body):
+        payload = json.loads(body)
+        with self.lock:
+            self._thread(params["thread_id"])
+            return self._append_message(
+                params["thread_id"], payload.get("role", "user"), payload["content"], payload.get("file_ids")
+            )
+
+    def _messages_list(self, request, params, query, body):
+        with self.lock:
+            self._thread(params["thread_id"])
+            messages = list(self.state.messages[params["thread_id"]])
+        if query.get("order", "desc") == "desc":
+            messages.reverse()
+        ids = [message["id"] for message in messages]
+        if "after" in query:
+            messages = messages[ids.index(query["after"]) + 1 :] if query["after"] in ids else []
+        elif "before" in query:
+            messages = messages[: ids.index(query["before"])] if query["before"] in ids else []
+        limit = int(query.get("limit", self.config.page_size))
+        page = messages[:limit]
+        return {
+            "object": "list",
+            "data": page,
+            "first_id": page[0]["id"] if page else None,
+            "last_id": page[-1]["id"] if page else None,
+            "has_more": len(messages) > limit,
+        }
+
+    def _runs_create(self, request, params, query, body):
+        payload = json.loads(body)
+        with self.lock:
+            self._thread(params["thread_id"])
+            run = {
+                "id": _new_id("run"),
+                "object": "thread.run",
+                "created_at": int(time.time()),
+                "assistant_id": payload["assistant_id"],
+                "thread_id": params["thread_id"],
+                "status": "queued",
+                "required_action": None,
+                "last_error": None,
+                "expires_at": int(time.time()) + 600,
+                "started_at": None,
+                "cancelled_at": None,
+                "failed_at": None,
+                "completed_at": None,
+                "model": payload.get("model") or "gpt-4-1106-preview",
+                "instructions": payload.get("instructions") or "",
+                "tools": payload.get("tools") or [],
+                "file_ids": [],
+                "metadata": payload.get("metadata") or {},
+            }
+            self.state.runs[run["id"]] = run
+            self.state.run_started[run["id"]] = time.monotonic()
+            if self.config.run_duration <= 0:
+                self._complete_run(run)
+            return dict(run)
+
+    def _run(self, params) -> Dict[str, Any]:
+        self._thread(params["thread_id"])
+        run = self.state.runs.get(params["run_id"])
+        if run is None or run["thread_id"] != params["thread_id"]:
+            raise ApiError(404, f"No run found with id '{params['run_id']}'.")
+        return run
+
+    def _runs_retrieve(self, request, params, query, body):
+        with self.lock:
+            run = self._run(params)
+            self._advance_run(run)
+            return dict(run)
+
+    def _runs_cancel(self, request, params, query, body):
+        with self.lock:
+            run = self._run(params)
+            if run["status"] in ("queued", "in_progress", "requires_action"):
+                run["status"] = "cancelled"
+                run["cancelled_at"] = int(time.time())
+            return dict(run)
+
+    def _runs_submit_tool_outputs(self, request, params, query, body):
+        payload = json.loads(body)
+        with self.lock:
+            run = self._run(params)
+            if run["status"] != "requires_action":
+                raise ApiError(400, f"Runs in status {run['status']} do not accept tool outputs.")
+            expected = {call["id"] for call in run["required_action"]["submit_tool_outputs"]["tool_calls"]}
+            if {output["tool_call_id"] for output in payload["tool_outputs"]} != expected:
+                raise ApiError(400, "Tool outputs must be submitted for all tool calls at once.")
+            self.state.tool_outputs[run["id"]] = payload["tool_outputs"]
+            run["status"] = "queued"
+            run["required_action"] = None
+            self.state.run_started[run["id"]] = time.monotonic()
+            if self.config.run_duration <= 0:
+                self._complete_run(run)
+            return dict(run)
+
+    def _files_create(self, request, params, query, body):
+        message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+            b"Content-Type: " + request.headers["Content-Type"].encode() + b"\r\n\r\n" + body
+        )
+        fields: Dict[str, Any] = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        if "file" not in fields:
+            raise ApiError(400, "Missing file")
+        filename, data = fields["file"]
+        purpose = (fields.get("purpose") or (None, b"assistants"))[1].decode()
+        with self.lock:
+            return self._add_file(filename or "upload", data, purpose)
+
+    def _add_file(self, filename: str, data: bytes, purpose: str) -> Dict[str, Any]:
+        file = {
+            "id": _new_id("file"),
+            "object": "file",
+            "bytes": len(data),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "status_details": None,
+        }
+        self.state.files[file["id"]] = (file, data)
+        return file
+
+    def _file(self, file_id: str):
+        if file_id not in self.state.files:
+            raise ApiError(404, f"No such File object: {file_id}")
+        return self.state.files[file_id]
+
+    def _files_retrieve(self, request, params, query, body):
+        with self.lock:
+            return self._file(params["file_id"])[0]
+
+    def _files_content(self, request, params, query, body):
+        with self.lock:
+            _, data = self._file(params["file_id"])
+        range_header = request.headers.get("Range")
+        match = re.match(r"bytes=(\d+)-$", range_header or "")
+        if match:
+            start = int(match.group(1))
+            return (
+                206,
+                data[start:],
+                {"Content-Range": f"bytes {start}-{len(data) - 1}/{len(data)}"},
+            )
+        return 200, data, {}
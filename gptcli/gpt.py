@@ -12,33 +12,68 @@ MIN_PYTHON = (3, 9)
 if sys.version_info < MIN_PYTHON:
     sys.exit("Python %s.%s or later is required.\n" % MIN_PYTHON)
 
+import cProfile
+import logging
 import os
-from typing import cast
+import pstats
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, cast
 import argparse
 import sys
 
+import tiktoken
+from openai import OpenAI, OpenAIError
+from rich.console import Console
+from rich.markdown import Markdown
+
 
 from gptcli.assistant import (
     AssistantThread,
     DEFAULT_ASSISTANTS,
     AssistantGlobalArgs,
     init_assistant,
+    resolve_assistant_config,
 )
+from gptcli.attachments import UploadCache, Uploader
+from gptcli.cassette import make_openai_client
 from gptcli.cli import (
     CLIChatListener,
     CLIUserInputProvider,
 )
-from gptcli.composite import CompositeChatListener
+from gptcli.composite import AsyncChatListener, CompositeChatListener
 from gptcli.config import (
     CONFIG_FILE_PATHS,
     GptCliConfig,
     choose_config_file,
     read_yaml_config,
 )
+from gptcli.daemon import DaemonAssistantThread, DaemonClient
+from gptcli import encodings
+from gptcli.downloads import Downloader
+from gptcli.hedging import HedgePolicy, Hedger
 from gptcli.logging_utils import LoggingChatListener
 from gptcli.persist import PersistChatListener
-from gptcli.cost import PriceChatListener
-from gptcli.session import ChatSession
+from gptcli.rollover import ENCODING, RolloverPolicy
+from gptcli.cost import DraftEstimator, PriceChatListener, UsageMetricsChatListener
+from gptcli.search import SearchIndex, SearchIndexChatListener
+from gptcli.metrics import metrics_enabled, serve_metrics
+from gptcli.branches import BranchStore
+from gptcli.multisession import MultiChatSession
+from gptcli.session import ChatListener, ChatSession, InvalidArgumentError, format_search_hits
+from gptcli.tools import ToolRegistry
+from gptcli.trace import start_tracing, stop_tracing
+from gptcli.types import Message
+from gptcli.wal import RunLog
+from gptcli.transcript import (
+    TRANSCRIPT_SUFFIX,
+    TranscriptReader,
+    records_from_turn,
+    replay_transcript,
+    transcript_segments,
+)
 
 default_exception_handler = sys.excepthook
 
@@ -96,6 +131,68 @@ def parse_args(config: GptCliConfig):
         help="Disable price logging.",
         default=config.show_price,
     )
+    parser.add_argument(
+        "--file",
+        type=str,
+        action="append",
+        dest="files",
+        default=[],
+        help="Upload a file and attach it to the first message. Can be given several times.",
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        default=False,
+        help="Attach to the warm session daemon started with `openai-assistants-cli serve` instead of connecting to OpenAI directly. Falls back to a direct connection if it isn't running.",
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="Record every API request and response of the session to a cassette in DIR.",
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        default=None,
+        metavar="DIR",
+        help="Replay the session recorded in DIR with --record instead of calling the API.",
+    )
+    parser.add_argument(
+        "--replay_speed",
+        type=float,
+        default=0.0,
+        help="With --replay, wait this fraction of the recorded response and polling times (1 is real time, 0, the default, doesn't wait).",
+    )
+    parser.add_argument(
+        "--profile",
+        type=str,
+        nargs="?",
+        const="gptcli.prof",
+        default=None,
+        help="Profile the chat session, including the threads that wait for answers, and write the pstats data to this file (default: gptcli.prof) on exit.",
+    )
+    parser.add_argument(
+        "--trace",
+        type=str,
+        nargs="?",
+        const="gptcli-trace.json",
+        default=None,
+        help="Record API calls, listener callbacks and rendering as Chrome trace events and write them to this file (default: gptcli-trace.json) on exit. Open it in chrome://tracing or https://ui.perfetto.dev.",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=config.metrics_port,
+        help="Serve Prometheus metrics on http://localhost:PORT/metrics.",
+    )
+    parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default=config.metrics_host,
+        help="The address to serve metrics on. Defaults to 127.0.0.1, use 0.0.0.0 to expose them on every interface.",
+    )
     parser.add_argument(
         "--version",
         "-v",
@@ -107,47 +204,725 @@ def parse_args(config: GptCliConfig):
     return parser.parse_args()
 
 
+def parse_time(value: Optional[str]) -> Optional[float]:
+    if value is None:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+def replay(config: GptCliConfig, argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli replay",
+        description="Render a stored transcript as if the conversation was happening now.",
+    )
+    parser.add_argument(
+        "transcript",
+        type=str,
+        help="Path to a .jsonl transcript. Its rotated segments are replayed as well.",
+    )
+    parser.add_argument(
+        "--turn",
+        type=int,
+        default=None,
+        help="Start replaying at this turn.",
+    )
+    parser.add_argument(
+        "--since",
+        type=str,
+        default=None,
+        help="Only replay events at or after this ISO 8601 time.",
+    )
+    parser.add_argument(
+        "--until",
+        type=str,
+        default=None,
+        help="Only replay events at or before this ISO 8601 time.",
+    )
+    parser.add_argument(
+        "--no_markdown",
+        action="store_false",
+        dest="markdown",
+        help="Disable markdown formatting.",
+        default=config.markdown,
+    )
+    args = parser.parse_args(argv)
+
+    segments = transcript_segments(args.transcript) or [args.transcript]
+    listener = CLIChatListener(args.markdown)
+    console = Console()
+    if args.turn is not None:
+        replay_transcript(records_from_turn(segments, args.turn), listener, console)
+        return
+    for segment in segments:
+        records = TranscriptReader(segment).time_range(parse_time(args.since), parse_time(args.until))
+        replay_transcript(records, listener, console)
+
+
+def stored_transcripts(config: GptCliConfig) -> List[str]:
+    """
+    All transcript segments in `transcript_dir`, oldest segment of each conversation first.
+    """
+    transcript_dir = os.path.expanduser(config.transcript_dir)
+    paths = []
+    if os.path.isdir(transcript_dir):
+        for name in sorted(os.listdir(transcript_dir)):
+            if name.endswith(TRANSCRIPT_SUFFIX):
+                paths += transcript_segments(os.path.join(transcript_dir, name))
+    return paths
+
+
+def search(config: GptCliConfig, argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli search",
+        description="Search all past conversations.",
+    )
+    parser.add_argument(
+        "query",
+        type=str,
+        nargs="*",
+        help="The words to search for.",
+    )
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=10,
+        help="The maximum number of results to show.",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        default=False,
+        help="Rebuild the index from the stored transcripts before searching.",
+    )
+    args = parser.parse_args(argv)
+
+    if not config.search_index_path:
+        print("Search is disabled. Set `search_index_path` in ~/.config/gpt-cli/gpt.yml")
+        sys.exit(1)
+
+    index = SearchIndex(os.path.expanduser(config.search_index_path))
+    if args.rebuild:
+        paths = stored_transcripts(config)
+        count = index.rebuild(paths)
+        print(f"Indexed {count} messages from {len(paths)} transcripts.")
+
+    query = " ".join(args.query)
+    if query:
+        Console().print(Markdown(format_search_hits(query, index.search(query, args.limit))))
+
+
+def export(config: GptCliConfig, argv: List[str]):
+    from gptcli.export import EXPORT_FORMATS, FORMAT_PARQUET, export_transcripts
+
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli export",
+        description="Export new messages from the stored transcripts to a columnar dataset, partitioned by date and assistant.",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default=config.export_dir,
+        help="The dataset directory.",
+    )
+    parser.add_argument(
+        "--format",
+        choices=EXPORT_FORMATS,
+        default=FORMAT_PARQUET,
+        help="Parquet, or Arrow IPC files for the fastest local reads.",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        result = export_transcripts(
+            stored_transcripts(config), os.path.expanduser(args.out), args.format
+        )
+    except (ValueError, OSError) as e:
+        print(e)
+        sys.exit(1)
+    print(
+        f"Exported {result.rows} messages from {result.files} transcripts "
+        f"({result.skipped_files} unchanged) in {result.seconds:.1f}s."
+    )
+
+
+def stats(config: GptCliConfig, argv: List[str]):
+    from gptcli.export import compute_stats, format_stats
+
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli stats",
+        description="Summarize assistant usage from the dataset written by `openai-assistants-cli export`.",
+    )
+    parser.add_argument(
+        "--out",
+        type=str,
+        default=config.export_dir,
+        help="The dataset directory.",
+    )
+    parser.add_argument(
+        "--since",
+        type=str,
+        default=None,
+        help="Only count messages on or after this UTC date (YYYY-MM-DD).",
+    )
+    parser.add_argument(
+        "--until",
+        type=str,
+        default=None,
+        help="Only count messages on or before this UTC date (YYYY-MM-DD).",
+    )
+    args = parser.parse_args(argv)
+
+    directory = os.path.expanduser(args.out)
+    if not os.path.isdir(directory):
+        print(f"Nothing exported to {directory} yet. Run `openai-assistants-cli export` first.")
+        sys.exit(1)
+    try:
+        table = compute_stats(directory, args.since, args.until)
+    except (ValueError, OSError) as e:
+        print(e)
+        sys.exit(1)
+    Console().print(Markdown(format_stats(table)))
+
+
+def tokenizer(config: GptCliConfig, argv: List[str]):
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli tokenizer",
+        description="Manage the local tokenizer cache used to count tokens without network access.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser(
+        "build", help="Download encodings with tiktoken and write them to the cache."
+    )
+    build_parser.add_argument(
+        "encodings",
+        type=str,
+        nargs="*",
+        default=[ENCODING],
+        help=f"Names of the encodings to cache (default: {ENCODING}).",
+    )
+    build_parser.add_argument(
+        "--dir",
+        type=str,
+        default=config.tokenizer_cache_dir,
+        required=config.tokenizer_cache_dir is None,
+        help="The cache directory (default: `tokenizer_cache_dir`).",
+    )
+    args = parser.parse_args(argv)
+
+    for name in args.encodings:
+        path = encodings.write_encoding_cache(tiktoken.get_encoding(name), args.dir)
+        print(f"Wrote {path} ({os.path.getsize(path)} bytes).")
+
+
+def serve(config: GptCliConfig, argv: List[str]):
+    from gptcli.daemon import AssistantDaemon
+
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli serve",
+        description="Run a daemon that keeps assistant sessions warm for `openai-assistants-cli --daemon`.",
+    )
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=config.daemon_socket,
+        help="The Unix socket to listen on.",
+    )
+    parser.add_argument(
+        "--spare_threads",
+        type=int,
+        default=config.daemon_spare_threads,
+        help="How many OpenAI threads to create ahead of time.",
+    )
+    parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=config.metrics_port,
+        help="Serve Prometheus metrics on http://localhost:PORT/metrics.",
+    )
+    parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default=config.metrics_host,
+        help="The address to serve metrics on. Defaults to 127.0.0.1, use 0.0.0.0 to expose them on every interface.",
+    )
+    args = parser.parse_args(argv)
+
+    if not config.api_key or not config.openai_api_key:
+        print(
+            "No API key found. Please set the OPENAI_API_KEY environment variable or `api_key: <key>` value in ~/.config/gpt-cli/gpt.yml"
+        )
+        sys.exit(1)
+
+    socket_path = os.path.expanduser(args.socket)
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port, args.metrics_host)
+    daemon = AssistantDaemon(
+        config.assistants,
+        socket_path,
+        openai_client=make_openai_client(measure=args.metrics_port is not None),
+        spare_threads=args.spare_threads,
+        tool_registry=make_tool_registry(config),
+    )
+    # Exit through serve_forever's cleanup, which removes the socket, on `kill` as well.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print(f"Listening on {socket_path}")
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def batch(config: GptCliConfig, argv: List[str]):
+    from gptcli.batch import (
+        DEFAULT_LEASE_SECONDS,
+        DEFAULT_SHARD_SIZE,
+        BatchDirectory,
+        BatchWorker,
+        format_batch_status,
+        read_prompts,
+    )
+
+    parser = argparse.ArgumentParser(
+        prog="openai-assistants-cli batch",
+        description="Answer a large set of prompts with workers on any number of machines sharing a directory.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    init_parser = commands.add_parser("init", help="Create a batch from a file of prompts.")
+    init_parser.add_argument("directory", type=str)
+    init_parser.add_argument(
+        "--prompts",
+        type=str,
+        required=True,
+        help="A .jsonl file of {\"prompt\": ..., \"id\": ...} objects, or a text file with one prompt per line.",
+    )
+    init_parser.add_argument(
+        "--assistant",
+        type=str,
+        default=config.default_assistant,
+        help="The assistant that answers the prompts.",
+    )
+    init_parser.add_argument(
+        "--shard_size",
+        type=int,
+        default=DEFAULT_SHARD_SIZE,
+        help="How many prompts a worker claims at a time.",
+    )
+    work_parser = commands.add_parser("work", help="Answer prompts until the batch is done.")
+    work_parser.add_argument("directory", type=str)
+    work_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="How many prompts this worker runs at once.",
+    )
+    work_parser.add_argument(
+        "--lease_seconds",
+        type=float,
+        default=DEFAULT_LEASE_SECONDS,
+        help="How long a claimed shard stays reserved without a heartbeat from its worker.",
+    )
+    work_parser.add_argument(
+        "--metrics_port",
+        type=int,
+        default=config.metrics_port,
+        help="Serve Prometheus metrics on http://localhost:PORT/metrics.",
+    )
+    work_parser.add_argument(
+        "--metrics_host",
+        type=str,
+        default=config.metrics_host,
+        help="The address to serve metrics on. Defaults to 127.0.0.1, use 0.0.0.0 to expose them on every interface.",
+    )
+    status_parser = commands.add_parser("status", help="Show the progress of a batch.")
+    status_parser.add_argument("directory", type=str)
+    status_parser.add_argument(
+        "--watch",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Refresh the status every SECONDS until the batch is done.",
+    )
+    args = parser.parse_args(argv)
+
+    if args.command == "init":
+        if args.assistant not in config.assistants and args.assistant not in DEFAULT_ASSISTANTS:
+            print(f"Unknown assistant: {args.assistant}")
+            sys.exit(1)
+        directory = BatchDirectory.create(
+            args.directory, args.assistant, read_prompts(args.prompts), args.shard_size
+        )
+        status = directory.status()
+        print(f"Created a batch of {status.items} prompts in {status.shards} shards.")
+        return
+
+    directory = BatchDirectory(args.directory)
+    if args.command == "status":
+        while True:
+            status = directory.status()
+            print(format_batch_status(status))
+            if args.watch is None or status.done_shards == status.shards:
+                return
+            time.sleep(args.watch)
+            print()
+
+    if not config.api_key or not config.openai_api_key:
+        print(
+            "No API key found. Please set the OPENAI_API_KEY environment variable or `api_key: <key>` value in ~/.config/gpt-cli/gpt.yml"
+        )
+        sys.exit(1)
+
+    name = directory.assistant
+    assistant_config = resolve_assistant_config(
+        name, config.assistants.get(name) or DEFAULT_ASSISTANTS.get(name) or {}
+    )
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port, args.metrics_host)
+    openai_client = make_openai_client(measure=args.metrics_port is not None) or OpenAI()
+    # Every worker thread has its own AssistantThread, they all share the client and the handle.
+    assistant_handle = openai_client.beta.assistants.retrieve(assistant_config.get("id"))
+    tool_registry = make_tool_registry(config)
+
+    def make_assistant() -> AssistantThread:
+        assistant = AssistantThread(assistant_config, openai_client, assistant_handle)
+        assistant.tool_registry = tool_registry
+        return assistant
+
+    worker = BatchWorker(
+        directory,
+        make_assistant,
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+        on_progress=lambda shard, done, total: print(f"shard {shard}: {done}/{total}"),
+    )
+    print(f"Worker {worker.worker_id} started.")
+    try:
+        finished = worker.run()
+    except KeyboardInterrupt:
+        # The leases of unfinished shards expire and other workers pick them up.
+        worker.stop()
+        return
+    print(f"Batch done. This worker finished {finished} shards.")
+
+
+SUBCOMMANDS = {
+    "replay": replay,
+    "search": search,
+    "export": export,
+    "stats": stats,
+    "serve": serve,
+    "batch": batch,
+    "tokenizer": tokenizer,
+}
+
+
+def rollover_policy(config: GptCliConfig) -> Optional[RolloverPolicy]:
+    policy = RolloverPolicy(
+        max_messages=config.thread_max_messages,
+        max_tokens=config.thread_max_tokens,
+        keep_turns=config.thread_keep_turns,
+    )
+    return policy if policy.enabled else None
+
+
+def make_hedger(config: GptCliConfig) -> Optional[Hedger]:
+    if config.hedge_budget <= 0:
+        return None
+    return Hedger(HedgePolicy(quantile=config.hedge_quantile, budget=config.hedge_budget))
+
+
+def make_tool_registry(config: GptCliConfig) -> Optional[ToolRegistry]:
+    if not config.tools:
+        return None
+    return ToolRegistry.from_config(config.tools, max_workers=config.tool_concurrency)
+
+
+def attach_to_daemon(args, config: GptCliConfig) -> Optional[DaemonAssistantThread]:
+    try:
+        client = DaemonClient(os.path.expanduser(config.daemon_socket))
+    except OSError:
+        print(
+            f"No daemon is listening on {config.daemon_socket}, connecting to OpenAI directly.",
+            file=sys.stderr,
+        )
+        return None
+    return DaemonAssistantThread(client, args.assistant_name)
+
+
 def main():
     config_file_path = choose_config_file(CONFIG_FILE_PATHS)
     if config_file_path:
         config = read_yaml_config(config_file_path)
     else:
         config = GptCliConfig()
+
+    if config.tokenizer_cache_dir:
+        encodings.set_cache_dir(config.tokenizer_cache_dir)
+    if len(sys.argv) > 1 and sys.argv[1] in SUBCOMMANDS:
+        SUBCOMMANDS[sys.argv[1]](config, sys.argv[2:])
+        return
+
     args = parse_args(config)
 
-    if not config.api_key or not config.openai_api_key:
+    assistant = attach_to_daemon(args, config) if args.daemon else None
+
+    if assistant is None and not args.replay and (not config.api_key or not config.openai_api_key):
         print(
             "No API key found. Please set the OPENAI_API_KEY environment variable or `api_key: <key>` value in ~/.config/gpt-cli/gpt.yml"
         )
         sys.exit(1)
 
-    assistant = init_assistant(cast(AssistantGlobalArgs, args), config.assistants)
-    run_interactive(args, assistant)
+    if args.trace:
+        start_tracing()
+    if args.metrics_port is not None:
+        serve_metrics(args.metrics_port, args.metrics_host)
+    try:
+        if assistant is None:
+            assistant = init_assistant(
+                cast(AssistantGlobalArgs, args),
+                config.assistants,
+                make_openai_client(
+                    args.record, args.replay, args.replay_speed, measure=args.metrics_port is not None
+                ),
+            )
+            if args.replay:
+                assistant.poll_interval *= args.replay_speed
+            else:
+                # Replayed responses don't hang, and duplicates would use up the cassette
+                assistant.hedger = make_hedger(config)
+            if config.request_timeout is not None:
+                # Requests that time out are retried by the client
+                assistant.openai_client = assistant.openai_client.with_options(
+                    timeout=config.request_timeout
+                )
+            assistant.rollover_policy = rollover_policy(config)
+            assistant.tool_registry = make_tool_registry(config)
+            if config.thread_max_tokens is not None:
+                encodings.prefetch(ENCODING)
+        run_interactive(args, assistant, config)
+    finally:
+        if getattr(assistant, "hedger", None) is not None:
+            logging.getLogger("gptcli-session").info(f"Hedged requests: {assistant.hedger.stats}")
+        if args.trace:
+            stop_tracing(args.trace)
+            print(f"Trace written to {args.trace}")
 
 class CLIChatSession(ChatSession):
-    def __init__(self, assistant: AssistantThread, markdown: bool, show_price: bool):
+    def __init__(
+        self,
+        assistant: AssistantThread,
+        markdown: bool,
+        show_price: bool,
+        config: GptCliConfig,
+        search_index: Optional[SearchIndex] = None,
+        uploader: Optional[Uploader] = None,
+        welcome: bool = True,
+        messages: Optional[List[Message]] = None,
+    ):
+        # The terminal renderer and the transcript writer (which already writes from its own
+        # thread) are called inline, everything else can be moved off the session thread.
         listeners = [
-            CLIChatListener(markdown),
-            LoggingChatListener(),
-            PersistChatListener(assistant.get_thread_id(), assistant.get_assistant_id()),
+            CLIChatListener(markdown, welcome=welcome),
+            PersistChatListener(
+                assistant,
+                directory=os.path.expanduser(config.transcript_dir),
+                durability=config.transcript_durability,
+                fsync_interval=config.transcript_fsync_interval,
+                max_bytes=config.transcript_max_bytes,
+                compression=config.transcript_compression,
+            ),
         ]
+        background_listeners: List[ChatListener] = [LoggingChatListener()]
+        if metrics_enabled():
+            background_listeners.append(UsageMetricsChatListener(assistant))
+
+        if search_index is not None:
+            background_listeners.append(SearchIndexChatListener(assistant, search_index))
 
         # TODO: Implement price for chatgpt Assistants
         # if show_price:
         #     listeners.append(PriceChatListener(assistant))
 
+        if config.listener_dispatch == "async":
+            background_listeners = [
+                AsyncChatListener(
+                    listener,
+                    max_queue_size=config.listener_queue_size,
+                    backpressure=config.listener_backpressure,
+                )
+                for listener in background_listeners
+            ]
+        listeners += background_listeners
+
         listener = CompositeChatListener(listeners)
-        super().__init__(assistant, listener)
+        super().__init__(
+            assistant, listener, search_index=search_index, uploader=uploader, messages=messages
+        )
+
+
+def thread_opener(first, config: GptCliConfig) -> Callable[[str], AssistantThread]:
+    """
+    Open threads of any configured assistant that share the client, hedger and settings of `first`.
+    """
+    if isinstance(first, DaemonAssistantThread):
+
+        def open_daemon_thread(name: str):
+            # Each thread gets its own connection, so runs don't wait for each other
+            try:
+                return DaemonAssistantThread(DaemonClient(os.path.expanduser(config.daemon_socket)), name)
+            except OSError as e:
+                raise InvalidArgumentError(f"Can't connect to the daemon: {e}")
+
+        return open_daemon_thread
+
+    # Assistants are retrieved once however many threads use them
+    handles = {first.assistant_handle.id: first.assistant_handle}
+
+    def open_thread(name: str) -> AssistantThread:
+        assistant_config = config.assistants.get(name, DEFAULT_ASSISTANTS.get(name))
+        if assistant_config is None:
+            raise InvalidArgumentError(f"Unknown assistant: {name}")
+        assistant_config = resolve_assistant_config(name, assistant_config)
+        assistant = AssistantThread(
+            assistant_config, first.openai_client, handles.get(assistant_config.get("id"))
+        )
+        handles.setdefault(assistant.assistant_handle.id, assistant.assistant_handle)
+        assistant.poll_interval = first.poll_interval
+        assistant.hedger = first.hedger
+        assistant.rollover_policy = first.rollover_policy
+        assistant.tool_registry = first.tool_registry
+        return assistant
+
+    return open_thread
 
 
-def run_interactive(args, assistant):
-    session = CLIChatSession(
-        assistant=assistant, markdown=args.markdown, show_price=args.show_price
+def resume_orphaned_run(assistant: AssistantThread, run_log: RunLog) -> Optional[List[Message]]:
+    """
+    Continue the thread of the latest run of `assistant` whose answer an earlier session died
+    waiting for, and forget the older ones. Returns the messages of the resumed conversation, or
+    None if there is no such run.
+    """
+    orphaned = run_log.orphaned(assistant.get_assistant_id())
+    if not orphaned:
+        return None
+    pending = orphaned[-1]
+    for older in orphaned[:-1]:
+        run_log.end(older)
+    assistant.run_log = run_log
+    try:
+        assistant.resume_thread(pending)
+    except OpenAIError as e:
+        logging.getLogger("gptcli-session").warning("Can't resume run %s: %s", pending.run_id, e)
+        run_log.end(pending)
+        return None
+    return assistant.config.get("messages", [])[:] + [pending.user_message]
+
+
+def profile_threads(profilers: List[cProfile.Profile], function: Callable, *args):
+    """
+    Call `function(*args)` with a profiler on in this thread and in each thread started meanwhile,
+    like the ones runs are waited for on. The profilers are added to `profilers`, merge them with
+    `pstats.Stats(*profilers)`.
+    """
+    lock = threading.Lock()
+
+    def profile_thread(*_):
+        # Called in each new thread before it runs, the thread's profiler replaces this hook
+        profiler = cProfile.Profile()
+        with lock:
+            profilers.append(profiler)
+        profiler.enable()
+
+    main = cProfile.Profile()
+    profilers.append(main)
+    threading.setprofile(profile_thread)
+    try:
+        return main.runcall(function, *args)
+    finally:
+        threading.setprofile(None)
+
+
+def run_interactive(args, assistant, config: GptCliConfig):
+    search_index = None
+    if config.search_index_path:
+        search_index = SearchIndex(os.path.expanduser(config.search_index_path))
+    uploader = None
+    # Sessions attached to the daemon have no client of their own
+    openai_client = getattr(assistant, "openai_client", None)
+    if openai_client is not None:
+        uploader = Uploader(
+            openai_client,
+            UploadCache(
+                os.path.expanduser(config.upload_cache_path)
+                if config.upload_cache_path
+                else None
+            ),
+            max_workers=config.upload_concurrency,
+        )
+    run_log = None
+    if openai_client is not None and config.run_log_dir:
+        run_log = RunLog(os.path.expanduser(config.run_log_dir))
+    downloader = None
+    if openai_client is not None and config.download_dir:
+        downloader = Downloader(
+            openai_client,
+            os.path.expanduser(config.download_dir),
+            max_workers=config.download_concurrency,
+            auto=config.auto_download,
+        )
+
+    def make_session(assistant, welcome: bool = True, messages=None) -> CLIChatSession:
+        if isinstance(assistant, AssistantThread):
+            assistant.downloader = downloader
+            assistant.run_log = run_log
+        return CLIChatSession(
+            assistant=assistant,
+            markdown=args.markdown,
+            show_price=args.show_price,
+            config=config,
+            search_index=search_index,
+            uploader=uploader,
+            welcome=welcome,
+            messages=messages,
+        )
+
+    open_thread = thread_opener(assistant, config)
+    resumed_messages = None
+    if run_log is not None:
+        resumed_messages = resume_orphaned_run(assistant, run_log)
+    session = MultiChatSession(
+        make_session(assistant, messages=resumed_messages),
+        args.assistant_name,
+        lambda name: make_session(open_thread(name), welcome=False),
+        lambda branch, messages: make_session(branch, welcome=False, messages=messages),
+        BranchStore(os.path.expanduser(config.branch_store_path) if config.branch_store_path else None),
     )
     history_filename = os.path.expanduser("~/.config/gpt-cli/history")
     os.makedirs(os.path.dirname(history_filename), exist_ok=True)
-    input_provider = CLIUserInputProvider(history_filename=history_filename)
-    session.loop(input_provider)
+    estimator = None
+    if args.show_price:
+        estimator = DraftEstimator(
+            lambda: (
+                getattr(session.session.assistant.assistant_handle, "model", None),
+                session.session.messages,
+            )
+        )
+    input_provider = CLIUserInputProvider(history_filename=history_filename, estimator=estimator)
+    if downloader is not None:
+        downloader.notify = input_provider.notify
+    if args.files:
+        session.session.attach(args.files)
+    if not args.profile:
+        session.loop(input_provider)
+        return
+
+    profilers: List[cProfile.Profile] = []
+    try:
+        profile_threads(profilers, session.loop, input_provider)
+    finally:
+        stats = pstats.Stats(*profilers, stream=sys.stderr)
+        stats.dump_stats(args.profile)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(25)
+        print(f"Profile written to {args.profile}", file=sys.stderr)
 
 if __name__ == "__main__":
     main()
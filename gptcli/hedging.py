@@ -0,0 +1,167 @@
+"""
+Hedged requests for the read-only API calls on the critical path of a turn.
+
+A status poll or message listing that hangs holds up the whole turn even though an identical
+request sent a moment later would most likely be answered right away. `Hedger` sends the
+request, and if it hasn't been answered after a delay that tracks the observed latency of that
+kind of request (its 95th percentile by default), sends a duplicate and returns whichever answer
+arrives first. A budget caps duplicates to a fraction of all requests, so a slow API doesn't get
+twice the traffic. Only idempotent reads may be hedged.
+"""
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional
+
+from attr import dataclass
+
+from gptcli.trace import span
+
+
+@dataclass(frozen=True)
+class HedgePolicy:
+    # Hedge requests that take longer than this quantile of the recent latencies of their kind
+    quantile: float = 0.95
+    # Bounds of the hedging delay, and the delay used until `min_samples` latencies were seen
+    min_delay: float = 0.05
+    max_delay: float = 2.0
+    initial_delay: float = 1.0
+    min_samples: int = 20
+    # How many recent latencies per kind of request to track
+    window: int = 200
+    # At most this fraction of requests may be duplicated, plus a few to start with
+    budget: float = 0.05
+    burst: int = 3
+
+
+@dataclass
+class HedgeStats:
+    requests: int = 0
+    hedges: int = 0
+    # Hedges that answered before the request they duplicated
+    hedges_won: int = 0
+    # Requests that were slow enough to hedge, but the budget was used up
+    over_budget: int = 0
+
+
+class LatencyTracker:
+    def __init__(self, window: int):
+        self.samples: Deque[float] = deque(maxlen=window)
+
+    def add(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, fraction: float) -> float:
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Hedger:
+    def __init__(self, policy: HedgePolicy = HedgePolicy(), max_workers: int = 8):
+        self.policy = policy
+        self.stats = HedgeStats()
+        self.lock = threading.Lock()
+        self.latencies: Dict[str, LatencyTracker] = {}
+        # Runs the duplicates. Losing requests finish in the background, so calls never wait for them
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gptcli-hedge")
+
+    def delay(self, name: str) -> float:
+        """
+        How long to wait for a `name` request before sending a duplicate.
+        """
+        with self.lock:
+            tracker = self.latencies.get(name)
+            if tracker is None or len(tracker.samples) < self.policy.min_samples:
+                return self.policy.initial_delay
+            threshold = tracker.quantile(self.policy.quantile)
+        return min(self.policy.max_delay, max(self.policy.min_delay, threshold))
+
+    def _timed(self, name: str, function: Callable[..., Any], args, kwargs) -> Any:
+        started = time.monotonic()
+        result = function(*args, **kwargs)
+        elapsed = time.monotonic() - started
+        with self.lock:
+            self.latencies.setdefault(name, LatencyTracker(self.policy.window)).add(elapsed)
+        return result
+
+    def _has_budget(self) -> bool:
+        # Called with the lock held
+        return self.stats.hedges < self.policy.burst + self.policy.budget * self.stats.requests
+
+    def _take_budget(self) -> bool:
+        # Called with the lock held
+        if self._has_budget():
+            self.stats.hedges += 1
+            return True
+        self.stats.over_budget += 1
+        return False
+
+    def _start(self, name: str, function: Callable[..., Any], args, kwargs) -> Future:
+        """
+        Start the request on a thread of its own right away, rather than queueing it in the pool
+        behind other requests and their hedges.
+        """
+        future: Future = Future()
+        future.set_running_or_notify_cancel()
+
+        def run():
+            try:
+                future.set_result(self._timed(name, function, args, kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name="gptcli-hedge-request", daemon=True).start()
+        return future
+
+    def call(self, name: str, function: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Call `function(*args, **kwargs)`, hedging it if it's slow. `name` groups calls whose
+        latencies are comparable, like "runs.retrieve".
+        """
+        with self.lock:
+            self.stats.requests += 1
+            can_hedge = self._has_budget()
+        delay = self.delay(name)
+        if not can_hedge:
+            # Nothing to race against, so the calling thread makes the request itself
+            started = time.monotonic()
+            result = self._timed(name, function, args, kwargs)
+            if time.monotonic() - started > delay:
+                with self.lock:
+                    self.stats.over_budget += 1
+            return result
+        primary = self._start(name, function, args, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        with self.lock:
+            hedge_allowed = self._take_budget()
+        if not hedge_allowed:
+            return primary.result()
+        with span("hedge", name):
+            hedge = self.executor.submit(self._timed, name, function, args, kwargs)
+            return self._first_answer(primary, hedge)
+
+    def _first_answer(self, primary: Future, hedge: Future) -> Any:
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            # If both answered, the hedge didn't win anything
+            for future in sorted(done, key=lambda future: future is hedge):
+                if future.exception() is not None:
+                    # The other request may still succeed
+                    error = error or future.exception()
+                    continue
+                if future is hedge:
+                    with self.lock:
+                        self.stats.hedges_won += 1
+                return future.result()
+        assert error is not None
+        raise error
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
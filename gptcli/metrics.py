@@ -0,0 +1,326 @@
+"""
+Metrics in the Prometheus text exposition format, for long-running sessions, daemons and batch workers.
+
+Metrics are off unless `start_metrics` is called, usually through `--metrics_port`. While they
+are off, every recording function returns right away, so instrumented code pays for little more
+than a function call. When they are on, recording is a dictionary update under a lock, and the
+exposition is only rendered when the endpoint is scraped.
+
+    gptcli_api_requests_total{endpoint,status}         API requests, by endpoint and HTTP status
+    gptcli_api_request_duration_seconds{endpoint}      API request latency
+    gptcli_run_duration_seconds{assistant,status}      How long runs took to finish, by final status
+    gptcli_run_polls{assistant}                        Status polls per run
+    gptcli_runs_in_flight                              Runs being waited for
+    gptcli_cache_requests_total{cache,result}          Cache lookups, `hit` or `miss`
+    gptcli_tokens_total{assistant,kind}                Estimated prompt and completion tokens
+    gptcli_spend_dollars_total{assistant}              Estimated spend
+    gptcli_listener_queue_depth{listener}              Events waiting in background listener queues
+    gptcli_sessions_in_flight                          Open chat sessions
+"""
+
+import bisect
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RUN_BUCKETS = (1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+POLL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+Labels = Tuple[str, ...]
+
+# Object ids in API paths, so that endpoints have a bounded number of label values
+_ID = re.compile(r"/(asst|thread|run|msg|file|step|call)_[A-Za-z0-9]+")
+
+
+def endpoint_name(method: str, path: str) -> str:
+    return method + " " + _ID.sub(r"/{\1_id}", path)
+
+
+def _format_labels(names: Sequence[str], values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help, label_names)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        # Called with the registry's lock held
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        super().__init__(name, help, label_names)
+        self.values: Dict[Labels, float] = {}
+        # Read when scraped. Callbacks with the same labels are added up.
+        self.callbacks: Dict[int, Tuple[Labels, Callable[[], float]]] = {}
+
+    def inc(self, labels: Labels = (), amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> List[str]:
+        values = dict(self.values)
+        for labels, callback in list(self.callbacks.values()):
+            values[labels] = values.get(labels, 0) + callback()
+        return [
+            f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(buckets)
+        # Labels -> (count per bucket, with +Inf last, sum)
+        self.values: Dict[Labels, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, labels: Labels, value: float):
+        counts, total = self.values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for labels, (counts, total) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, count in zip([*self.buckets, float("inf")], counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.label_names, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total[0])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.api_requests = Counter("gptcli_api_requests_total", "OpenAI API requests.", ("endpoint", "status"))
+        self.api_latency = Histogram(
+            "gptcli_api_request_duration_seconds", "OpenAI API request latency.", ("endpoint",)
+        )
+        self.run_duration = Histogram(
+            "gptcli_run_duration_seconds", "Time until a run finished.", ("assistant", "status"), RUN_BUCKETS
+        )
+        self.run_polls = Histogram("gptcli_run_polls", "Status polls per run.", ("assistant",), POLL_BUCKETS)
+        self.runs_in_flight = Gauge("gptcli_runs_in_flight", "Runs being waited for.")
+        self.cache_requests = Counter("gptcli_cache_requests_total", "Cache lookups.", ("cache", "result"))
+        self.tokens = Counter("gptcli_tokens_total", "Estimated tokens.", ("assistant", "kind"))
+        self.spend = Counter("gptcli_spend_dollars_total", "Estimated spend in dollars.", ("assistant",))
+        self.listener_queue_depth = Gauge(
+            "gptcli_listener_queue_depth", "Events waiting in background listener queues.", ("listener",)
+        )
+        self.sessions_in_flight = Gauge("gptcli_sessions_in_flight", "Open chat sessions.")
+        self.all: List[Metric] = [
+            self.api_requests,
+            self.api_latency,
+            self.run_duration,
+            self.run_polls,
+            self.runs_in_flight,
+            self.cache_requests,
+            self.tokens,
+            self.spend,
+            self.listener_queue_depth,
+            self.sessions_in_flight,
+        ]
+
+    def exposition(self) -> str:
+        lines = []
+        with self.lock:
+            for metric in self.all:
+                lines += metric.header() + metric.samples()
+        return "\n".join(lines) + "\n"
+
+
+_metrics: Optional[Metrics] = None
+
+
+def start_metrics() -> Metrics:
+    global _metrics
+    _metrics = Metrics()
+    return _metrics
+
+
+def metrics_enabled() -> bool:
+    return _metrics is not None
+
+
+def stop_metrics():
+    global _metrics
+    _metrics = None
+
+
+# Recording functions, called from the instrumented code
+
+
+def observe_request(endpoint: str, status: str, seconds: float):
+    metrics = _metrics
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.api_requests.inc((endpoint, status))
+        metrics.api_latency.observe((endpoint,), seconds)
+
+
+def run_started():
+    metrics = _metrics
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.runs_in_flight.inc()
+
+
+def run_finished(assistant: str, status: str, seconds: float, polls: int):
+    metrics = _metrics
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.runs_in_flight.inc(amount=-1)
+        metrics.run_duration.observe((assistant, status), seconds)
+        metrics.run_polls.observe((assistant,), polls)
+
+
+def cache_lookup(cache: str, hit: bool):
+    metrics = _metrics
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.cache_requests.inc((cache, "hit" if hit else "miss"))
+
+
+def record_usage(assistant: str, prompt_tokens: int, completion_tokens: int, price: Optional[float]):
+    metrics = _metrics
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.tokens.inc((assistant, "prompt"), prompt_tokens)
+        metrics.tokens.inc((assistant, "completion"), completion_tokens)
+        if price is not None:
+            metrics.spend.inc((assistant,), price)
+
+
+def session_opened(change: int = 1):
+    metrics = _metrics
+    if metrics is None:
+        return
+    with metrics.lock:
+        metrics.sessions_in_flight.inc(amount=change)
+
+
+def watch_queue_depth(listener: str, depth: Callable[[], float]) -> Optional[int]:
+    """
+    Report `depth()` as the queue depth of `listener` when scraped. Returns a key for `unwatch_queue_depth`.
+    """
+    metrics = _metrics
+    if metrics is None:
+        return None
+    key = id(depth)
+    with metrics.lock:
+        metrics.listener_queue_depth.callbacks[key] = ((listener,), depth)
+    return key
+
+
+def unwatch_queue_depth(key: Optional[int]):
+    metrics = _metrics
+    if metrics is None or key is None:
+        return
+    with metrics.lock:
+        metrics.listener_queue_depth.callbacks.pop(key, None)
+
+
+class MetricsTransport(httpx.BaseTransport):
+    """
+    Counts and times the requests of an OpenAI client.
+    """
+
+    def __init__(self, transport: Optional[httpx.BaseTransport] = None):
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        endpoint = endpoint_name(request.method, request.url.path)
+        started = time.monotonic()
+        try:
+            response = self.transport.handle_request(request)
+        except httpx.HTTPError:
+            observe_request(endpoint, "error", time.monotonic() - started)
+            raise
+        observe_request(endpoint, str(response.status_code), time.monotonic() - started)
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        metrics = _metrics
+        if self.path.split("?")[0] not in ("/metrics", "/") or metrics is None:
+            self.send_error(404)
+            return
+        body = metrics.exposition().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Start recording metrics and serve them on `port` from a background thread. Only local
+    connections are accepted unless `host` is another address, like "0.0.0.0" for every interface.
+    """
+    if _metrics is None:
+        start_metrics()
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="gptcli-metrics", daemon=True).start()
+    return server
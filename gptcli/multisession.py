@@ -0,0 +1,358 @@
+"""
+Several threads in one terminal session.
+
+`MultiChatSession` keeps a `ChatSession` per thread, each with its own assistant, history and
+listeners, and sends the user's input to the active one. `:new [assistant]` opens a thread,
+`:switch <n>` changes the active one and `:threads` lists them. `:fork [n]` opens a thread that
+continues the conversation from after turn n; the new thread is seeded with the earlier turns in
+the request that creates it, and the branch is recorded in the `BranchStore`. `:branches` lists
+where the active thread was forked from and what was forked from it, in earlier sessions too, and
+`:switch <thread id>` opens any of those threads again.
+
+Messages are answered on a worker thread. The active thread's answer is waited for as usual,
+but Ctrl-C while waiting leaves the run going in the background: the user is notified when the
+answer arrives and it is shown on switching back to its thread. All threads share the process,
+the OpenAI client and the caches.
+"""
+
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, Optional
+
+from attr import dataclass
+from openai import OpenAIError
+
+from gptcli.assistant import AssistantThread
+from gptcli.branches import Branch, BranchStore
+from gptcli.session import (
+    ALL_COMMANDS,
+    COMMAND_BRANCHES,
+    COMMAND_FORK,
+    COMMAND_NEW,
+    COMMAND_QUIT,
+    COMMAND_SWITCH,
+    COMMAND_THREADS,
+    ChatSession,
+    InvalidArgumentError,
+    UserInputProvider,
+)
+from gptcli.types import Message
+from gptcli.trace import span
+
+# Opens a session on a new thread of the named assistant
+SessionFactory = Callable[[str], ChatSession]
+# Opens a session continuing `messages` on a thread that was seeded with them
+BranchFactory = Callable[[AssistantThread, List[Message]], ChatSession]
+
+
+@dataclass
+class ThreadSlot:
+    number: int
+    assistant_name: str
+    session: ChatSession
+    # The run answering the last message, until its answer was shown
+    pending: Optional[Future] = None
+    # Whether the user stopped waiting for `pending` and should be told when it's done
+    detached: bool = False
+    runs: int = 0
+    run_seconds: float = 0.0
+    # The thread this one was forked from, and after how many of its turns
+    parent: Optional[int] = None
+    forked_at: Optional[int] = None
+
+    def status(self) -> str:
+        if self.pending is None:
+            return "idle"
+        if not self.pending.done():
+            return "running"
+        return f"answered, `:switch {self.number}` to read it"
+
+
+def format_threads(slots: List[ThreadSlot], active: ThreadSlot) -> str:
+    lines = ["Threads:", ""]
+    for slot in slots:
+        marker = " (active)" if slot is active else ""
+        average = f", {slot.run_seconds / slot.runs:.1f}s per run" if slot.runs else ""
+        origin = f" - forked from {slot.parent} at turn {slot.forked_at}" if slot.parent is not None else ""
+        lines.append(
+            f"{slot.number}. **{slot.assistant_name}**{marker} - thread `{slot.session.assistant.get_thread_id()}`{origin} - "
+            f"{len(slot.session.user_prompts)} turns{average} - {slot.status()}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def format_branches(
+    thread_id: str, parent: Optional[Branch], children: List[Branch], open_threads: Dict[str, int]
+) -> str:
+    def describe(thread_id: str) -> str:
+        number = open_threads.get(thread_id)
+        return f"`{thread_id}` (thread {number})" if number is not None else f"`{thread_id}`"
+
+    if parent is None and not children:
+        return f"Thread `{thread_id}` wasn't forked and has no branches.\n"
+    lines = [f"Branches of thread `{thread_id}`:", ""]
+    if parent is not None:
+        lines.append(f"Forked from {describe(parent.parent_thread_id)} after turn {parent.turns}.")
+        lines.append("")
+    for index, branch in enumerate(children, 1):
+        created_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(branch.created_at))
+        lines.append(f"{index}. {describe(branch.thread_id)} - after turn {branch.turns} - {created_at}")
+    return "\n".join(lines) + "\n"
+
+
+class MultiChatSession:
+    def __init__(
+        self,
+        session: ChatSession,
+        assistant_name: str,
+        session_factory: SessionFactory,
+        branch_factory: Optional[BranchFactory] = None,
+        branch_store: Optional[BranchStore] = None,
+    ):
+        self.session_factory = session_factory
+        self.branch_factory = branch_factory
+        self.branch_store = branch_store
+        self.slots = [ThreadSlot(1, assistant_name, session)]
+        self.active = self.slots[0]
+        self.lock = threading.Lock()
+        self.notify: Callable[[str], None] = lambda message: None
+
+    @property
+    def session(self) -> ChatSession:
+        return self.active.session
+
+    def _print(self, text: str):
+        with self.session.listener.response_streamer() as stream:
+            stream.on_next_token(text)
+
+    def _new(self, assistant_name: str):
+        name = assistant_name or self.active.assistant_name
+        try:
+            session = self.session_factory(name)
+        except (InvalidArgumentError, OpenAIError) as e:
+            self.session.listener.on_error(e)
+            return
+        slot = ThreadSlot(len(self.slots) + 1, name, session)
+        self.slots.append(slot)
+        self.active = slot
+        session.listener.on_chat_start()
+        self._print(f"Opened thread {slot.number} with **{name}**.\n")
+
+    def _switch(self, argument: str):
+        open_threads = {slot.session.assistant.get_thread_id(): slot for slot in self.slots}
+        if argument in open_threads:
+            argument = str(open_threads[argument].number)
+        elif argument and not argument.isdigit():
+            self._reopen(argument)
+            return
+        if not argument.isdigit() or not (1 <= int(argument) <= len(self.slots)):
+            self.session.listener.on_error(
+                InvalidArgumentError(
+                    f"Usage: {COMMAND_SWITCH[0]} <thread number from 1 to {len(self.slots)}, or a thread id from {COMMAND_BRANCHES[0]}>"
+                )
+            )
+            return
+        self.active = self.slots[int(argument) - 1]
+        self._print(f"Switched to thread {self.active.number} with **{self.active.assistant_name}**.\n")
+        if self.active.pending is not None:
+            if self.active.pending.done():
+                self._finish(self.active)
+            else:
+                self._print("Its answer is still on the way.\n")
+
+    def _reopen(self, thread_id: str):
+        """
+        Open a thread recorded in the branch store, forked in this session or an earlier one.
+        """
+        slot = self.active
+        session = slot.session
+        if self.branch_store is None or self.branch_factory is None or not isinstance(
+            session.assistant, AssistantThread
+        ):
+            session.listener.on_error(InvalidArgumentError("Branches aren't recorded."))
+            return
+        self.branch_store.refresh()
+        # The thread was forked from another one, or other threads were forked from it
+        branch = self.branch_store.parent_of(thread_id) or next(iter(self.branch_store.children_of(thread_id)), None)
+        if branch is None:
+            session.listener.on_error(
+                InvalidArgumentError(f"Thread `{thread_id}` isn't a branch, see {COMMAND_BRANCHES[0]}.")
+            )
+            return
+        if branch.assistant_id != session.assistant.get_assistant_id():
+            session.listener.on_error(
+                InvalidArgumentError(
+                    f"Thread `{thread_id}` belongs to assistant `{branch.assistant_id}`, switch to a thread of it first."
+                )
+            )
+            return
+        try:
+            assistant = session.assistant.reopen(thread_id)
+        except OpenAIError as e:
+            session.listener.on_error(e)
+            return
+        messages = assistant.config.get("messages", [])[:] + assistant.history
+        new = ThreadSlot(len(self.slots) + 1, slot.assistant_name, self.branch_factory(assistant, messages))
+        self.slots.append(new)
+        self.active = new
+        new.session.listener.on_chat_start()
+        self._print(f"Opened thread `{thread_id}` as thread {new.number}.\n")
+
+    def _fork(self, argument: str):
+        slot = self.active
+        session = slot.session
+        if self.branch_factory is None or not isinstance(session.assistant, AssistantThread):
+            session.listener.on_error(InvalidArgumentError("This thread can't be forked."))
+            return
+        defaults = len(session.assistant.config.get("messages", []))
+        turn_starts = [
+            i for i, message in enumerate(session.messages) if i >= defaults and message["role"] == "user"
+        ]
+        if not turn_starts:
+            session.listener.on_error(InvalidArgumentError("There is nothing to fork yet."))
+            return
+        if argument and not (argument.isdigit() and 1 <= int(argument) <= len(turn_starts)):
+            session.listener.on_error(
+                InvalidArgumentError(f"Usage: {COMMAND_FORK[0]} [turn number from 1 to {len(turn_starts)}]")
+            )
+            return
+        turns = int(argument) if argument else len(turn_starts)
+        end = turn_starts[turns] if turns < len(turn_starts) else len(session.messages)
+        messages = session.messages[:end]
+        try:
+            with span("fork", str(turns)):
+                assistant = session.assistant.branch(messages[defaults:])
+        except OpenAIError as e:
+            session.listener.on_error(e)
+            return
+        if self.branch_store is not None:
+            try:
+                self.branch_store.add(
+                    assistant.get_thread_id(), session.assistant.get_thread_id(), assistant.assistant_handle.id, turns
+                )
+            except OSError as e:
+                # The fork itself worked, it just won't be listed in later sessions
+                session.listener.on_error(
+                    InvalidArgumentError(f"Can't record the branch in {self.branch_store.path}: {e}")
+                )
+        new = ThreadSlot(
+            len(self.slots) + 1,
+            slot.assistant_name,
+            self.branch_factory(assistant, messages),
+            parent=slot.number,
+            forked_at=turns,
+        )
+        self.slots.append(new)
+        self.active = new
+        new.session.listener.on_chat_start()
+        self._print(f"Forked thread {new.number} from thread {slot.number} after turn {turns}.\n")
+
+    def _branches(self):
+        if self.branch_store is None:
+            self.session.listener.on_error(InvalidArgumentError("Branches aren't recorded."))
+            return
+        self.branch_store.refresh()
+        thread_id = self.session.assistant.get_thread_id()
+        open_threads = {slot.session.assistant.get_thread_id(): slot.number for slot in self.slots}
+        self._print(
+            format_branches(
+                thread_id,
+                self.branch_store.parent_of(thread_id),
+                self.branch_store.children_of(thread_id),
+                open_threads,
+            )
+        )
+
+    def _send(self, user_input: str, args: Dict[str, Any]):
+        slot = self.active
+        session = slot.session
+        if not session._validate_args(args):
+            return
+        if session.candidates:
+            session._pick_default()
+        session._add_user_message(user_input)
+        slot.pending = session._start_response()
+        slot.pending.add_done_callback(
+            lambda future, started=time.monotonic(): self._on_run_done(slot, started)
+        )
+        self._wait(slot)
+
+    def _on_run_done(self, slot: ThreadSlot, started: float):
+        # Called on the run's worker thread
+        with self.lock:
+            slot.runs += 1
+            slot.run_seconds += time.monotonic() - started
+            detached, slot.detached = slot.detached, False
+        if detached:
+            self.notify(
+                f"Thread {slot.number} ({slot.assistant_name}) has answered. `:switch {slot.number}` to read it."
+            )
+
+    def _wait(self, slot: ThreadSlot) -> bool:
+        """
+        Wait for the answer of `slot` and show it. Returns False if the user stopped waiting.
+        """
+        assert slot.pending is not None
+        try:
+            wait([slot.pending])
+        except KeyboardInterrupt:
+            with self.lock:
+                slot.detached = not slot.pending.done()
+            if slot.detached:
+                self._print(
+                    f"Thread {slot.number} keeps running in the background, you'll be told when it has answered.\n"
+                )
+                return False
+        self._finish(slot)
+        return True
+
+    def _finish(self, slot: ThreadSlot):
+        pending, slot.pending = slot.pending, None
+        slot.detached = False
+        with span("turn"):
+            slot.session._finish_turn(pending)
+
+    def _quit(self):
+        for slot in self.slots:
+            slot.session._quit()
+
+    def process_input(self, user_input: str, args: Dict[str, Any]) -> bool:
+        """
+        Process the user's input and return whether the session should continue.
+        """
+        command, _, command_args = user_input.partition(" ")
+        if user_input in COMMAND_QUIT:
+            self._quit()
+            return False
+        elif command in COMMAND_NEW:
+            self._new(command_args.strip())
+            return True
+        elif command in COMMAND_SWITCH:
+            self._switch(command_args.strip())
+            return True
+        elif user_input in COMMAND_THREADS:
+            self._print(format_threads(self.slots, self.active))
+            return True
+        elif user_input in COMMAND_BRANCHES:
+            self._branches()
+            return True
+
+        # Everything else needs the answer to the previous message first
+        if self.active.pending is not None and not self._wait(self.active):
+            return True
+        if command in COMMAND_FORK:
+            self._fork(command_args.strip())
+            return True
+        if command in ALL_COMMANDS:
+            return self.session.process_input(user_input, args)
+        self._send(user_input, args)
+        return True
+
+    def loop(self, input_provider: UserInputProvider):
+        self.notify = input_provider.notify
+        self.session.listener.on_chat_start()
+        if getattr(self.session.assistant, "resumed_run", None) is not None:
+            self.session.resume()
+        while self.process_input(*input_provider.get_user_input()):
+            pass
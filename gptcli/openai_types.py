@@ -1,51 +1,395 @@
 """
 Since the openai python library doesn't have type annotations, we have to define our own types for the objects we get back from the API.
+
+The objects are immutable and use __slots__ to keep long threads cheap to hold in memory.
+Nested lists (message content, annotations, run tools) are parsed into tuples right away: keeping
+the API dicts or SDK models around to parse them later would take more memory than the parsed
+objects.
 """
-class MessageText:
+import abc
+from typing import Any, Dict
+
+
+def _field(item, name: str, default=None):
+    if isinstance(item, dict):
+        return item.get(name, default)
+    return getattr(item, name, default)
+
+
+def _to_dict(value):
+    if isinstance(value, _Frozen):
+        return value.to_dict()
+    if isinstance(value, (list, tuple)):
+        return [_to_dict(item) for item in value]
+    if hasattr(value, "dict") and not isinstance(value, dict):
+        # SDK model
+        return value.dict()
+    return value
+
+
+class _Frozen(abc.ABC):
+    __slots__ = ()
+
+    def _set(self, name: str, value):
+        object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+    @abc.abstractmethod
+    def to_dict(self) -> Dict[str, Any]:
+        ...
+
+
+class FileCitation(_Frozen):
+    __slots__ = ("file_id", "quote")
+
+    def __init__(self, file_id, quote):
+        self._set("file_id", file_id)
+        self._set("quote", quote)
+
+    def to_dict(self):
+        return {"file_id": self.file_id, "quote": self.quote}
+
+
+class FilePath(_Frozen):
+    __slots__ = ("file_id",)
+
+    def __init__(self, file_id):
+        self._set("file_id", file_id)
+
+    def to_dict(self):
+        return {"file_id": self.file_id}
+
+
+class Annotation(_Frozen):
+    __slots__ = ("type", "text", "start_index", "end_index", "file_citation", "file_path")
+
+    def __init__(self, type, text, start_index=None, end_index=None, file_citation=None, file_path=None):
+        self._set("type", type)
+        self._set("text", text)
+        self._set("start_index", start_index)
+        self._set("end_index", end_index)
+        self._set("file_citation", file_citation)
+        self._set("file_path", file_path)
+
+    @classmethod
+    def parse(cls, item) -> "Annotation":
+        file_citation = _field(item, "file_citation")
+        file_path = _field(item, "file_path")
+        return cls(
+            _field(item, "type"),
+            _field(item, "text"),
+            _field(item, "start_index"),
+            _field(item, "end_index"),
+            FileCitation(_field(file_citation, "file_id"), _field(file_citation, "quote")) if file_citation else None,
+            FilePath(_field(file_path, "file_id")) if file_path else None,
+        )
+
+    def to_dict(self):
+        result = {
+            "type": self.type,
+            "text": self.text,
+            "start_index": self.start_index,
+            "end_index": self.end_index,
+        }
+        if self.file_citation is not None:
+            result["file_citation"] = self.file_citation.to_dict()
+        if self.file_path is not None:
+            result["file_path"] = self.file_path.to_dict()
+        return result
+
+
+class MessageText(_Frozen):
+    __slots__ = ("value", "annotations")
+
     def __init__(self, value, annotations):
-        self.value = value
-        self.annotations = annotations
+        self._set("value", value)
+        self._set("annotations", tuple(
+            item if isinstance(item, Annotation) else Annotation.parse(item)
+            for item in annotations or ()
+        ))
+
+    def replace(self, value: str) -> "MessageText":
+        return MessageText(value, self.annotations)
+
+    def to_dict(self):
+        return {"value": self.value, "annotations": _to_dict(self.annotations)}
+
+
+class ImageFile(_Frozen):
+    __slots__ = ("file_id",)
+
+    def __init__(self, file_id):
+        self._set("file_id", file_id)
+
+    def to_dict(self):
+        return {"file_id": self.file_id}
+
+
+class Content(_Frozen):
+    __slots__ = ("type", "text", "image_file")
+
+    def __init__(self, type, text, image_file=None):
+        self._set("type", type)
+        self._set("text", text)
+        self._set("image_file", image_file)
+
+    @classmethod
+    def parse(cls, item) -> "Content":
+        text = _field(item, "text")
+        image_file = _field(item, "image_file")
+        return cls(
+            _field(item, "type"),
+            MessageText(_field(text, "value"), _field(text, "annotations")) if text is not None else None,
+            ImageFile(_field(image_file, "file_id")) if image_file is not None else None,
+        )
+
+    def to_dict(self):
+        result: Dict[str, Any] = {"type": self.type}
+        if self.text is not None:
+            result["text"] = self.text.to_dict()
+        if self.image_file is not None:
+            result["image_file"] = self.image_file.to_dict()
+        return result
 
-class Content:
-    def __init__(self, type, text):
-        self.type = type
-        self.text = text
 
 # https://platform.openai.com/docs/api-reference/messages/object
-class ThreadMessage:
+class ThreadMessage(_Frozen):
+    __slots__ = (
+        "id",
+        "object",
+        "created_at",
+        "thread_id",
+        "role",
+        "content",
+        "file_ids",
+        "assistant_id",
+        "run_id",
+        "metadata",
+    )
+
     def __init__(self, id, object, created_at, thread_id, role, content, file_ids, assistant_id, run_id, metadata):
-        self.id = id
-        self.object = object
-        self.created_at = created_at
-        self.thread_id = thread_id
-        self.role = role
-        self.content = [Content(item['type'], MessageText(item['text']['value'], item['text']['annotations'])) for item in content]
-        self.file_ids = file_ids
-        self.assistant_id = assistant_id
-        self.run_id = run_id
-        self.metadata = metadata     
-
-class Tool:
-    def __init__(self, type):
-        self.type = type
+        self._set("id", id)
+        self._set("object", object)
+        self._set("created_at", created_at)
+        self._set("thread_id", thread_id)
+        self._set("role", role)
+        self._set("content", tuple(
+            item if isinstance(item, Content) else Content.parse(item)
+            for item in content or ()
+        ))
+        self._set("file_ids", tuple(file_ids or ()))
+        self._set("assistant_id", assistant_id)
+        self._set("run_id", run_id)
+        self._set("metadata", metadata)
+
+    @classmethod
+    def from_sdk(cls, message) -> "ThreadMessage":
+        """
+        Convert an `openai.types.beta.threads.ThreadMessage`.
+        """
+        return cls(
+            message.id,
+            message.object,
+            message.created_at,
+            message.thread_id,
+            message.role,
+            message.content,
+            message.file_ids,
+            message.assistant_id,
+            message.run_id,
+            message.metadata,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ThreadMessage":
+        return cls(
+            data["id"],
+            data.get("object", "thread.message"),
+            data.get("created_at"),
+            data.get("thread_id"),
+            data.get("role"),
+            data.get("content"),
+            data.get("file_ids"),
+            data.get("assistant_id"),
+            data.get("run_id"),
+            data.get("metadata"),
+        )
+
+    def to_sdk(self):
+        from openai.types.beta.threads import ThreadMessage as SDKThreadMessage
+
+        return SDKThreadMessage(**self.to_dict())
+
+    def replace_content(self, content) -> "ThreadMessage":
+        return ThreadMessage(
+            self.id,
+            self.object,
+            self.created_at,
+            self.thread_id,
+            self.role,
+            tuple(content),
+            self.file_ids,
+            self.assistant_id,
+            self.run_id,
+            self.metadata,
+        )
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "object": self.object,
+            "created_at": self.created_at,
+            "thread_id": self.thread_id,
+            "role": self.role,
+            "content": _to_dict(self.content),
+            "file_ids": list(self.file_ids),
+            "assistant_id": self.assistant_id,
+            "run_id": self.run_id,
+            "metadata": self.metadata,
+        }
+
+
+class Tool(_Frozen):
+    __slots__ = ("type", "function")
+
+    def __init__(self, type, function=None):
+        self._set("type", type)
+        self._set("function", function)
+
+    @classmethod
+    def parse(cls, item) -> "Tool":
+        return cls(_field(item, "type"), _to_dict(_field(item, "function")))
+
+    def to_dict(self):
+        result: Dict[str, Any] = {"type": self.type}
+        if self.function is not None:
+            result["function"] = self.function
+        return result
+
 
 # https://platform.openai.com/docs/api-reference/runs/object
-class ThreadRun:
-    def __init__(self, id, object, created_at, assistant_id, thread_id, status, started_at, expires_at, cancelled_at, failed_at, completed_at, last_error, model, instructions, tools, file_ids, metadata):
-        self.id = id
-        self.object = object
-        self.created_at = created_at
-        self.assistant_id = assistant_id
-        self.thread_id = thread_id
-        self.status = status
-        self.started_at = started_at
-        self.expires_at = expires_at
-        self.cancelled_at = cancelled_at
-        self.failed_at = failed_at
-        self.completed_at = completed_at
-        self.last_error = last_error
-        self.model = model
-        self.instructions = instructions
-        self.tools = [Tool(tool['type']) for tool in tools]
-        self.file_ids = file_ids
-        self.metadata = metadata
+class ThreadRun(_Frozen):
+    __slots__ = (
+        "id",
+        "object",
+        "created_at",
+        "assistant_id",
+        "thread_id",
+        "status",
+        "started_at",
+        "expires_at",
+        "cancelled_at",
+        "failed_at",
+        "completed_at",
+        "last_error",
+        "model",
+        "instructions",
+        "tools",
+        "file_ids",
+        "metadata",
+        "required_action",
+    )
+
+    def __init__(self, id, object, created_at, assistant_id, thread_id, status, started_at, expires_at, cancelled_at, failed_at, completed_at, last_error, model, instructions, tools, file_ids, metadata, required_action=None):
+        self._set("id", id)
+        self._set("object", object)
+        self._set("created_at", created_at)
+        self._set("assistant_id", assistant_id)
+        self._set("thread_id", thread_id)
+        self._set("status", status)
+        self._set("started_at", started_at)
+        self._set("expires_at", expires_at)
+        self._set("cancelled_at", cancelled_at)
+        self._set("failed_at", failed_at)
+        self._set("completed_at", completed_at)
+        self._set("last_error", last_error)
+        self._set("model", model)
+        self._set("instructions", instructions)
+        self._set("tools", tuple(
+            item if isinstance(item, Tool) else Tool.parse(item)
+            for item in tools or ()
+        ))
+        self._set("file_ids", tuple(file_ids or ()))
+        self._set("metadata", metadata)
+        self._set("required_action", required_action)
+
+    @classmethod
+    def from_sdk(cls, run) -> "ThreadRun":
+        return cls(
+            run.id,
+            run.object,
+            run.created_at,
+            run.assistant_id,
+            run.thread_id,
+            run.status,
+            run.started_at,
+            run.expires_at,
+            run.cancelled_at,
+            run.failed_at,
+            run.completed_at,
+            _to_dict(run.last_error),
+            run.model,
+            run.instructions,
+            run.tools,
+            run.file_ids,
+            run.metadata,
+            _to_dict(run.required_action),
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ThreadRun":
+        return cls(
+            data["id"],
+            data.get("object", "thread.run"),
+            data.get("created_at"),
+            data.get("assistant_id"),
+            data.get("thread_id"),
+            data.get("status"),
+            data.get("started_at"),
+            data.get("expires_at"),
+            data.get("cancelled_at"),
+            data.get("failed_at"),
+            data.get("completed_at"),
+            data.get("last_error"),
+            data.get("model"),
+            data.get("instructions"),
+            data.get("tools"),
+            data.get("file_ids"),
+            data.get("metadata"),
+            data.get("required_action"),
+        )
+
+    def to_sdk(self):
+        from openai.types.beta.threads import Run
+
+        return Run(**self.to_dict())
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "object": self.object,
+            "created_at": self.created_at,
+            "assistant_id": self.assistant_id,
+            "thread_id": self.thread_id,
+            "status": self.status,
+            "started_at": self.started_at,
+            "expires_at": self.expires_at,
+            "cancelled_at": self.cancelled_at,
+            "failed_at": self.failed_at,
+            "completed_at": self.completed_at,
+            "last_error": self.last_error,
+            "model": self.model,
+            "instructions": self.instructions,
+            "tools": _to_dict(self.tools),
+            "file_ids": list(self.file_ids),
+            "metadata": self.metadata,
+            "required_action": self.required_action,
+        }
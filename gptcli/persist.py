@@ -1,32 +1,404 @@
+"""
+This module is responsible for persisting chat transcripts to disk.
+"""
+
+import gzip
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from gptcli.assistant import AssistantThread
+from gptcli.config import DEFAULT_TRANSCRIPT_DIR
 from gptcli.session import ChatListener
+from gptcli.transcript import (
+    EVENT_CHAT_CLEAR,
+    EVENT_CHAT_END,
+    EVENT_CHAT_RERUN,
+    EVENT_CHAT_START,
+    EVENT_ERROR,
+    EVENT_MESSAGE,
+    EVENT_THREAD_ROLLOVER,
+    INDEX_ENTRY,
+    INDEX_SUFFIX,
+    TRANSCRIPT_SUFFIX,
+    encode_record,
+    make_record,
+)
 from gptcli.types import Message
-from pathlib import Path
 
-# TODO use the logging package to do writes instead of our own class
+
+# Flush buffered writes to the OS at the end of every turn.
+DURABILITY_TURN = "turn"
+# fsync the transcript at most every `fsync_interval` seconds.
+DURABILITY_INTERVAL = "interval"
+DURABILITY_POLICIES = (DURABILITY_TURN, DURABILITY_INTERVAL)
+
+COMPRESSION_GZIP = "gzip"
+COMPRESSION_ZSTD = "zstd"
+COMPRESSION_SUFFIXES = {COMPRESSION_GZIP: ".gz", COMPRESSION_ZSTD: ".zst"}
+
+# Upper bound on data kept in memory while the disk keeps failing.
+MAX_PENDING_BYTES = 16 * 1024 * 1024
+
+_WRITE = "write"
+_FLUSH = "flush"
+_CLOSE = "close"
+
+
+class TranscriptWriter:
+    """
+    Appends to a transcript file from a background thread.
+
+    Callers only put data on an unbounded queue, so a slow or stalled disk never blocks them.
+    The writer drains everything queued since its last wake-up and writes it in one batch.
+    Once the active file grows past `max_bytes` it is rotated to `<path>.<n>` and, optionally,
+    compressed. Index entries passed to `write` go to the sidecar `<path>.idx`, which is
+    rotated along with its segment.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        durability: str = DURABILITY_TURN,
+        fsync_interval: float = 5.0,
+        max_bytes: Optional[int] = None,
+        compression: Optional[str] = None,
+    ):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(
+                f"Unknown durability policy: {durability}. Allowed values: {DURABILITY_POLICIES}"
+            )
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(
+                f"Unknown compression: {compression}. Allowed values: {list(COMPRESSION_SUFFIXES)}"
+            )
+        if compression == COMPRESSION_ZSTD:
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                raise ValueError(
+                    "zstd compression requires the `zstandard` package: pip install openai-assistants-cli[zstd]"
+                )
+
+        self.path = path
+        self.durability = durability
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.logger = logging.getLogger("gptcli-persist")
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._file = None
+        self._size = 0
+        self._index_file = None
+        self._pending: List[Tuple[bytes, Optional[Tuple[int, float]]]] = []
+        self._pending_bytes = 0
+        self._dirty = False
+        self._last_sync = time.monotonic()
+        self._thread = threading.Thread(
+            target=self._run, name="gptcli-transcript-writer", daemon=True
+        )
+        self._thread.start()
+
+    def write(self, data: str, index: Optional[Tuple[int, float]] = None):
+        """
+        Queue `data` for writing. If `index` is given as `(turn, timestamp)`, an index entry
+        pointing at the start of `data` is written as well.
+        """
+        self._queue.put((_WRITE, (data.encode("utf-8"), index)))
+
+    def flush(self):
+        """
+        Mark the end of a turn. With the `turn` durability policy, pending data is flushed.
+        """
+        self._queue.put((_FLUSH, None))
+
+    def close(self, timeout: Optional[float] = 5.0):
+        """
+        Write out everything queued so far and stop the writer thread.
+
+        Waits at most `timeout` seconds so that a stalled disk cannot hang the process on exit.
+        """
+        self._queue.put((_CLOSE, None))
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            self.logger.warning(
+                f"Transcript writer for {self.path} did not finish within {timeout}s"
+            )
+
+    def _run(self):
+        closing = False
+        while not closing:
+            try:
+                first = self._queue.get(timeout=self._wait_timeout())
+            except queue.Empty:
+                self._sync_if_due()
+                continue
+
+            flush = False
+            for kind, data in self._drain(first):
+                if kind == _WRITE:
+                    self._pending.append(data)
+                    self._pending_bytes += len(data[0])
+                elif kind == _FLUSH:
+                    flush = True
+                elif kind == _CLOSE:
+                    closing = True
+
+            self._write_pending()
+            if flush and self.durability == DURABILITY_TURN:
+                self._flush(fsync=False)
+            self._sync_if_due()
+
+        self._write_pending()
+        self._flush(fsync=self.durability == DURABILITY_INTERVAL)
+        self._reset_file()
+
+    def _drain(self, first):
+        items = [first]
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def _wait_timeout(self) -> Optional[float]:
+        if self.durability != DURABILITY_INTERVAL or not self._dirty:
+            return None
+        return max(0.0, self.fsync_interval - (time.monotonic() - self._last_sync))
+
+    def _write_pending(self):
+        while self._pending:
+            try:
+                file = self._open()
+                if (
+                    self.max_bytes
+                    and self._size > 0
+                    and self._size + len(self._pending[0][0]) > self.max_bytes
+                ):
+                    self._rotate()
+                    file = self._open()
+                count, size = self._next_batch()
+                batch = self._pending[:count]
+                file.write(b"".join(data for data, _ in batch))
+                self._write_index(batch)
+            except OSError as e:
+                # Keep the data and retry on the next batch instead of giving up on the transcript.
+                self.logger.error(f"Failed to write transcript {self.path}: {e}")
+                self._reset_file()
+                if self._pending_bytes > MAX_PENDING_BYTES:
+                    self.logger.error(
+                        f"Dropping {self._pending_bytes} bytes of transcript data for {self.path}"
+                    )
+                    self._pending, self._pending_bytes = [], 0
+                return
+
+            del self._pending[:count]
+            self._pending_bytes -= size
+            self._size += size
+            self._dirty = True
+
+    def _next_batch(self):
+        """
+        Return how many pending chunks (at least one) fit in the active file, and their size.
+        """
+        if not self.max_bytes:
+            return len(self._pending), self._pending_bytes
+        count, size = 0, 0
+        for data, _ in self._pending:
+            if count > 0 and self._size + size + len(data) > self.max_bytes:
+                break
+            count += 1
+            size += len(data)
+        return count, size
+
+    def _write_index(self, batch):
+        offset = self._size
+        entries = []
+        for data, index in batch:
+            if index is not None:
+                entries.append(INDEX_ENTRY.pack(offset, *index))
+            offset += len(data)
+        if entries:
+            if self._index_file is None:
+                self._index_file = open(self.path + INDEX_SUFFIX, "ab")
+            self._index_file.write(b"".join(entries))
+
+    def _open(self):
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "ab")
+            self._size = self._file.tell()
+        return self._file
+
+    def _reset_file(self):
+        for file in (self._file, self._index_file):
+            if file is not None:
+                try:
+                    file.close()
+                except OSError:
+                    pass
+        self._file = None
+        self._index_file = None
+
+    def _flush(self, fsync: bool):
+        if self._file is None or not self._dirty:
+            return
+        try:
+            for file in (self._file, self._index_file):
+                if file is not None:
+                    file.flush()
+                    if fsync:
+                        os.fsync(file.fileno())
+        except OSError as e:
+            self.logger.error(f"Failed to flush transcript {self.path}: {e}")
+            self._reset_file()
+            return
+        self._dirty = False
+        self._last_sync = time.monotonic()
+
+    def _sync_if_due(self):
+        if (
+            self.durability == DURABILITY_INTERVAL
+            and self._dirty
+            and time.monotonic() - self._last_sync >= self.fsync_interval
+        ):
+            self._flush(fsync=True)
+
+    def _rotate(self):
+        self._flush(fsync=False)
+        self._reset_file()
+        index = 1
+        while any(
+            os.path.exists(f"{self.path}.{index}{suffix}")
+            for suffix in ("", *COMPRESSION_SUFFIXES.values())
+        ):
+            index += 1
+        rotated = f"{self.path}.{index}"
+        os.replace(self.path, rotated)
+        if os.path.exists(self.path + INDEX_SUFFIX):
+            os.replace(self.path + INDEX_SUFFIX, rotated + INDEX_SUFFIX)
+        self._size = 0
+        if self.compression is not None:
+            self._compress(rotated)
+
+    def _compress(self, path: str):
+        target = path + COMPRESSION_SUFFIXES[self.compression]
+        try:
+            with open(path, "rb") as src:
+                if self.compression == COMPRESSION_GZIP:
+                    with gzip.open(target, "wb") as dst:
+                        shutil.copyfileobj(src, dst)
+                else:
+                    import zstandard
+
+                    with open(target, "wb") as raw:
+                        with zstandard.ZstdCompressor().stream_writer(raw) as dst:
+                            shutil.copyfileobj(src, dst)
+        except OSError as e:
+            # The uncompressed segment is still there, so nothing is lost.
+            self.logger.error(f"Failed to compress transcript segment {path}: {e}")
+            return
+        os.remove(path)
+
 
 class PersistChatListener(ChatListener):
-    def __init__(self, thread_id, assistant_id: str):
-        # create a file with the thread id as the name in the current directory
-        Path("./logs").mkdir(exist_ok=True)
-        self.file_handle = open(f"./logs/gptcli-{assistant_id}-{thread_id}.log", "w")
+    """
+    Records the session as a structured JSONL transcript, see `gptcli.transcript`.
+    """
 
-    def on_chat_start(self):
-        self.file_handle.write("Chat started.\n")
+    def __init__(
+        self,
+        assistant: AssistantThread,
+        directory: str = DEFAULT_TRANSCRIPT_DIR,
+        durability: str = DURABILITY_TURN,
+        fsync_interval: float = 5.0,
+        max_bytes: Optional[int] = None,
+        compression: Optional[str] = None,
+    ):
+        self.assistant = assistant
+        self.path = os.path.join(
+            directory,
+            f"gptcli-{assistant.get_assistant_id()}-{assistant.get_thread_id()}{TRANSCRIPT_SUFFIX}",
+        )
+        self.writer = TranscriptWriter(
+            self.path,
+            durability=durability,
+            fsync_interval=fsync_interval,
+            max_bytes=max_bytes,
+            compression=compression,
+        )
+        self.turn = 0
+        self.turn_started_at: Optional[float] = None
 
+    def _write(self, event: str, index: bool = False, **fields):
+        record = make_record(
+            event,
+            assistant_id=self.assistant.get_assistant_id(),
+            thread_id=self.assistant.get_thread_id(),
+            **fields,
+        )
+        self.writer.write(
+            encode_record(record), index=(self.turn, record["ts"]) if index else None
+        )
+
+    def on_chat_start(self):
+        self._write(EVENT_CHAT_START)
 
     def on_chat_clear(self):
-        self.file_handle.write("Cleared the conversation.\n")
-        
+        self._write(EVENT_CHAT_CLEAR)
+
     def on_chat_rerun(self, success: bool):
         if success:
-            self.file_handle.write("Re-generating the last message.\n")
+            self.turn_started_at = time.time()
+            self._write(EVENT_CHAT_RERUN, turn=self.turn)
 
     def on_error(self, e: Exception):
-        self.file_handle.write(str(e))
-        self.file_handle.close()
+        self._write(EVENT_ERROR, turn=self.turn, error=f"{type(e).__name__}: {e}")
+        self.writer.flush()
+
+    def on_thread_rollover(self, old_thread_id: str, new_thread_id: str, summary: str):
+        self._write(
+            EVENT_THREAD_ROLLOVER,
+            turn=self.turn,
+            old_thread_id=old_thread_id,
+            new_thread_id=new_thread_id,
+            summary=summary,
+        )
 
     def on_chat_message(self, message: Message):
-        self.file_handle.write(f"{message['role']}: {message['content']}\n")
+        if message["role"] == "user":
+            self.turn += 1
+            self.turn_started_at = time.time()
+            self._write(
+                EVENT_MESSAGE,
+                index=True,
+                turn=self.turn,
+                role=message["role"],
+                content=message["content"],
+                message_ids=[self.assistant.last_user_message_id],
+            )
+        else:
+            latency_ms = None
+            if self.turn_started_at is not None:
+                latency_ms = round((time.time() - self.turn_started_at) * 1000)
+            self._write(
+                EVENT_MESSAGE,
+                turn=self.turn,
+                role=message["role"],
+                content=message["content"],
+                run_id=self.assistant.last_run_id,
+                message_ids=self.assistant.last_response_message_ids,
+                latency_ms=latency_ms,
+            )
+
+    def on_chat_response(self, messages: List[Message], response: Message):
+        self.writer.flush()
 
     def on_chat_end(self):
-        self.file_handle.close()
\ No newline at end of file
+        self._write(EVENT_CHAT_END)
+        self.writer.close()
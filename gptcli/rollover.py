@@ -0,0 +1,109 @@
+"""
+Move long conversations to a fresh thread before they get slow and expensive.
+
+The Assistants API feeds the whole thread to the model on every run, so the cost and latency of a
+turn keep growing with the thread. Once a thread passes the limits of a `RolloverPolicy`, it is
+summarized by the assistant and the conversation continues in a new thread seeded with the
+summary and the last few turns.
+"""
+
+from typing import List, Optional
+
+from attr import dataclass
+
+from gptcli.encodings import get_encoding
+from gptcli.types import Message
+
+SUMMARY_INSTRUCTIONS = (
+    "Summarize the conversation so far for your own future reference. Keep every fact, decision, "
+    "name, number and open question that later answers may depend on, and leave out pleasantries. "
+    "Write at most 300 words."
+)
+
+# The encoding of the models the Assistants API runs
+ENCODING = "cl100k_base"
+# The Assistants API rejects longer messages
+MAX_MESSAGE_CHARS = 32_000
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding(ENCODING).encode(text, disallowed_special=()))
+
+
+@dataclass(frozen=True)
+class RolloverPolicy:
+    """
+    Roll a thread over once it holds more than `max_messages` messages or about `max_tokens`
+    tokens of text (None disables a limit), keeping the last `keep_turns` turns verbatim.
+    """
+
+    max_messages: Optional[int] = None
+    max_tokens: Optional[int] = None
+    keep_turns: int = 2
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_messages is not None or self.max_tokens is not None
+
+    def exceeded(self, message_count: int, token_count: int) -> bool:
+        return (self.max_messages is not None and message_count > self.max_messages) or (
+            self.max_tokens is not None and token_count > self.max_tokens
+        )
+
+
+def recent_turns(history: List[Message], keep_turns: int) -> List[Message]:
+    """
+    The messages of the last `keep_turns` turns, each starting at a user message.
+    """
+    if keep_turns <= 0:
+        return []
+    user_indexes = [index for index, message in enumerate(history) if message["role"] == "user"]
+    if not user_indexes:
+        return []
+    return history[user_indexes[-min(keep_turns, len(user_indexes))]:]
+
+
+def format_seed_message(summary: Optional[str], turns: List[Message]) -> str:
+    """
+    The first message of a new thread that continues a conversation. Threads can only be seeded
+    with user messages, so earlier turns are quoted in it rather than replayed.
+    """
+    lines: List[str] = []
+    if summary is not None:
+        lines += ["Summary of our conversation so far:", "", summary.strip(), ""]
+        heading = "Our most recent exchanges, verbatim:"
+    else:
+        heading = "Our conversation so far, verbatim:"
+    if turns:
+        lines.append(heading)
+        for message in turns:
+            lines += ["", f"{message['role'].capitalize()}: {message['content'].strip()}"]
+        lines.append("")
+    lines.append("Continue the conversation from here.")
+    return "\n".join(lines)
+
+
+def split_message(text: str, max_chars: int = MAX_MESSAGE_CHARS) -> List[str]:
+    """
+    Split `text` into as few messages of at most `max_chars` characters as possible, between
+    paragraphs unless a paragraph is longer than that.
+    """
+    chunks: List[str] = []
+    current = ""
+    for paragraph in text.split("\n\n"):
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if not current:
+            current = paragraph
+        elif len(current) + 2 + len(paragraph) <= max_chars:
+            current += "\n\n" + paragraph
+        else:
+            chunks.append(current)
+            current = paragraph
+    if current:
+        chunks.append(current)
+    return chunks
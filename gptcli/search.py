@@ -0,0 +1,145 @@
+"""
+This module maintains a local full-text index over past conversations.
+
+Messages are stored in an SQLite FTS5 table, so ranked queries stay fast across hundreds of
+thousands of messages.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import List, NamedTuple, Optional
+
+from gptcli.assistant import AssistantThread
+from gptcli.config import DEFAULT_SEARCH_INDEX_PATH
+from gptcli.session import ChatListener
+from gptcli.transcript import EVENT_MESSAGE, TranscriptReader
+from gptcli.types import Message
+
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+    content,
+    role UNINDEXED,
+    assistant_id UNINDEXED,
+    thread_id UNINDEXED,
+    created_at UNINDEXED,
+    tokenize = 'porter unicode61'
+);
+"""
+
+
+class SearchHit(NamedTuple):
+    assistant_id: str
+    thread_id: str
+    role: str
+    created_at: float
+    snippet: str
+    score: float
+
+
+def to_match_expression(query: str) -> str:
+    """
+    Quote every term so that user input is never interpreted as FTS5 query syntax.
+    """
+    return " ".join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class SearchIndex:
+    def __init__(self, path: str = DEFAULT_SEARCH_INDEX_PATH):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def add(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        role: str,
+        content: str,
+        created_at: Optional[float] = None,
+    ):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT INTO messages (content, role, assistant_id, thread_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                (
+                    content,
+                    role,
+                    assistant_id,
+                    thread_id,
+                    created_at if created_at is not None else time.time(),
+                ),
+            )
+
+    def search(self, query: str, limit: int = 10) -> List[SearchHit]:
+        expression = to_match_expression(query)
+        if not expression:
+            return []
+        with self.lock:
+            rows = self.connection.execute(
+                """
+                SELECT assistant_id, thread_id, role, created_at,
+                       snippet(messages, 0, '**', '**', '...', 16), bm25(messages)
+                FROM messages
+                WHERE messages MATCH ?
+                ORDER BY bm25(messages)
+                LIMIT ?
+                """,
+                (expression, limit),
+            ).fetchall()
+        return [SearchHit(*row) for row in rows]
+
+    def rebuild(self, transcript_paths: List[str]) -> int:
+        """
+        Replace the contents of the index with the messages of the given transcripts.
+        Returns the number of indexed messages.
+        """
+        count = 0
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM messages")
+            for path in transcript_paths:
+                rows = [
+                    (
+                        record["content"],
+                        record["role"],
+                        record.get("assistant_id", ""),
+                        record.get("thread_id", ""),
+                        record["ts"],
+                    )
+                    for record in TranscriptReader(path).records()
+                    if record.get("event") == EVENT_MESSAGE
+                ]
+                self.connection.executemany(
+                    "INSERT INTO messages (content, role, assistant_id, thread_id, created_at) VALUES (?, ?, ?, ?, ?)",
+                    rows,
+                )
+                count += len(rows)
+        return count
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SearchIndexChatListener(ChatListener):
+    """
+    Adds every message of the session to the search index as it happens.
+    """
+
+    def __init__(self, assistant: AssistantThread, index: SearchIndex):
+        self.assistant = assistant
+        self.index = index
+
+    def on_chat_message(self, message: Message):
+        self.index.add(
+            self.assistant.get_assistant_id(),
+            self.assistant.get_thread_id(),
+            message["role"],
+            message["content"],
+        )
@@ -1,8 +1,18 @@
+import logging
+import os
+import shlex
+import threading
+import time
 from abc import abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from attr import dataclass
 from openai import BadRequestError, OpenAIError
 from gptcli.types import Message
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 from gptcli.assistant import AssistantThread, thread_message_to_text
+from gptcli import metrics
+from gptcli.attachments import format_upload_results
+from gptcli.trace import span
 
 class ResponseStreamer:
     def __enter__(self) -> "ResponseStreamer":
@@ -15,7 +25,33 @@ class ResponseStreamer:
         pass
 
 
+class UploadProgress:
+    def __enter__(self) -> "UploadProgress":
+        return self
+
+    def on_progress(self, path: str, sent: int, total: int):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+@dataclass(frozen=True)
+class CoalescePolicy:
+    """
+    How a listener wants streamed tokens batched: a chunk is delivered once `interval` seconds
+    have passed since the previous one or once it holds `max_chars` characters (0 means no
+    size limit). Whatever is left is delivered when the stream ends.
+    """
+
+    interval: float = 0.0
+    max_chars: int = 0
+
+
 class ChatListener:
+    # Listeners that don't need every token as it arrives can ask for larger chunks.
+    coalesce_policy: Optional[CoalescePolicy] = None
+
     def on_chat_start(self):
         pass
 
@@ -25,12 +61,24 @@ class ChatListener:
     def on_chat_rerun(self, success: bool):
         pass
 
+    def on_rerun_candidate(self, index: int, count: int, message: Optional[Message]):
+        """
+        One of `count` alternative answers of `:rerun <count>` is ready, or failed when `message` is None.
+        """
+        pass
+
     def on_error(self, error: Exception):
         pass
 
+    def on_thread_rollover(self, old_thread_id: str, new_thread_id: str, summary: str):
+        pass
+
     def response_streamer(self) -> ResponseStreamer:
         return ResponseStreamer()
 
+    def upload_progress(self) -> UploadProgress:
+        return UploadProgress()
+
     def on_chat_message(self, message: Message):
         pass
 
@@ -50,63 +98,257 @@ class UserInputProvider:
     def get_user_input(self) -> Tuple[str, Dict[str, Any]]:
         pass
 
+    def notify(self, message: str):
+        """
+        Tell the user about something that happened in the background. May be called from any thread.
+        """
+        pass
+
 
 class InvalidArgumentError(Exception):
     def __init__(self, message: str):
         self.message = message
 
 
+# Each alternative answer of `:rerun <k>` is its own thread and run
+MAX_CANDIDATES = 8
+
 COMMAND_CLEAR = (":clear", ":c")
 COMMAND_QUIT = (":quit", ":q")
 COMMAND_RERUN = (":rerun", ":r")
 COMMAND_HELP = (":help", ":h", ":?")
-ALL_COMMANDS = [*COMMAND_CLEAR, *COMMAND_QUIT, *COMMAND_RERUN, *COMMAND_HELP]
+COMMAND_SEARCH = (":search", ":s")
+COMMAND_ATTACH = (":attach", ":a")
+COMMAND_PICK = (":pick", ":p")
+COMMAND_DOWNLOAD = (":download", ":d")
+COMMAND_NEW = (":new", ":n")
+COMMAND_SWITCH = (":switch", ":sw")
+COMMAND_THREADS = (":threads", ":t")
+COMMAND_FORK = (":fork", ":f")
+COMMAND_BRANCHES = (":branches", ":b")
+THREAD_COMMANDS = [*COMMAND_NEW, *COMMAND_SWITCH, *COMMAND_THREADS, *COMMAND_FORK, *COMMAND_BRANCHES]
+ALL_COMMANDS = [
+    *COMMAND_CLEAR,
+    *COMMAND_QUIT,
+    *COMMAND_RERUN,
+    *COMMAND_HELP,
+    *COMMAND_SEARCH,
+    *COMMAND_ATTACH,
+    *COMMAND_PICK,
+    *COMMAND_DOWNLOAD,
+    *THREAD_COMMANDS,
+]
 COMMANDS_HELP = """
 Commands:
 - `:clear` / `:c` / Ctrl+C - Clear the conversation.
 - `:quit` / `:q` / Ctrl+D - Quit the program.
 - `:rerun` / `:r` / Ctrl+R - Re-run the last message.
+- `:rerun <k>` / `:r <k>` - Generate k alternative answers (up to 8) to the last message at once.
+- `:pick <n>` / `:p <n>` - Keep alternative answer n and continue from it.
+- `:search <query>` / `:s <query>` - Search all past conversations.
+- `:attach <paths>` / `:a <paths>` - Upload files and attach them to your next message.
+- `:download` / `:d` - Download the files and images generated in this conversation.
+- `:new [assistant]` / `:n [assistant]` - Open another thread, with the same or another assistant.
+- `:switch <n>` / `:sw <n>` - Continue in thread n, or in a thread listed by `:branches` given its id. Ctrl+C while waiting for an answer keeps the run going in the background.
+- `:threads` / `:t` - List the open threads.
+- `:fork [n]` / `:f [n]` - Continue the conversation in a new thread from after turn n, the last one by default.
+- `:branches` / `:b` - List where the active thread was forked from and the branches forked from it, in this session or earlier ones.
 - `:help` / `:h` / `:?` - Show this help message.
 """
 
+
+def format_search_hits(query: str, hits) -> str:
+    if not hits:
+        return f"No results for `{query}`."
+    lines = [f"Results for `{query}`:", ""]
+    for index, hit in enumerate(hits, 1):
+        created_at = time.strftime("%Y-%m-%d %H:%M", time.localtime(hit.created_at))
+        lines.append(
+            f"{index}. **{hit.role}** - {created_at} - assistant `{hit.assistant_id}` - thread `{hit.thread_id}`"
+        )
+        lines.append(f"   {' '.join(hit.snippet.split())}")
+    return "\n".join(lines) + "\n"
+
+def _delete_threads(forks: List[AssistantThread]):
+    for fork in forks:
+        try:
+            fork.delete_thread()
+        except OpenAIError:
+            logging.getLogger("gptcli-session").warning("Failed to delete thread %s", fork.get_thread_id())
+
+
 class ChatSession:
     # This class represents a single CLI session. Including the assistant and messages between it and the user.
     def __init__(
         self,
         assistant: AssistantThread,
         listener: ChatListener,
+        search_index=None,
+        uploader=None,
+        messages: Optional[List[Message]] = None,
     ):
         self.assistant = assistant
-        self.messages: List[Message] = assistant.init_messages()
-        self.user_prompts: List[Message] = []
+        self.search_index = search_index
+        self.uploader = uploader
+        # `messages` continues a conversation the assistant's thread was seeded with
+        self.messages: List[Message] = messages if messages is not None else assistant.init_messages()
+        defaults = len(assistant.config.get("messages", []))
+        self.user_prompts: List[Message] = [
+            message for message in self.messages[defaults:] if message["role"] == "user"
+        ]
+        self.pending_file_ids: List[str] = []
+        # Alternative answers of `:rerun <k>`, as (forked assistant, answer) pairs
+        # The forks of the last `:rerun <k>` and their answers. The fork of an answer the user stopped
+        # waiting for is None, it's already being deleted.
+        self.candidates: List[Tuple[Optional[AssistantThread], Optional[Message]]] = []
         self.listener = listener
+        self.assistant.rollover_callbacks.append(self.listener.on_thread_rollover)
+        metrics.session_opened()
 
     def _clear(self):
+        self._discard_candidates()
         self.messages = self.assistant.init_messages()
         self.user_prompts = []
         self.listener.on_chat_clear()
 
-    def _rerun(self):
+    def _rerun(self, count: int = 1):
         if len(self.user_prompts) == 0:
             self.listener.on_chat_rerun(False)
             return
+        if count > 1:
+            self._rerun_candidates(count)
+            return
 
+        self._discard_candidates()
         if self.messages[-1]["role"] == "assistant":
             self.messages = self.messages[:-1]
+        if hasattr(self.assistant, "discard_answer"):
+            self.assistant.discard_answer()
 
         self.listener.on_chat_rerun(True)
         self._get_response()
 
-    def _get_response(self) -> bool:
+    def _rerun_candidates(self, count: int):
+        """
+        Answer the last message `count` times at once, each in its own fork of the thread.
+        """
+        if not hasattr(self.assistant, "fork"):
+            self.listener.on_error(InvalidArgumentError("This session can't generate alternative answers."))
+            return
+        self._discard_candidates()
+        self.listener.on_chat_rerun(True)
+        try:
+            forks = self.assistant.fork(count)
+        except OpenAIError as e:
+            self.listener.on_error(e)
+            return
+
+        def answer(fork: AssistantThread) -> Message:
+            fork.run_thread()
+            thread_messages = fork.fetch_messages(since_last_user_message=True)
+            return {"role": "assistant", "content": "".join(thread_message_to_text(thread_messages))}
+
+        candidates: List[Optional[Message]] = [None] * count
+        kept: List[Optional[AssistantThread]] = list(forks)
+        reported = set()
+        executor = ThreadPoolExecutor(max_workers=count, thread_name_prefix="gptcli-rerun")
+        futures = {executor.submit(answer, fork): index for index, fork in enumerate(forks)}
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    candidates[index] = future.result()
+                except Exception as e:
+                    self.listener.on_error(e)
+                # Every candidate is reported, so the listener knows when they're all in
+                reported.add(index)
+                self.listener.on_rerun_candidate(index, count, candidates[index])
+        except KeyboardInterrupt:
+            # Keep the answers that arrived, and stop the runs of the others by deleting their threads
+            unfinished = [index for index in range(count) if index not in reported]
+            for index in unfinished:
+                self.listener.on_rerun_candidate(index, count, None)
+            threading.Thread(
+                target=_delete_threads, args=([forks[index] for index in unfinished],), daemon=True
+            ).start()
+            for index in unfinished:
+                kept[index] = None
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        self.candidates = list(zip(kept, candidates))
+        if any(candidates):
+            with self.listener.response_streamer() as stream:
+                stream.on_next_token(
+                    "Keep an answer with `:pick <n>`. Sending a message keeps the first one.\n"
+                )
+
+    def _pick(self, number: int):
+        """
+        Continue the conversation from alternative answer `number` (1-based) of the last `:rerun <k>`.
+        """
+        if not (1 <= number <= len(self.candidates)) or self.candidates[number - 1][1] is None:
+            self.listener.on_error(InvalidArgumentError(f"No answer {number} to pick."))
+            return
+        fork, response_message = self.candidates[number - 1]
+        assert fork is not None and response_message is not None
+        self.assistant.adopt(fork)
+        self._discard_candidates(keep=fork)
+
+        if self.messages[-1]["role"] == "assistant":
+            self.messages = self.messages[:-1]
+        self.listener.on_chat_message(response_message)
+        self.listener.on_chat_response(self.messages, response_message)
+        self.messages = self.messages + [response_message]
+
+    def _pick_default(self):
+        for number, (_, message) in enumerate(self.candidates, 1):
+            if message is not None:
+                self._pick(number)
+                return
+        self._discard_candidates()
+
+    def _discard_candidates(self, keep: Optional[AssistantThread] = None):
+        forks = [fork for fork, _ in self.candidates if fork is not None and fork is not keep]
+        self.candidates = []
+        if forks:
+            # Nobody waits for the unused threads to be deleted
+            threading.Thread(target=_delete_threads, args=(forks,), daemon=True).start()
+
+    def _fetch_response(self) -> List[str]:
+        self.assistant.run_thread()
+        # Fetch the text of all recent messages
+        thread_messages = self.assistant.fetch_messages(since_last_user_message=True)
+        return thread_message_to_text(thread_messages)
+
+    def _start_response(self) -> Future:
+        """
+        Run the thread in the background. The result is passed to `_finish_turn` once it's done.
+        """
+        future: Future = Future()
+
+        def fetch():
+            try:
+                future.set_result(self._fetch_response())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=fetch, name="gptcli-run", daemon=True).start()
+        return future
+
+    def _finish_turn(self, pending: Optional[Future] = None):
+        response_saved = self._get_response(pending)
+        if not response_saved:
+            self._rollback_user_message()
+
+    def _get_response(self, pending: Optional[Future] = None) -> bool:
         """
         Respond to the user's input and return whether the assistant's response was saved.
+        `pending` is a run started earlier by `_start_response`.
         """
         next_response: str = ""
         try:
-            self.assistant.run_thread()
-            # Fetch the text of all recent messages
-            thread_messages = self.assistant.fetch_messages(since_last_user_message=True)
-            thread_texts = thread_message_to_text(thread_messages)
+            thread_texts = self._fetch_response() if pending is None else pending.result()
 
             with self.listener.response_streamer() as stream:
                 for response in thread_texts:
@@ -131,7 +373,11 @@ class ChatSession:
 
     def _add_user_message(self, user_input: str) -> Message:
         user_message: Message = {"role": "user", "content": user_input}
-        self.assistant.add_message(user_message)
+        if self.pending_file_ids:
+            self.assistant.add_message(user_message, file_ids=self.pending_file_ids)
+            self.pending_file_ids = []
+        else:
+            self.assistant.add_message(user_message)
         self.messages = self.messages + [user_message]
         self.listener.on_chat_message(user_message)
         self.user_prompts.append(user_message)
@@ -145,7 +391,58 @@ class ChatSession:
         with self.listener.response_streamer() as stream:
             stream.on_next_token(COMMANDS_HELP)
 
+    def _search(self, query: str):
+        if self.search_index is None:
+            self.listener.on_error(InvalidArgumentError("Search is disabled."))
+            return
+        if not query:
+            self.listener.on_error(InvalidArgumentError("Usage: :search <query>"))
+            return
+
+        hits = self.search_index.search(query)
+        with self.listener.response_streamer() as stream:
+            stream.on_next_token(format_search_hits(query, hits))
+
+    def _download(self):
+        downloader = getattr(self.assistant, "downloader", None)
+        if downloader is None:
+            self.listener.on_error(InvalidArgumentError("Downloads are disabled."))
+            return
+        if not self.assistant.generated_files:
+            self.listener.on_error(InvalidArgumentError("No files were generated in this conversation."))
+            return
+
+        lines = ["Downloading:", ""]
+        for file in self.assistant.generated_files:
+            download = downloader.download(file.file_id, file.filename, file.size)
+            lines.append(f"- {os.path.basename(file.filename)} to `{download.path}`")
+        with self.listener.response_streamer() as stream:
+            stream.on_next_token("\n".join(lines) + "\n")
+
+    def attach(self, paths: List[str]):
+        """
+        Upload `paths` and attach them to the next user message.
+        """
+        if self.uploader is None:
+            self.listener.on_error(InvalidArgumentError("Attachments are disabled."))
+            return
+        if not paths:
+            self.listener.on_error(InvalidArgumentError("Usage: :attach <paths>"))
+            return
+
+        try:
+            with self.listener.upload_progress() as progress:
+                results = self.uploader.upload(paths, progress.on_progress)
+        except (OSError, OpenAIError) as e:
+            self.listener.on_error(e)
+            return
+
+        self.pending_file_ids += [result.file_id for result in results]
+        with self.listener.response_streamer() as stream:
+            stream.on_next_token(format_upload_results(results))
+
     def _quit(self):
+        metrics.session_opened(-1)
         self.listener.on_chat_end()
 
     def process_input(self, user_input: str, args: Dict[str, Any]):
@@ -155,23 +452,56 @@ class ChatSession:
         if not self._validate_args(args):
             return True
 
+        command, _, command_args = user_input.partition(" ")
         if user_input in COMMAND_QUIT:
             self._quit()
             return False
         elif user_input in COMMAND_CLEAR:
             self._clear()
             return True
-        elif user_input in COMMAND_RERUN:
-            self._rerun()
+        elif command in COMMAND_RERUN:
+            if command_args.strip() and not (
+                command_args.strip().isdigit() and 1 <= int(command_args.strip()) <= MAX_CANDIDATES
+            ):
+                self.listener.on_error(
+                    InvalidArgumentError(f"Usage: {command} [<number of answers, up to {MAX_CANDIDATES}>]")
+                )
+            else:
+                self._rerun(int(command_args.strip() or 1))
+            return True
+        elif command in COMMAND_PICK:
+            if not command_args.strip().isdigit():
+                self.listener.on_error(InvalidArgumentError(f"Usage: {command} <answer number>"))
+            else:
+                self._pick(int(command_args.strip()))
             return True
         elif user_input in COMMAND_HELP:
             self._print_help()
             return True
+        elif command in COMMAND_SEARCH:
+            self._search(command_args.strip())
+            return True
+        elif command in COMMAND_ATTACH:
+            try:
+                paths = shlex.split(command_args)
+            except ValueError as e:
+                self.listener.on_error(InvalidArgumentError(f"Usage: {command} <paths> ({e})"))
+            else:
+                self.attach(paths)
+            return True
+        elif user_input in COMMAND_DOWNLOAD:
+            self._download()
+            return True
+        elif command in THREAD_COMMANDS:
+            self.listener.on_error(InvalidArgumentError("This session has a single thread."))
+            return True
 
-        self._add_user_message(user_input)
-        response_saved = self._get_response()
-        if not response_saved:
-            self._rollback_user_message()
+        if self.candidates:
+            self._pick_default()
+
+        with span("turn"):
+            self._add_user_message(user_input)
+            self._finish_turn()
 
         return True
 
@@ -187,7 +517,22 @@ class ChatSession:
                 return False
         return True
     
+    def resume(self):
+        """
+        Show the answer to the last message, whose run was started by an earlier process that
+        died before reading the answer. Nothing is sent again.
+        """
+        user_message = self.user_prompts[-1]
+        quote = "\n".join("> " + line for line in user_message["content"].splitlines())
+        with self.listener.response_streamer() as stream:
+            stream.on_next_token(f"Picking up the answer to your last message of an earlier session:\n\n{quote}\n")
+        self.listener.on_chat_message(user_message)
+        with span("turn"):
+            self._finish_turn()
+
     def loop(self, input_provider: UserInputProvider):
         self.listener.on_chat_start()
+        if getattr(self.assistant, "resumed_run", None) is not None:
+            self.resume()
         while self.process_input(*input_provider.get_user_input()):
             pass
@@ -0,0 +1,164 @@
+"""
+Run the function tools that assistants call.
+
+A run of an assistant with function tools stops in `requires_action` until the outputs of the
+calls it asked for are submitted. `tools` in the config file says how to run each function:
+
+    tools:
+      get_weather:
+        python: my_package.weather:get_weather
+        timeout: 10
+      grep_notes:
+        command: [sh, -c, "jq -r .pattern | xargs grep -rn ~/notes -e"]
+
+A `python` tool is called with the arguments as keyword arguments, and a result that isn't a
+string is sent as JSON. A `command` tool is run with the arguments as JSON on its standard input,
+and its standard output is the result. The command is a list of arguments, or a string split like
+a shell would, but it isn't run by a shell: what the assistant sends never reaches a command line.
+All calls of a run are made at once, so the run waits for the slowest tool rather than for all of
+them in turn. A tool that fails or takes longer than its timeout, counted from when it starts,
+answers with an error message, which the assistant can act on.
+"""
+
+import importlib
+import json
+import logging
+import shlex
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict, Union
+
+from attr import dataclass
+
+from gptcli.trace import span
+
+DEFAULT_TIMEOUT = 30.0
+
+logger = logging.getLogger("gptcli-tools")
+
+
+class ToolConfig(TypedDict, total=False):
+    python: str
+    command: Union[str, List[str]]
+    timeout: float
+
+
+class ToolError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Tool:
+    # Takes the parsed arguments and returns the output
+    function: Callable[[Dict[str, Any]], Any]
+    timeout: float = DEFAULT_TIMEOUT
+
+
+def python_tool(path: str, timeout: float = DEFAULT_TIMEOUT) -> Tool:
+    """
+    A tool calling the function at `path`, written `package.module:function`.
+    """
+    module_name, _, function_name = path.partition(":")
+    try:
+        function = getattr(importlib.import_module(module_name), function_name)
+    except (ImportError, AttributeError) as e:
+        raise ValueError(f"Can't load the tool function {path}: {e}")
+    return Tool(lambda arguments: function(**arguments), timeout)
+
+
+def command_tool(command: Union[str, List[str]], timeout: float = DEFAULT_TIMEOUT) -> Tool:
+    argv = shlex.split(command) if isinstance(command, str) else list(command)
+
+    def run(arguments: Dict[str, Any]) -> str:
+        try:
+            process = subprocess.run(
+                argv,
+                input=json.dumps(arguments),
+                capture_output=True,
+                text=True,
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            raise ToolError(f"timed out after {timeout:g}s")
+        except OSError as e:
+            raise ToolError(f"can't run {argv[0]}: {e}")
+        if process.returncode != 0:
+            raise ToolError(f"exit status {process.returncode}: {process.stderr.strip()}")
+        return process.stdout
+
+    return Tool(run, timeout)
+
+
+def tool_from_config(name: str, config: ToolConfig) -> Tool:
+    timeout = config.get("timeout", DEFAULT_TIMEOUT)
+    if "python" in config:
+        return python_tool(config["python"], timeout)
+    if "command" in config:
+        return command_tool(config["command"], timeout)
+    raise ValueError(f"Tool {name} needs either `python` or `command`")
+
+
+def _format_output(result: Any) -> str:
+    return result if isinstance(result, str) else json.dumps(result)
+
+
+class ToolRegistry:
+    def __init__(self, tools: Dict[str, Tool], max_workers: int = 8):
+        self.tools = tools
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gptcli-tool")
+
+    @classmethod
+    def from_config(cls, tools: Dict[str, ToolConfig], max_workers: int = 8) -> "ToolRegistry":
+        return cls(
+            {name: tool_from_config(name, config) for name, config in tools.items()}, max_workers
+        )
+
+    def _call(self, name: str, arguments: str, started: Future) -> Any:
+        started.set_result(time.monotonic())
+        with span("tool", name):
+            return self.tools[name].function(json.loads(arguments or "{}"))
+
+    def run_calls(self, tool_calls) -> List[Dict[str, str]]:
+        """
+        Make all `tool_calls` of a run at once, and return their outputs in the form
+        `runs.submit_tool_outputs` takes.
+        """
+        # Each call's timeout counts from when a worker starts it, not while it waits for one
+        futures: List[Optional[Tuple[Future, Future]]] = []
+        for call in tool_calls:
+            name = call.function.name
+            if name in self.tools:
+                started: Future = Future()
+                futures.append(
+                    (started, self.executor.submit(self._call, name, call.function.arguments, started))
+                )
+            else:
+                futures.append(None)
+
+        outputs = []
+        for call, futures_of_call in zip(tool_calls, futures):
+            name = call.function.name
+            if futures_of_call is None:
+                outputs.append({"tool_call_id": call.id, "output": f"Error: no tool called {name} is configured"})
+                continue
+            started, future = futures_of_call
+            timeout = self.tools[name].timeout
+            try:
+                # `future` ends without starting if the registry is closed meanwhile
+                wait([started, future], return_when=FIRST_COMPLETED)
+                deadline = started.result() + timeout if started.done() else time.monotonic()
+                output = _format_output(future.result(timeout=max(0.0, deadline - time.monotonic())))
+            except FutureTimeoutError:
+                # Python can't stop the function, its result will be ignored
+                output = f"Error: {name} timed out after {timeout:g}s"
+                logger.warning(output)
+            except Exception as e:
+                output = f"Error: {name} failed: {e}"
+                logger.warning(output)
+            outputs.append({"tool_call_id": call.id, "output": output})
+        return outputs
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
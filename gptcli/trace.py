@@ -0,0 +1,114 @@
+"""
+This module records timing spans in the Chrome trace-event format.
+
+Tracing is off unless `start_tracing` is called. While it is off, `span` returns a shared no-op
+context manager, so instrumented code pays for little more than a function call.
+The saved file can be opened in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer: "Tracer", name: str, detail: Optional[str]):
+        self.tracer = tracer
+        self.name = name
+        self.detail = detail
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.tracer.add_complete_event(
+            self.name, self.detail, self.start, time.perf_counter_ns()
+        )
+
+
+class Tracer:
+    def __init__(self):
+        self.origin = time.perf_counter_ns()
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self.thread_names: Dict[int, str] = {}
+        self.lock = threading.Lock()
+
+    def span(self, name: str, detail: Optional[str] = None) -> Span:
+        return Span(self, name, detail)
+
+    def add_complete_event(self, name: str, detail: Optional[str], start: int, end: int):
+        thread = threading.current_thread()
+        event: Dict[str, Any] = {
+            "name": name,
+            "ph": "X",
+            "ts": (start - self.origin) / 1000,
+            "dur": (end - start) / 1000,
+            "pid": self.pid,
+            "tid": thread.ident,
+        }
+        if detail is not None:
+            event["args"] = {"detail": detail}
+        with self.lock:
+            self.events.append(event)
+            if thread.ident not in self.thread_names:
+                self.thread_names[thread.ident] = thread.name
+
+    def save(self, path: str):
+        with self.lock:
+            metadata = [
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self.pid,
+                    "tid": tid,
+                    "args": {"name": name},
+                }
+                for tid, name in self.thread_names.items()
+            ]
+            events = metadata + self.events
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+_tracer: Optional[Tracer] = None
+
+
+def span(name: str, detail: Optional[str] = None):
+    """
+    Time the enclosed block as a span called `name`, with an optional detail string.
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return _tracer.span(name, detail)
+
+
+def start_tracing() -> Tracer:
+    global _tracer
+    _tracer = Tracer()
+    return _tracer
+
+
+def stop_tracing(path: Optional[str] = None):
+    """
+    Stop recording spans and, if `path` is given, write them out.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None and path is not None:
+        tracer.save(path)
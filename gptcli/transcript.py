@@ -0,0 +1,211 @@
+"""
+This module defines the structured transcript format and reads it back.
+
+A transcript is a JSONL file with one record per chat event. Next to it, `<transcript>.idx` holds
+one fixed-size entry per turn (byte offset, turn number, timestamp), so readers can jump to a
+turn or a point in time without scanning the transcript from the start.
+Rotated segments may be compressed; index offsets always refer to the uncompressed stream.
+"""
+
+import bisect
+import gzip
+import io
+import json
+import os
+import struct
+import time
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from rich.console import Console
+
+from gptcli.session import ChatListener
+
+EVENT_CHAT_START = "chat_start"
+EVENT_CHAT_CLEAR = "chat_clear"
+EVENT_CHAT_RERUN = "chat_rerun"
+EVENT_ERROR = "error"
+EVENT_MESSAGE = "message"
+EVENT_CHAT_END = "chat_end"
+EVENT_THREAD_ROLLOVER = "thread_rollover"
+
+TRANSCRIPT_SUFFIX = ".jsonl"
+INDEX_SUFFIX = ".idx"
+
+# offset: uint64, turn: uint64, timestamp: float64
+INDEX_ENTRY = struct.Struct("<QQd")
+
+
+class IndexEntry(NamedTuple):
+    offset: int
+    turn: int
+    timestamp: float
+
+
+def make_record(event: str, **fields: Any) -> Dict[str, Any]:
+    record: Dict[str, Any] = {"ts": time.time(), "event": event}
+    record.update((key, value) for key, value in fields.items() if value is not None)
+    return record
+
+
+def encode_record(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def index_path_for(path: str) -> str:
+    for suffix in (".gz", ".zst"):
+        if path.endswith(suffix):
+            path = path[: -len(suffix)]
+    return path + INDEX_SUFFIX
+
+
+def read_index(path: str) -> List[IndexEntry]:
+    """
+    Read the sidecar index of the transcript at `path`. Returns an empty list if there is none.
+    """
+    try:
+        with open(index_path_for(path), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    # Ignore a trailing partial entry left behind by a crash.
+    data = data[: len(data) - len(data) % INDEX_ENTRY.size]
+    return [IndexEntry(*entry) for entry in INDEX_ENTRY.iter_unpack(data)]
+
+
+def _open_transcript(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    if path.endswith(".zst"):
+        import zstandard
+
+        # The decompression reader can't iterate lines and may return short reads
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb")))
+    return open(path, "rb")
+
+
+class TranscriptReader:
+    def __init__(self, path: str):
+        self.path = path
+        self.index = read_index(path)
+
+    def records(self, offset: int = 0) -> Iterator[Dict[str, Any]]:
+        """
+        Yield records starting at byte `offset` of the (uncompressed) transcript.
+        """
+        for _, record in self.scan(offset):
+            yield record
+
+    def scan(self, offset: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """
+        Like `records`, but also yield the offset right after each record, where a later scan can resume.
+        """
+        with _open_transcript(self.path) as f:
+            if offset:
+                if self.path.endswith(".zst"):
+                    # zstd streams can only seek forward by reading.
+                    f.read(offset)
+                else:
+                    f.seek(offset)
+            for line in f:
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    yield offset, json.loads(line)
+                except json.JSONDecodeError:
+                    # The last line may be incomplete if the writer was interrupted.
+                    return
+
+    def from_turn(self, turn: int) -> Iterator[Dict[str, Any]]:
+        turns = [entry.turn for entry in self.index]
+        position = bisect.bisect_left(turns, turn)
+        if position == len(self.index):
+            offset = self.index[-1].offset if self.index else 0
+        else:
+            offset = self.index[position].offset
+        for record in self.records(offset):
+            if record.get("turn", turn) >= turn:
+                yield record
+
+    def time_range(
+        self, start: Optional[float] = None, end: Optional[float] = None
+    ) -> Iterator[Dict[str, Any]]:
+        offset = 0
+        if start is not None and self.index:
+            timestamps = [entry.timestamp for entry in self.index]
+            # Start from the last turn that began before `start`, it may still contain later events.
+            position = bisect.bisect_right(timestamps, start) - 1
+            if position >= 0:
+                offset = self.index[position].offset
+        for record in self.records(offset):
+            if start is not None and record["ts"] < start:
+                continue
+            if end is not None and record["ts"] > end:
+                return
+            yield record
+
+
+def transcript_segments(path: str) -> List[str]:
+    """
+    Return the rotated segments of the transcript at `path` followed by the active file, oldest first.
+    """
+    segments = []
+    index = 1
+    while True:
+        for suffix in ("", ".gz", ".zst"):
+            if os.path.exists(f"{path}.{index}{suffix}"):
+                segments.append(f"{path}.{index}{suffix}")
+                break
+        else:
+            break
+        index += 1
+    if os.path.exists(path):
+        segments.append(path)
+    return segments
+
+
+def records_from_turn(segments: List[str], turn: int) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the records of `turn` onwards from the rotated `segments` of a transcript. Only the
+    segment where the turn starts is seeked into, the later ones are read from their start.
+    """
+    started = False
+    for segment in segments:
+        reader = TranscriptReader(segment)
+        if started:
+            yield from reader.records()
+        elif not reader.index or reader.index[-1].turn >= turn:
+            started = True
+            yield from reader.from_turn(turn)
+
+
+def replay_transcript(
+    records: Iterator[Dict[str, Any]], listener: ChatListener, console: Console
+):
+    """
+    Render stored transcript records through `listener` as if the conversation was happening now.
+    """
+    for record in records:
+        event = record.get("event")
+        if event == EVENT_MESSAGE:
+            message = {"role": record["role"], "content": record["content"]}
+            if message["role"] == "user":
+                console.print(
+                    f"> {message['content']}", style="bold", markup=False, highlight=False
+                )
+            listener.on_chat_message(message)
+            if message["role"] == "assistant":
+                with listener.response_streamer() as stream:
+                    stream.on_next_token(message["content"])
+        elif event == EVENT_CHAT_CLEAR:
+            listener.on_chat_clear()
+        elif event == EVENT_CHAT_RERUN:
+            listener.on_chat_rerun(True)
+        elif event == EVENT_THREAD_ROLLOVER:
+            listener.on_thread_rollover(
+                record.get("old_thread_id", ""), record.get("new_thread_id", ""), record.get("summary", "")
+            )
+        elif event == EVENT_ERROR:
+            console.print(
+                f"Error: {record.get('error')}", style="red", markup=False, highlight=False
+            )
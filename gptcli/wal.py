@@ -0,0 +1,128 @@
+"""
+A write-ahead log of the runs being waited for.
+
+If the CLI dies while a run is going (the SSH connection drops, the OOM killer, Ctrl-\\), the run
+carries on server-side but nobody reads its answer, and asking again pays for another run. So
+before polling a run, its thread, id and the message it answers are written to a small record in
+`run_log_dir`, which is removed once the answer has been read. A record left behind by a process
+that no longer exists is an answer that was never read: the next session on the same assistant
+continues that thread and waits for the run instead of starting a new one. Only the latest such
+run of an assistant is continued, and records older than `max_age` are dropped unread.
+
+Each record is its own file, written to a temporary name, flushed to disk and renamed, so a crash
+leaves either the whole record or none of it, and sessions running side by side don't share a file.
+"""
+
+import json
+import os
+import socket
+import time
+from typing import List, NamedTuple, Optional
+
+from gptcli.config import DEFAULT_RUN_LOG_DIR
+from gptcli.types import Message
+
+RECORD_SUFFIX = ".json"
+# Answers left unread for longer than this are no longer worth resuming the conversation for
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
+class PendingRun(NamedTuple):
+    thread_id: str
+    run_id: str
+    assistant_id: str
+    # The message the run answers, and its id in the thread
+    message_id: str
+    user_message: Message
+    started_at: float
+    # The process waiting for the run
+    pid: int
+    hostname: str
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class RunLog:
+    def __init__(self, directory: str = DEFAULT_RUN_LOG_DIR, max_age: float = DEFAULT_MAX_AGE):
+        self.directory = directory
+        self.max_age = max_age
+
+    def _path(self, run_id: str) -> str:
+        return os.path.join(self.directory, run_id + RECORD_SUFFIX)
+
+    def begin(
+        self, thread_id: str, run_id: str, assistant_id: str, message_id: str, user_message: Message
+    ) -> PendingRun:
+        """
+        Record that this process is waiting for `run_id`.
+        """
+        pending = PendingRun(
+            thread_id, run_id, assistant_id, message_id, user_message, time.time(), os.getpid(), socket.gethostname()
+        )
+        self._write(pending)
+        return pending
+
+    def claim(self, pending: PendingRun) -> PendingRun:
+        """
+        Take over the record of a run an earlier process was waiting for.
+        """
+        claimed = pending._replace(pid=os.getpid(), hostname=socket.gethostname())
+        self._write(claimed)
+        return claimed
+
+    def _write(self, pending: PendingRun):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(pending.run_id)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(pending._asdict(), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def end(self, pending: PendingRun):
+        try:
+            os.remove(self._path(pending.run_id))
+        except FileNotFoundError:
+            pass
+
+    def pending(self) -> List[PendingRun]:
+        if not os.path.isdir(self.directory):
+            return []
+        runs = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(RECORD_SUFFIX):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    runs.append(PendingRun(**json.load(f)))
+            except (OSError, ValueError, TypeError):
+                # Removed meanwhile, or not a record
+                continue
+        return sorted(runs, key=lambda run: run.started_at)
+
+    def orphaned(self, assistant_id: Optional[str] = None) -> List[PendingRun]:
+        """
+        The runs whose process died before reading their answer, oldest first. Runs of other
+        machines are left alone, there's no telling whether their process is still there. Records
+        of orphaned runs older than `max_age` are removed.
+        """
+        hostname = socket.gethostname()
+        expired_before = time.time() - self.max_age
+        runs = []
+        for run in self.pending():
+            if run.hostname != hostname or run.pid == os.getpid() or _process_alive(run.pid):
+                continue
+            if run.started_at < expired_before:
+                self.end(run)
+            elif assistant_id is None or run.assistant_id == assistant_id:
+                runs.append(run)
+        return runs
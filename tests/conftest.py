@@ -0,0 +1,41 @@
+from typing import Optional
+
+import pytest
+from openai import OpenAI
+
+from gptcli.assistant import AssistantThread
+from gptcli.fake_server import FakeAssistantsServer, FakeServerConfig
+
+
+@pytest.fixture
+def server_config() -> FakeServerConfig:
+    # Test modules override this fixture to configure their `server`
+    return FakeServerConfig()
+
+
+@pytest.fixture
+def server(server_config):
+    with FakeAssistantsServer(server_config) as server:
+        yield server
+
+
+@pytest.fixture
+def client(server):
+    return OpenAI(api_key="fake", base_url=server.url, max_retries=0)
+
+
+@pytest.fixture
+def make_assistant(server):
+    """
+    Makes an `AssistantThread` talking to `server` through a client of its own. `client_options`
+    are passed to the client.
+    """
+
+    def make_assistant(poll_interval: Optional[float] = None, **client_options) -> AssistantThread:
+        client = OpenAI(api_key="fake", base_url=server.url, **client_options)
+        assistant = AssistantThread({"id": "asst_fake"}, openai_client=client)
+        if poll_interval is not None:
+            assistant.poll_interval = poll_interval
+        return assistant
+
+    return make_assistant
@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from gptcli.attachments import UploadCache, Uploader, file_sha256
+
+
+def write(path, data: bytes):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_uploads_stream_and_report_progress(server, client, tmp_path):
+    data = bytes(range(256)) * 1024
+    path = write(tmp_path / "data.bin", data)
+    progress = []
+    uploader = Uploader(client)
+
+    [result] = uploader.upload([path], lambda *args: progress.append(args))
+
+    assert not result.cached
+    assert result.size == len(data)
+    assert server.state.files[result.file_id][1] == data
+    # httpx reads the file in 64 KiB chunks
+    assert len(progress) > 1
+    assert progress[-1] == (path, len(data), len(data))
+
+
+def test_unchanged_files_are_not_uploaded_again(server, client, tmp_path):
+    first = write(tmp_path / "first.txt", b"same content")
+    copy = write(tmp_path / "copy.txt", b"same content")
+    other = write(tmp_path / "other.txt", b"other content")
+    cache_path = str(tmp_path / "uploads.json")
+
+    results = Uploader(client, UploadCache(cache_path)).upload([first, copy, other])
+    assert server.request_counts["files.create"] == 2
+    assert results[0].file_id == results[1].file_id != results[2].file_id
+    assert [result.cached for result in results] == [False, True, False]
+
+    # A new cache loaded from disk knows both files
+    results = Uploader(client, UploadCache(cache_path)).upload([other, first])
+    assert server.request_counts["files.create"] == 2
+    assert all(result.cached for result in results)
+    with open(cache_path) as f:
+        assert f"assistants:{file_sha256(first)}" in json.load(f)
+
+
+def test_missing_file_uploads_nothing(server, client, tmp_path):
+    path = write(tmp_path / "exists.txt", b"data")
+    with pytest.raises(FileNotFoundError):
+        Uploader(client).upload([path, str(tmp_path / "missing.txt")])
+    assert server.request_counts["files.create"] == 0
+
+
+def test_file_ids_are_sent_with_the_message(client, tmp_path, make_assistant):
+    [result] = Uploader(client).upload([write(tmp_path / "notes.md", b"# notes")])
+    assistant = make_assistant()
+
+    message = assistant.add_message(
+        {"role": "user", "content": "summarize"}, file_ids=[result.file_id]
+    )
+
+    assert message.file_ids == [result.file_id]
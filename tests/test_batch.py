@@ -0,0 +1,136 @@
+import json
+import os
+import threading
+import time
+
+from gptcli.batch import DEFAULT_LEASE_SECONDS, BatchDirectory, BatchWorker, read_prompts
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_batch(path, count=12, shard_size=5, clock=None):
+    items = [{"id": str(i), "prompt": f"prompt {i}"} for i in range(count)]
+    BatchDirectory.create(str(path), "dev", items, shard_size)
+    return BatchDirectory(str(path), clock=clock) if clock else BatchDirectory(str(path))
+
+
+def all_results(directory):
+    results = []
+    for shard in directory.shards:
+        with open(directory.result_path(shard)) as f:
+            results += [json.loads(line) for line in f]
+    return results
+
+
+def test_read_prompts(tmp_path):
+    text = tmp_path / "prompts.txt"
+    text.write_text("first\n\nsecond\n")
+    jsonl = tmp_path / "prompts.jsonl"
+    jsonl.write_text('{"id": "a", "prompt": "x"}\n{"prompt": "y"}\n')
+
+    assert list(read_prompts(str(text))) == [
+        {"id": "0", "prompt": "first"},
+        {"id": "2", "prompt": "second"},
+    ]
+    assert list(read_prompts(str(jsonl))) == [{"id": "a", "prompt": "x"}, {"id": "1", "prompt": "y"}]
+
+
+def test_workers_share_a_batch(tmp_path, make_assistant):
+    directory = make_batch(tmp_path, count=23)
+    assert directory.shards == {"000000": 5, "000001": 5, "000002": 5, "000003": 5, "000004": 3}
+
+    workers = [
+        BatchWorker(
+            BatchDirectory(str(tmp_path)),
+            lambda: make_assistant(max_retries=0),
+            concurrency=2,
+            idle_wait=0.05,
+        )
+        for _ in range(3)
+    ]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    results = all_results(directory)
+    assert sorted(int(result["id"]) for result in results) == list(range(23))
+    assert all(result["response"] == f"Echo: prompt {result['id']}" for result in results)
+    assert os.listdir(tmp_path / "leases") == []
+    status = directory.status()
+    assert (status.done_items, status.done_shards, status.errors) == (23, 5, 0)
+
+
+def test_live_leases_are_exclusive(tmp_path):
+    clock = Clock()
+    directory = make_batch(tmp_path, clock=clock)
+
+    lease = directory.acquire("000000", "a", lease_seconds=60)
+    assert lease is not None and lease.generation == 0
+    assert directory.acquire("000000", "b", lease_seconds=60) is None
+
+    clock.now += 30
+    lease = directory.renew(lease, lease_seconds=60)
+    clock.now += 45
+    assert directory.acquire("000000", "b", lease_seconds=60) is None
+    assert directory.status().leases == [("000000", "a", 15.0)]
+
+
+def test_empty_lease_left_by_a_crash_expires(tmp_path):
+    directory = make_batch(tmp_path)
+    # A worker died after creating its lease file, before writing it
+    path = directory.lease_path("000000", 0)
+    open(path, "w").close()
+    assert directory.acquire("000000", "b", lease_seconds=60) is None
+
+    written_at = time.time() - 2 * DEFAULT_LEASE_SECONDS
+    os.utime(path, (written_at, written_at))
+    lease = directory.acquire("000000", "b", lease_seconds=60)
+    assert lease is not None and lease.generation == 1
+    assert not [name for name in os.listdir(tmp_path / "leases") if name.endswith(".tmp")]
+
+
+def test_expired_lease_is_taken_over_and_partial_results_are_kept(server, tmp_path, make_assistant):
+    clock = Clock()
+    directory = make_batch(tmp_path, count=5, clock=clock)
+    dead = directory.acquire("000000", "dead-worker", lease_seconds=60)
+    with open(directory.part_path("000000", dead.generation), "w") as f:
+        f.write(json.dumps({"id": "0", "response": "from the dead worker"}) + "\n")
+        f.write('{"id": "1", "resp')
+
+    clock.now += 61
+    assert directory.status().expired_leases == 1
+    lease = directory.acquire("000000", "b", lease_seconds=60)
+    assert lease.generation == 1
+    # The dead worker can't renew a lease that was taken over
+    assert directory.renew(dead, lease_seconds=60) is None
+
+    worker = BatchWorker(directory, lambda: make_assistant(max_retries=0), worker_id="b")
+    assert worker.process(lease)
+
+    results = all_results(directory)
+    assert [result["id"] for result in results] == ["0", "1", "2", "3", "4"]
+    assert results[0]["response"] == "from the dead worker"
+    assert results[1]["response"] == "Echo: prompt 1"
+    assert server.request_counts["messages.create"] == 4
+    assert directory.acquire("000000", "c", lease_seconds=60) is None
+
+
+def test_failed_prompts_are_recorded(server, tmp_path, make_assistant):
+    directory = make_batch(tmp_path, count=2, shard_size=2)
+    worker = BatchWorker(directory, lambda: make_assistant(max_retries=0), concurrency=1)
+    # Fail the first request of the first prompt
+    server.inject_errors(1)
+    worker.run()
+
+    results = all_results(directory)
+    assert "InternalServerError" in results[0]["error"]
+    assert results[1]["response"] == "Echo: prompt 1"
+    assert directory.status().errors == 1
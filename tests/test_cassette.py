@@ -0,0 +1,91 @@
+import gzip
+
+import httpx
+import pytest
+from openai import APIConnectionError, OpenAI
+
+from gptcli.assistant import AssistantThread
+from gptcli.cassette import (
+    RecordingTransport,
+    ReplayTransport,
+    cassette_path,
+    read_cassette,
+)
+from gptcli.fake_server import FakeAssistantsServer, FakeServerConfig
+from gptcli.session import ChatListener, ChatSession
+
+
+BASE_URL = "http://127.0.0.1:1/v1"
+
+
+def run_session(client: OpenAI, prompts, poll_interval: float):
+    assistant = AssistantThread({"id": "asst_fake"}, openai_client=client)
+    assistant.poll_interval = poll_interval
+    session = ChatSession(assistant, ChatListener())
+    for prompt in prompts:
+        session.process_input(prompt, {})
+    return session.messages
+
+
+@pytest.fixture
+def recorded(tmp_path):
+    path = cassette_path(str(tmp_path))
+    with FakeAssistantsServer(FakeServerConfig(run_duration=0.05, latency=0.01)) as server:
+        transport = RecordingTransport(path)
+        client = OpenAI(
+            api_key="secret-key", base_url=server.url, http_client=httpx.Client(transport=transport)
+        )
+        messages = run_session(client, ["one", "two"], poll_interval=0.02)
+        transport.close()
+        counts = dict(server.request_counts)
+    return path, messages, counts
+
+
+def test_replay_reproduces_the_session(recorded):
+    path, messages, counts = recorded
+    transport = ReplayTransport(path)
+    client = OpenAI(api_key="fake", base_url=BASE_URL, http_client=httpx.Client(transport=transport))
+
+    assert run_session(client, ["one", "two"], poll_interval=0) == messages
+    assert transport.remaining() == 0
+    assert len(read_cassette(path)) == sum(counts.values())
+
+
+def test_cassette_has_no_credentials(recorded):
+    path, _, _ = recorded
+    with gzip.open(path, "rt") as f:
+        assert "secret-key" not in f.read()
+
+
+def test_time_scale(recorded):
+    path, _, _ = recorded
+    slept = []
+    transport = ReplayTransport(path, time_scale=0.5, sleep=slept.append)
+    client = OpenAI(api_key="fake", base_url=BASE_URL, http_client=httpx.Client(transport=transport))
+    run_session(client, ["one", "two"], poll_interval=0)
+
+    recorded_elapsed = [interaction["elapsed"] for interaction in read_cassette(path)]
+    assert sorted(slept) == sorted(elapsed * 0.5 for elapsed in recorded_elapsed)
+
+
+def test_unrecorded_request_fails(recorded):
+    path, _, _ = recorded
+    client = OpenAI(
+        api_key="fake",
+        base_url=BASE_URL,
+        max_retries=0,
+        http_client=httpx.Client(transport=ReplayTransport(path)),
+    )
+    run_session(client, ["one", "two"], poll_interval=0)
+    with pytest.raises(APIConnectionError):
+        run_session(client, ["three"], poll_interval=0)
+
+
+def test_truncated_cassette_is_readable(recorded):
+    path, _, counts = recorded
+    with open(path, "rb") as f:
+        data = f.read()
+    # Drop the gzip trailer, as if the recording process was killed
+    with open(path, "wb") as f:
+        f.write(data[:-8])
+    assert len(read_cassette(path)) == sum(counts.values())
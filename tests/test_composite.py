@@ -0,0 +1,147 @@
+import threading
+from unittest import mock
+
+from gptcli.composite import (
+    AsyncChatListener,
+    CoalescingResponseStreamer,
+    CompositeChatListener,
+)
+from gptcli.session import ChatListener, CoalescePolicy, ResponseStreamer
+
+
+class RecordingStreamer(ResponseStreamer):
+    def __init__(self, events):
+        self.events = events
+
+    def on_next_token(self, token: str):
+        self.events.append(("token", token))
+
+    def __exit__(self, *args):
+        self.events.append(("exit",))
+
+
+class RecordingListener(ChatListener):
+    def __init__(self, gate=None):
+        self.events = []
+        self.gate = gate
+
+    def on_chat_message(self, message):
+        if self.gate is not None:
+            self.gate.wait()
+        self.events.append(("message", message["content"]))
+
+    def response_streamer(self):
+        return RecordingStreamer(self.events)
+
+    def on_chat_end(self):
+        self.events.append(("end",))
+
+
+def test_preserves_order():
+    inner = RecordingListener()
+    listener = AsyncChatListener(inner)
+    listener.on_chat_message({"role": "user", "content": "a"})
+    with listener.response_streamer() as stream:
+        stream.on_next_token("b")
+        stream.on_next_token("c")
+    listener.on_chat_message({"role": "assistant", "content": "bc"})
+    listener.on_chat_end()
+
+    assert inner.events == [
+        ("message", "a"),
+        ("token", "b"),
+        ("token", "c"),
+        ("exit",),
+        ("message", "bc"),
+        ("end",),
+    ]
+    assert listener.metrics.events == 7
+
+
+def test_drop_when_full():
+    gate = threading.Event()
+    inner = RecordingListener(gate)
+    listener = AsyncChatListener(inner, max_queue_size=2, backpressure="drop")
+    for i in range(10):
+        listener.on_chat_message({"role": "user", "content": str(i)})
+    gate.set()
+    listener.on_chat_end()
+
+    assert listener.metrics.dropped > 0
+    assert inner.events[-1] == ("end",)
+    assert len(inner.events) == 10 - listener.metrics.dropped + 1
+
+
+def test_coalesce_tokens_when_full():
+    gate = threading.Event()
+    inner = RecordingListener(gate)
+    listener = AsyncChatListener(inner, max_queue_size=3, backpressure="coalesce")
+    listener.on_chat_message({"role": "user", "content": "slow"})
+    with listener.response_streamer() as stream:
+        for token in "abcdef":
+            stream.on_next_token(token)
+        gate.set()
+    listener.on_chat_end()
+
+    tokens = "".join(event[1] for event in inner.events if event[0] == "token")
+    assert tokens == "abcdef"
+    assert listener.metrics.coalesced > 0
+
+
+def test_listener_errors_do_not_stop_dispatch():
+    inner = mock.MagicMock()
+    inner.on_chat_clear.side_effect = ValueError("boom")
+    listener = AsyncChatListener(inner)
+    listener.on_chat_clear()
+    listener.on_chat_rerun(True)
+    listener.on_chat_end()
+
+    inner.on_chat_rerun.assert_called_once_with(True)
+    inner.on_chat_end.assert_called_once()
+
+
+def test_coalescing_streamer_batches_by_time_and_size():
+    now = [0.0]
+    inner = mock.MagicMock()
+    stream = CoalescingResponseStreamer(
+        inner, CoalescePolicy(interval=0.05, max_chars=4), clock=lambda: now[0]
+    )
+    with stream:
+        stream.on_next_token("a")
+        stream.on_next_token("b")
+        now[0] = 0.06
+        stream.on_next_token("c")
+        stream.on_next_token("defg")
+        stream.on_next_token("h")
+
+    inner.on_next_token.assert_has_calls(
+        [mock.call("abc"), mock.call("defg"), mock.call("h")]
+    )
+    assert inner.on_next_token.call_count == 3
+    inner.__exit__.assert_called_once()
+
+
+def test_coalescing_streamer_flushes_on_interrupt():
+    inner = mock.MagicMock()
+    stream = CoalescingResponseStreamer(inner, CoalescePolicy(interval=60))
+    try:
+        with stream:
+            stream.on_next_token("partial")
+            raise KeyboardInterrupt
+    except KeyboardInterrupt:
+        pass
+
+    inner.on_next_token.assert_called_once_with("partial")
+
+
+def test_composite_applies_policies_per_listener():
+    fast = RecordingListener()
+    slow = RecordingListener()
+    slow.coalesce_policy = CoalescePolicy(interval=60)
+    composite = CompositeChatListener([fast, slow])
+    with composite.response_streamer() as stream:
+        stream.on_next_token("a")
+        stream.on_next_token("b")
+
+    assert fast.events == [("token", "a"), ("token", "b"), ("exit",)]
+    assert slow.events == [("token", "ab"), ("exit",)]
@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+import tiktoken
+
+from gptcli.cost import DraftEstimator, format_estimate
+from gptcli.encodings import set_cache_dir, write_encoding_cache
+from gptcli.rollover import ENCODING
+
+
+@pytest.fixture(autouse=True)
+def small_encoding(tmp_path):
+    # Stands in for cl100k_base, which can't be downloaded here
+    encoding = tiktoken.Encoding(
+        ENCODING,
+        pat_str=r"""\S+|\s+""",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={},
+    )
+    write_encoding_cache(encoding, str(tmp_path))
+    set_cache_dir(str(tmp_path))
+    yield
+    set_cache_dir(None)
+
+
+def test_estimate_counts_draft_and_thread():
+    messages = [{"role": "user", "content": "abc"}, {"role": "assistant", "content": "de"}]
+    estimator = DraftEstimator(lambda: ("gpt-4-1106-preview", messages))
+
+    estimate = estimator.compute("hello\nworld")
+
+    assert estimate.draft_tokens == len("hello\nworld")
+    # 4 per message plus its role and content, and 2 to prime the reply
+    assert estimate.thread_tokens == (4 + 4 + 3) + (4 + 9 + 2) + 2
+    assert estimate.price == pytest.approx(0.01 / 1000 * (estimate.draft_tokens + estimate.thread_tokens))
+    assert format_estimate(estimate).startswith("Draft: 11 tokens | Thread: 28 tokens | Next message: ~$")
+    estimator.close()
+
+
+def test_lines_are_counted_once():
+    estimator = DraftEstimator(lambda: (None, []))
+    draft = "".join(f"line {i}\n" for i in range(1000))
+    estimator.compute(draft)
+    assert len(estimator._line_tokens) == 1000
+
+    # Typing at the end only encodes the last line again
+    estimate = estimator.compute(draft + "more")
+    assert len(estimator._line_tokens) == 1001
+    assert estimate.draft_tokens == len(draft) + 4
+    assert estimate.price is None
+    estimator.close()
+
+
+def test_updates_are_debounced():
+    computed = []
+    estimator = DraftEstimator(lambda: (None, []), debounce=0.1)
+    original = estimator.compute
+    estimator.compute = lambda draft: computed.append(draft) or original(draft)
+    done = threading.Event()
+    estimator.on_update = done.set
+
+    for length in range(1, 50):
+        estimator.update("x" * length)
+
+    assert done.wait(2)
+    assert computed == ["x" * 49]
+    assert estimator.toolbar() == "Draft: 49 tokens | Thread: 2 tokens"
+    estimator.close()
@@ -0,0 +1,133 @@
+import io
+import subprocess
+import sys
+import threading
+
+import pytest
+from openai import OpenAI
+
+from gptcli.daemon import (
+    AssistantDaemon,
+    DaemonAssistantThread,
+    DaemonClient,
+    DaemonError,
+    daemon_is_running,
+)
+from gptcli.config import GptCliConfig
+from gptcli import daemon_client
+from gptcli.gpt import CLIChatSession
+from gptcli.session import ChatListener, ChatSession
+
+
+@pytest.fixture
+def daemon(server, tmp_path):
+    socket_path = str(tmp_path / "daemon.sock")
+    client = OpenAI(api_key="fake", base_url=server.url, max_retries=0)
+    daemon = AssistantDaemon({"dev": {"id": "asst_dev"}}, socket_path, openai_client=client)
+    thread = threading.Thread(target=daemon.serve_forever, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if daemon_is_running(socket_path):
+            break
+        thread.join(0.01)
+    yield daemon
+    DaemonClient(socket_path).call("shutdown")
+    thread.join(5)
+
+
+def test_session_through_daemon(daemon, server):
+    client = DaemonClient(daemon.socket_path)
+    assistant = DaemonAssistantThread(client, "dev")
+    session = ChatSession(assistant, ChatListener())
+
+    session.process_input("hello", {})
+
+    assert session.messages[-1] == {"role": "assistant", "content": "Echo: hello\n\n\n"}
+    assert assistant.get_assistant_id() == "asst_dev"
+    assert assistant.last_user_message_id is not None
+    assert assistant.last_run_id is not None
+    assert len(assistant.last_response_message_ids) == 1
+    assert client.call("ping")["sessions"] == 1
+    client.close()
+
+
+def test_sessions_share_warm_state(daemon, server):
+    first = DaemonAssistantThread(DaemonClient(daemon.socket_path), "dev")
+    first.init_messages()
+    second = DaemonAssistantThread(DaemonClient(daemon.socket_path), "dev")
+    second.init_messages()
+
+    assert first.get_thread_id() != second.get_thread_id()
+    # The assistant is retrieved once, when the daemon warms up
+    assert server.request_counts["assistants.retrieve"] == 1
+
+
+def test_sessions_are_dropped_with_their_connection(daemon):
+    client = DaemonClient(daemon.socket_path)
+    DaemonAssistantThread(client, "dev").init_messages()
+    client.close()
+
+    other = DaemonClient(daemon.socket_path)
+    for _ in range(100):
+        if other.call("ping")["sessions"] == 0:
+            break
+    assert other.call("ping")["sessions"] == 0
+
+
+def test_errors_are_raised_in_the_client(daemon, server):
+    client = DaemonClient(daemon.socket_path)
+    with pytest.raises(DaemonError, match="Unknown assistant"):
+        DaemonAssistantThread(client, "missing").init_messages()
+
+    assistant = DaemonAssistantThread(client, "dev")
+    assistant.init_messages()
+    # Let the replacement spare thread be created first, so it doesn't get the error
+    for future in list(daemon.thread_pool):
+        future.result()
+    server.inject_errors(1, status=500)
+    with pytest.raises(DaemonError) as error:
+        assistant.add_message({"role": "user", "content": "hello"})
+    assert error.value.error_type == "InternalServerError"
+
+
+def test_cli_session_on_daemon_thread(daemon, tmp_path):
+    assistant = DaemonAssistantThread(DaemonClient(daemon.socket_path), "dev")
+    config = GptCliConfig(transcript_dir=str(tmp_path / "logs"), search_index_path=None)
+
+    session = CLIChatSession(assistant, markdown=False, show_price=False, config=config)
+    session.process_input("hello", {})
+
+    assert session.messages[-1] == {"role": "assistant", "content": "Echo: hello\n\n\n"}
+    session.process_input(":q", {})
+
+
+def test_thin_client_chat(daemon):
+    client = daemon_client.DaemonClient(daemon.socket_path)
+    output = io.StringIO()
+    inputs = iter(["hello", "", ":q"])
+
+    daemon_client.chat(client, "dev", input=lambda prompt: next(inputs), output=output)
+
+    assert output.getvalue() == "Echo: hello\n\n\n"
+    # The session is closed on the way out
+    assert client.call("ping")["sessions"] == 0
+
+
+def test_thin_client_errors(daemon):
+    client = daemon_client.DaemonClient(daemon.socket_path)
+    with pytest.raises(daemon_client.DaemonClientError, match="Unknown assistant"):
+        daemon_client.chat(client, "missing", input=lambda prompt: ":q")
+
+
+def test_thin_client_only_takes_plain_daemon_sessions():
+    config = GptCliConfig(default_assistant="dev")
+    assert daemon_client.thin_client_assistant(["--daemon"], config) == "dev"
+    assert daemon_client.thin_client_assistant(["other", "--daemon"], config) == "other"
+    assert daemon_client.thin_client_assistant(["other"], config) is None
+    assert daemon_client.thin_client_assistant(["--daemon", "--file", "a.txt"], config) is None
+
+
+def test_thin_client_does_not_import_openai():
+    code = "import sys, gptcli.daemon_client; print('openai' in sys.modules)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
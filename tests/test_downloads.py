@@ -0,0 +1,84 @@
+import os
+from unittest import mock
+
+import pytest
+
+from gptcli.downloads import MANIFEST_FILENAME, Downloader
+from gptcli.fake_server import FakeServerConfig
+from gptcli.session import ChatSession
+
+DATA = bytes(range(256)) * 4096
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+
+
+@pytest.fixture
+def server_config():
+    return FakeServerConfig(
+        generated_files=lambda messages: {"table.csv": b"a,b\n1,2\n", "plot.png": PNG}
+    )
+
+
+def test_download_and_skip_existing(client, tmp_path):
+    file_id = client.files.create(file=("big.bin", DATA), purpose="assistants").id
+    downloader = Downloader(client, str(tmp_path), chunk_size=64 * 1024)
+
+    result = downloader.download(file_id, "/mnt/data/big.bin").future.result()
+
+    assert result.path == str(tmp_path / "big.bin") and not result.cached
+    assert (tmp_path / "big.bin").read_bytes() == DATA
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".part")]
+
+    # Another process finds it in the manifest
+    again = Downloader(client, str(tmp_path)).download(file_id, "big.bin").future.result()
+    assert again.cached and again.path == result.path
+    # A different file with the same name doesn't overwrite it
+    other_id = client.files.create(file=("big.bin", b"other"), purpose="assistants").id
+    other = Downloader(client, str(tmp_path)).download(other_id, "big.bin").future.result()
+    assert other.path == str(tmp_path / "big (2).bin")
+    assert (tmp_path / MANIFEST_FILENAME).exists()
+
+
+def test_interrupted_download_resumes(client, tmp_path):
+    file_id = client.files.create(file=("big.bin", DATA), purpose="assistants").id
+    downloader = Downloader(client, str(tmp_path), chunk_size=64 * 1024)
+    (tmp_path / f".{file_id}.part").write_bytes(DATA[:300_000])
+    received = []
+    downloader.progress = lambda path, done, total: received.append(done)
+
+    result = downloader.download(file_id, "big.bin", size=len(DATA)).future.result()
+
+    assert result.resumed_from == 300_000
+    assert received[0] == 300_000 + 64 * 1024
+    assert (tmp_path / "big.bin").read_bytes() == DATA
+
+
+def test_generated_files_are_downloaded(client, tmp_path, make_assistant):
+    assistant = make_assistant()
+    assistant.downloader = Downloader(client, str(tmp_path), auto=True)
+    session = ChatSession(assistant, mock.MagicMock())
+
+    session.process_input("plot it", {})
+    assistant.downloader.wait(5)
+
+    assert (tmp_path / "table.csv").read_bytes() == b"a,b\n1,2\n"
+    # Images come before the text of a message
+    image_id = assistant.generated_files[0].file_id
+    assert (tmp_path / f"{image_id}.png").read_bytes() == PNG
+    stream = session.listener.response_streamer.return_value.__enter__.return_value
+    shown = "".join(call.args[0] for call in stream.on_next_token.call_args_list)
+    assert f"Image: {image_id}.png - saving to {tmp_path / f'{image_id}.png'}" in shown
+    assert f"[0] table.csv - saving to {tmp_path / 'table.csv'}" in shown
+
+
+def test_download_command(client, tmp_path, make_assistant):
+    assistant = make_assistant()
+    assistant.downloader = Downloader(client, str(tmp_path))
+    session = ChatSession(assistant, mock.MagicMock())
+
+    session.process_input("plot it", {})
+    assert not (tmp_path / "table.csv").exists()
+
+    session.process_input(":download", {})
+    assistant.downloader.wait(5)
+    assert (tmp_path / "table.csv").exists()
+    session.listener.on_error.assert_not_called()
@@ -0,0 +1,60 @@
+import pytest
+import tiktoken
+
+from gptcli import encodings
+from gptcli.encodings import (
+    EncodingNotCachedError,
+    get_encoding,
+    load_encoding_cache,
+    set_cache_dir,
+    write_encoding_cache,
+)
+
+
+def small_encoding() -> tiktoken.Encoding:
+    ranks = {bytes([i]): i for i in range(256)}
+    for token in [b"he", b"ll", b"hell", b"hello", b" w", b" wor", b" world"]:
+        ranks[token] = len(ranks)
+    return tiktoken.Encoding(
+        "small",
+        pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+        mergeable_ranks=ranks,
+        special_tokens={"<|endoftext|>": len(ranks), "<|été|>": len(ranks) + 1},
+    )
+
+
+@pytest.fixture(autouse=True)
+def reset_cache_dir():
+    yield
+    set_cache_dir(None)
+
+
+def test_round_trip(tmp_path):
+    encoding = small_encoding()
+    path = write_encoding_cache(encoding, str(tmp_path))
+
+    loaded = load_encoding_cache(path)
+
+    assert loaded.name == "small"
+    assert loaded.n_vocab == encoding.n_vocab
+    assert loaded._special_tokens == encoding._special_tokens
+    text = "hello world, it's <|endoftext|> ünïcode"
+    assert loaded.encode(text, allowed_special="all") == encoding.encode(text, allowed_special="all")
+    assert loaded.encode("hello world") == [encoding._mergeable_ranks[b"hello"], encoding._mergeable_ranks[b" world"]]
+
+
+def test_missing_encoding_is_not_downloaded(tmp_path):
+    set_cache_dir(str(tmp_path))
+    with pytest.raises(EncodingNotCachedError, match="tokenizer build cl100k_base"):
+        get_encoding("cl100k_base")
+
+
+def test_get_encoding_loads_once(tmp_path, monkeypatch):
+    write_encoding_cache(small_encoding(), str(tmp_path))
+    set_cache_dir(str(tmp_path))
+    loads = []
+    original = encodings.load_encoding_cache
+    monkeypatch.setattr(encodings, "load_encoding_cache", lambda path: loads.append(path) or original(path))
+
+    assert get_encoding("small") is get_encoding("small")
+    assert len(loads) == 1
@@ -0,0 +1,94 @@
+import gzip
+import os
+import shutil
+
+import pytest
+
+from gptcli.transcript import encode_record, make_record
+
+pa = pytest.importorskip("pyarrow")
+
+from gptcli.export import compute_stats, export_transcripts, format_stats, open_dataset  # noqa: E402
+
+DAY = 24 * 3600
+
+
+def write_turns(path, start, turns, assistant_id="asst_a", thread_id="thread_1", day=0):
+    with open(path, "a") as f:
+        for turn in range(start, start + turns):
+            ts = day * DAY + turn * 10.0
+            user = make_record(
+                "message", assistant_id=assistant_id, thread_id=thread_id, turn=turn, role="user",
+                content=f"question {turn}",
+            )
+            user["ts"] = ts
+            answer = make_record(
+                "message", assistant_id=assistant_id, thread_id=thread_id, turn=turn,
+                role="assistant", content="x" * 10 * turn, run_id=f"run_{turn}", latency_ms=100 * turn,
+            )
+            answer["ts"] = ts + 1
+            f.write(encode_record(user) + encode_record(answer))
+            f.write(encode_record(make_record("chat_rerun", turn=turn)))
+
+
+def test_export_is_partitioned(tmp_path):
+    write_turns(str(tmp_path / "a.jsonl"), 1, 2)
+    write_turns(str(tmp_path / "b.jsonl"), 1, 1, assistant_id="asst_b", thread_id="thread_2", day=1)
+    out = str(tmp_path / "export")
+
+    result = export_transcripts([str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl")], out)
+
+    assert (result.files, result.rows) == (2, 6)
+    assert os.path.isdir(os.path.join(out, "date=1970-01-01", "assistant_id=asst_a"))
+    assert os.path.isdir(os.path.join(out, "date=1970-01-02", "assistant_id=asst_b"))
+    table = open_dataset(out).to_table().sort_by([("assistant_id", "ascending"), ("ts", "ascending")])
+    assert table.num_rows == 6
+    row = table.slice(1, 1).to_pylist()[0]
+    assert (row["role"], row["run_id"], row["latency_ms"], row["content_chars"]) == (
+        "assistant", "run_1", 100, 10,
+    )
+
+
+def test_export_is_incremental(tmp_path):
+    path = str(tmp_path / "a.jsonl")
+    out = str(tmp_path / "export")
+    write_turns(path, 1, 2)
+    assert export_transcripts([path], out).rows == 4
+
+    # Nothing new: the file isn't read again
+    assert export_transcripts([path], out).skipped_files == 1
+
+    write_turns(path, 3, 1)
+    assert export_transcripts([path], out).rows == 2
+
+    # Rotation moves the exported records to a compressed segment, they aren't exported twice
+    with open(path, "rb") as src, gzip.open(path + ".1.gz", "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+    write_turns(path, 4, 1)
+    assert export_transcripts([path + ".1.gz", path], out).rows == 2
+    assert open_dataset(out).count_rows() == 8
+
+
+def test_stats(tmp_path):
+    write_turns(str(tmp_path / "a.jsonl"), 1, 3)
+    write_turns(str(tmp_path / "b.jsonl"), 1, 1, assistant_id="asst_b", thread_id="thread_2", day=1)
+    out = str(tmp_path / "export")
+    export_transcripts([str(tmp_path / "a.jsonl"), str(tmp_path / "b.jsonl")], out, format="arrow")
+
+    stats = compute_stats(out).to_pylist()
+    assert [row["assistant_id"] for row in stats] == ["asst_a", "asst_b"]
+    assert stats[0]["conversations"] == 1
+    assert stats[0]["turns"] == 3
+    assert stats[0]["mean_answer_chars"] == 20
+    assert stats[0]["p50_latency_ms"] == 200
+
+    assert [row["assistant_id"] for row in compute_stats(out, since="1970-01-02").to_pylist()] == ["asst_b"]
+    assert "| asst_a | 1 | 3 | 6 | 20 |" in format_stats(compute_stats(out))
+
+
+def test_stats_without_messages(tmp_path):
+    out = tmp_path / "export"
+    out.mkdir()
+    assert format_stats(compute_stats(str(out))) == "No exported messages."
+    assert format_stats(compute_stats(str(tmp_path / "missing"))) == "No exported messages."
@@ -0,0 +1,63 @@
+import pytest
+from openai import InternalServerError
+
+from gptcli.fake_server import FakeServerConfig
+from gptcli.session import ChatSession
+from gptcli.persist import PersistChatListener
+
+
+@pytest.fixture
+def server_config():
+    return FakeServerConfig(page_size=3)
+
+
+def test_turn_against_fake_server(server, make_assistant):
+    assistant = make_assistant()
+    assistant.add_message({"role": "user", "content": "hello"})
+    run = assistant.run_thread()
+    messages = assistant.fetch_messages(since_last_user_message=True)
+
+    assert run.status == "completed"
+    assert [message.content[0].text.value for message in messages] == ["Echo: hello\n\n"]
+    assert assistant.last_run_id == run.id
+    assert server.request_counts["runs.create"] == 1
+    assert server.request_counts["runs.retrieve"] == 0
+
+
+def test_fetch_follows_pagination(server, make_assistant):
+    assistant = make_assistant()
+    for i in range(4):
+        assistant.add_message({"role": "user", "content": f"message {i}"})
+        assistant.run_thread()
+    server.reset_counts()
+
+    messages = assistant.fetch_messages(since_last_user_message=False)
+
+    assert len(messages) == 8
+    assert messages[-1].content[0].text.value == "Echo: message 3\n\n"
+    # 8 messages in pages of 3, plus the empty page that ends iteration
+    assert server.request_counts["messages.list"] == 4
+
+
+@pytest.mark.parametrize("server_config", [FakeServerConfig(run_duration=0.1)])
+def test_polls_until_run_completes(server, make_assistant):
+    assistant = make_assistant(poll_interval=0.05)
+    assistant.add_message({"role": "user", "content": "hi"})
+    assert assistant.run_thread().status == "completed"
+    assert server.request_counts["runs.retrieve"] >= 1
+
+
+def test_injected_errors(server, make_assistant):
+    assistant = make_assistant(max_retries=0)
+    server.inject_errors(1, status=500)
+    with pytest.raises(InternalServerError):
+        assistant.add_message({"role": "user", "content": "hello"})
+    assistant.add_message({"role": "user", "content": "hello again"})
+
+
+def test_chat_session_end_to_end(tmp_path, make_assistant):
+    assistant = make_assistant()
+    listener = PersistChatListener(assistant, directory=str(tmp_path))
+    session = ChatSession(assistant, listener)
+    assert session.process_input("ping", {})
+    assert session.messages[-1] == {"role": "assistant", "content": "Echo: ping\n\n\n"}
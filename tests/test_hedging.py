@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+from gptcli.hedging import HedgePolicy, Hedger
+
+
+class SlowFirstCall:
+    """
+    Hangs on the first call until released, answers later calls right away.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.release = threading.Event()
+
+    def __call__(self, value, timeout=None):
+        with self.lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            self.release.wait(5)
+            return ("slow", value)
+        return ("fast", value)
+
+
+def test_slow_request_is_hedged():
+    hedger = Hedger(HedgePolicy(initial_delay=0.01))
+    function = SlowFirstCall()
+    assert hedger.call("runs.retrieve", function, 1) == ("fast", 1)
+    function.release.set()
+    assert (hedger.stats.requests, hedger.stats.hedges, hedger.stats.hedges_won) == (1, 1, 1)
+
+
+def test_fast_request_is_not_hedged():
+    hedger = Hedger(HedgePolicy(initial_delay=1))
+    assert hedger.call("runs.retrieve", lambda: "ok") == "ok"
+    assert hedger.stats.hedges == 0
+
+
+def test_budget_caps_hedges():
+    hedger = Hedger(HedgePolicy(initial_delay=0.01, budget=0, burst=1))
+    first = SlowFirstCall()
+    assert hedger.call("x", first, 1) == ("fast", 1)
+    first.release.set()
+
+    # The budget is spent, so the next slow request is waited for
+    second = SlowFirstCall()
+    threading.Timer(0.05, second.release.set).start()
+    assert hedger.call("x", second, 2) == ("slow", 2)
+    assert (hedger.stats.hedges, hedger.stats.over_budget) == (1, 1)
+
+
+def test_delay_follows_observed_latency():
+    hedger = Hedger(HedgePolicy(min_samples=5, quantile=0.9, min_delay=0.001, initial_delay=1))
+    assert hedger.delay("x") == 1
+    for _ in range(5):
+        hedger.call("x", time.sleep, 0.01)
+    assert 0.01 <= hedger.delay("x") < 0.1
+
+
+def test_error_of_one_request_uses_the_other():
+    calls = []
+    release = threading.Event()
+
+    def function():
+        calls.append(None)
+        if len(calls) == 1:
+            release.wait(5)
+            raise ValueError("first failed")
+        return "second"
+
+    hedger = Hedger(HedgePolicy(initial_delay=0.01))
+    assert hedger.call("x", function) == "second"
+    release.set()
+
+    def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        hedger.call("y", failing)
+
+
+def test_requests_do_not_queue_behind_hedges():
+    hedger = Hedger(HedgePolicy(initial_delay=1), max_workers=1)
+    busy = threading.Event()
+    hedger.executor.submit(busy.wait, 5)
+
+    started = time.monotonic()
+    assert hedger.call("x", lambda: "ok") == "ok"
+    assert time.monotonic() - started < 0.5
+    busy.set()
+
+
+def test_request_runs_on_calling_thread_without_budget():
+    hedger = Hedger(HedgePolicy(budget=0, burst=0))
+    assert hedger.call("x", threading.current_thread) is threading.current_thread()
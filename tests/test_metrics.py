@@ -0,0 +1,88 @@
+import urllib.request
+
+import httpx
+import pytest
+from openai import OpenAI
+
+from gptcli import metrics
+from gptcli.assistant import AssistantThread
+from gptcli.composite import AsyncChatListener
+from gptcli.fake_server import FakeAssistantsServer, FakeServerConfig
+from gptcli.metrics import MetricsTransport, endpoint_name, serve_metrics, start_metrics, stop_metrics
+from gptcli.session import ChatListener, ChatSession
+
+
+@pytest.fixture
+def registry():
+    yield start_metrics()
+    stop_metrics()
+
+
+def test_disabled_metrics_record_nothing():
+    assert not metrics.metrics_enabled()
+    metrics.observe_request("GET /v1/files", "200", 0.1)
+    metrics.cache_lookup("uploads", True)
+    assert metrics.watch_queue_depth("listener", lambda: 1) is None
+
+
+def test_exposition(registry):
+    metrics.observe_request("GET /v1/threads/{thread_id}", "200", 0.07)
+    metrics.observe_request("GET /v1/threads/{thread_id}", "200", 0.3)
+    metrics.cache_lookup("uploads", False)
+    metrics.record_usage("asst_1", 100, 20, 0.0016)
+    key = metrics.watch_queue_depth("SearchIndexChatListener", lambda: 3)
+
+    text = registry.exposition()
+
+    assert "# TYPE gptcli_api_request_duration_seconds histogram" in text
+    assert 'gptcli_api_requests_total{endpoint="GET /v1/threads/{thread_id}",status="200"} 2' in text
+    assert 'gptcli_api_request_duration_seconds_bucket{endpoint="GET /v1/threads/{thread_id}",le="0.05"} 0' in text
+    assert 'gptcli_api_request_duration_seconds_bucket{endpoint="GET /v1/threads/{thread_id}",le="0.1"} 1' in text
+    assert 'gptcli_api_request_duration_seconds_bucket{endpoint="GET /v1/threads/{thread_id}",le="+Inf"} 2' in text
+    assert 'gptcli_api_request_duration_seconds_count{endpoint="GET /v1/threads/{thread_id}"} 2' in text
+    assert 'gptcli_cache_requests_total{cache="uploads",result="miss"} 1' in text
+    assert 'gptcli_tokens_total{assistant="asst_1",kind="completion"} 20' in text
+    assert 'gptcli_spend_dollars_total{assistant="asst_1"} 0.0016' in text
+    assert 'gptcli_listener_queue_depth{listener="SearchIndexChatListener"} 3' in text
+
+    metrics.unwatch_queue_depth(key)
+    assert "SearchIndexChatListener" not in registry.exposition()
+
+
+def test_endpoint_names_hide_ids():
+    assert endpoint_name("POST", "/v1/threads/thread_abc/runs/run_123/cancel") == (
+        "POST /v1/threads/{thread_id}/runs/{run_id}/cancel"
+    )
+
+
+def test_session_metrics_are_served(registry):
+    with FakeAssistantsServer(FakeServerConfig(run_duration=0.05)) as server:
+        client = OpenAI(
+            api_key="fake",
+            base_url=server.url,
+            http_client=httpx.Client(transport=MetricsTransport()),
+        )
+        assistant = AssistantThread({"id": "asst_fake"}, openai_client=client)
+        assistant.poll_interval = 0.02
+        listener = AsyncChatListener(ChatListener())
+        session = ChatSession(assistant, listener)
+        session.process_input("hello", {})
+
+        http_server = serve_metrics(0)
+        try:
+            # Only local connections by default
+            assert http_server.server_address[0] == "127.0.0.1"
+            url = f"http://127.0.0.1:{http_server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                text = response.read().decode("utf-8")
+        finally:
+            http_server.shutdown()
+        session.process_input(":q", {})
+
+    assert 'gptcli_api_requests_total{endpoint="POST /v1/threads/{thread_id}/runs",status="200"} 1' in text
+    assert 'gptcli_run_duration_seconds_count{assistant="asst_fake",status="completed"} 1' in text
+    assert 'gptcli_run_polls_count{assistant="asst_fake"} 1' in text
+    assert "gptcli_runs_in_flight 0" in text
+    assert "gptcli_sessions_in_flight 1" in text
+    assert 'gptcli_listener_queue_depth{listener="ChatListener"} 0' in text
+    assert "gptcli_sessions_in_flight 0" in registry.exposition()
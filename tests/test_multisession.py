@@ -0,0 +1,182 @@
+import threading
+from unittest import mock
+
+import pytest
+
+from gptcli.branches import BranchStore
+from gptcli.fake_server import FakeServerConfig
+from gptcli.multisession import MultiChatSession
+from gptcli.session import ChatSession, InvalidArgumentError
+
+
+@pytest.fixture
+def server_config():
+    return FakeServerConfig(run_duration=0.2)
+
+
+def make_multi_session(make_assistant, branch_store=None):
+    def make_session(name):
+        if name == "missing":
+            raise InvalidArgumentError(f"Unknown assistant: {name}")
+        return ChatSession(make_assistant(poll_interval=0.05), mock.MagicMock())
+
+    return MultiChatSession(
+        make_session("default"),
+        "default",
+        make_session,
+        lambda assistant, messages: ChatSession(assistant, mock.MagicMock(), messages=messages),
+        branch_store,
+    )
+
+
+def test_threads_keep_their_own_history(make_assistant):
+    multi = make_multi_session(make_assistant)
+    multi.process_input("first", {})
+    multi.process_input(":new other", {})
+    multi.process_input("second", {})
+
+    first, second = [slot.session for slot in multi.slots]
+    assert multi.active.assistant_name == "other"
+    assert first.assistant.get_thread_id() != second.assistant.get_thread_id()
+    assert [m["content"] for m in first.messages] == ["first", "Echo: first\n\n\n"]
+    assert [m["content"] for m in second.messages] == ["second", "Echo: second\n\n\n"]
+
+    multi.process_input(":switch 1", {})
+    multi.process_input("third", {})
+    assert first.messages[-1]["content"] == "Echo: third\n\n\n"
+    assert multi.slots[0].runs == 2
+
+    multi.process_input(":new missing", {})
+    multi.process_input(":switch 3", {})
+    assert len(multi.slots) == 2
+    assert multi.active is multi.slots[0]
+    assert first.listener.on_error.call_count == 2
+
+
+def test_run_continues_in_background(make_assistant):
+    multi = make_multi_session(make_assistant)
+    notified = threading.Event()
+    multi.notify = lambda message: notified.set()
+
+    # Ctrl-C while waiting for the answer
+    with mock.patch("gptcli.multisession.wait", side_effect=KeyboardInterrupt):
+        multi.process_input("slow", {})
+    first = multi.slots[0]
+    assert first.pending is not None and first.detached
+
+    multi.process_input(":new", {})
+    multi.process_input("meanwhile", {})
+    assert multi.active.session.messages[-1]["content"] == "Echo: meanwhile\n\n\n"
+
+    assert notified.wait(5)
+    assert first.session.messages[-1]["content"] == "slow"
+    multi.process_input(":switch 1", {})
+    assert first.pending is None
+    assert first.session.messages[-1]["content"] == "Echo: slow\n\n\n"
+    first.session.listener.on_chat_message.assert_called_with(
+        {"role": "assistant", "content": "Echo: slow\n\n\n"}
+    )
+
+
+def test_fork_continues_from_earlier_turn(server, tmp_path, make_assistant):
+    store = BranchStore(str(tmp_path / "branches.json"))
+    multi = make_multi_session(make_assistant, store)
+    multi.process_input("first", {})
+    multi.process_input("second", {})
+    parent = multi.slots[0].session
+
+    multi.process_input(":fork 1", {})
+    branch = multi.active.session
+    assert multi.active.parent == 1 and multi.active.forked_at == 1
+    assert [m["content"] for m in branch.messages] == ["first", "Echo: first\n\n\n"]
+    assert len(branch.user_prompts) == 1
+    # The earlier turns are sent with the request creating the thread
+    assert server.request_counts["messages.create"] == 2
+    seed = server.state.messages[branch.assistant.get_thread_id()]
+    assert len(seed) == 1
+    assert "User: first" in seed[0]["content"][0]["text"]["value"]
+    assert "second" not in seed[0]["content"][0]["text"]["value"]
+
+    multi.process_input("another second", {})
+    assert branch.messages[-1]["content"] == "Echo: another second\n\n\n"
+    assert len(parent.messages) == 4
+
+    (recorded,) = BranchStore(str(tmp_path / "branches.json")).children_of(parent.assistant.get_thread_id())
+    assert recorded.thread_id == branch.assistant.get_thread_id() and recorded.turns == 1
+
+    multi.process_input(":fork 5", {})
+    assert len(multi.slots) == 2
+    branch.listener.on_error.assert_called_once()
+
+
+def test_branches_lists_forks_of_earlier_sessions(tmp_path, make_assistant):
+    path = str(tmp_path / "branches.json")
+    multi = make_multi_session(make_assistant, BranchStore(path))
+    multi.process_input("first", {})
+    thread_id = multi.active.session.assistant.get_thread_id()
+    # Another CLI forked the same thread meanwhile
+    BranchStore(path).add("thread_elsewhere", thread_id, "asst_fake", 1)
+
+    multi.process_input(":fork", {})
+    multi.process_input(":switch 1", {})
+    multi.process_input(":branches", {})
+
+    branches = BranchStore(path)
+    assert {branch.thread_id for branch in branches.children_of(thread_id)} == {
+        "thread_elsewhere",
+        multi.slots[1].session.assistant.get_thread_id(),
+    }
+    stream = multi.active.session.listener.response_streamer.return_value.__enter__.return_value
+    printed = "".join(call.args[0] for call in stream.on_next_token.call_args_list)
+    assert "`thread_elsewhere`" in printed
+    assert "(thread 2)" in printed
+
+
+def test_corrupt_branch_store(tmp_path):
+    path = tmp_path / "branches.json"
+    path.write_text("{not json")
+    store = BranchStore(str(path))
+    assert store.branches == []
+
+    store.add("thread_2", "thread_1", "asst_fake", 1)
+    assert BranchStore(str(path)).parent_of("thread_2").parent_thread_id == "thread_1"
+
+
+def test_switch_reopens_a_branch_of_an_earlier_session(tmp_path, make_assistant):
+    path = str(tmp_path / "branches.json")
+    earlier = make_multi_session(make_assistant, BranchStore(path))
+    earlier.process_input("first", {})
+    earlier.process_input(":fork", {})
+    earlier.process_input("second", {})
+    branch_id = earlier.active.session.assistant.get_thread_id()
+
+    multi = make_multi_session(make_assistant, BranchStore(path))
+    multi.process_input(f":switch {branch_id}", {})
+
+    assert len(multi.slots) == 2 and multi.active is multi.slots[1]
+    reopened = multi.active.session
+    assert reopened.assistant.get_thread_id() == branch_id
+    assert [m["content"] for m in reopened.messages[-2:]] == ["second", "Echo: second"]
+    multi.process_input("third", {})
+    assert reopened.messages[-1]["content"] == "Echo: third\n\n\n"
+
+    # Open threads are switched to rather than opened again
+    multi.process_input(":switch 1", {})
+    multi.process_input(f":switch {branch_id}", {})
+    assert len(multi.slots) == 2 and multi.active is multi.slots[1]
+
+    multi.process_input(":switch thread_unknown", {})
+    reopened.listener.on_error.assert_called_once()
+
+
+def test_fork_reports_unwritable_branch_store(tmp_path, make_assistant):
+    store = BranchStore(str(tmp_path / "branches.json"))
+    multi = make_multi_session(make_assistant, store)
+    multi.process_input("first", {})
+
+    with mock.patch.object(store, "save", side_effect=PermissionError("read-only")):
+        multi.process_input(":fork", {})
+
+    # The fork is opened anyway
+    assert len(multi.slots) == 2
+    multi.slots[0].session.listener.on_error.assert_called_once()
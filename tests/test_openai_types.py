@@ -0,0 +1,78 @@
+import pytest
+from openai.types.beta.threads import ThreadMessage as SDKThreadMessage
+
+from gptcli.openai_types import ThreadMessage, ThreadRun
+
+MESSAGE = {
+    "id": "msg_1",
+    "object": "thread.message",
+    "created_at": 1703532865,
+    "thread_id": "thread_1",
+    "role": "assistant",
+    "content": [
+        {
+            "type": "text",
+            "text": {
+                "value": "See the report [0]",
+                "annotations": [
+                    {
+                        "type": "file_citation",
+                        "text": "[0]",
+                        "start_index": 15,
+                        "end_index": 18,
+                        "file_citation": {"file_id": "file_1", "quote": "a quote"},
+                    }
+                ],
+            },
+        }
+    ],
+    "file_ids": [],
+    "assistant_id": "asst_1",
+    "run_id": "run_1",
+    "metadata": {},
+}
+
+
+def test_message_is_slotted_and_immutable():
+    message = ThreadMessage.from_dict(MESSAGE)
+    assert not hasattr(message, "__dict__")
+    with pytest.raises(AttributeError):
+        message.role = "user"
+    with pytest.raises(AttributeError):
+        message.content[0].text.value = "changed"
+
+
+def test_raw_content_is_not_kept():
+    message = ThreadMessage.from_dict(MESSAGE)
+    assert not any("raw" in name for name in ThreadMessage.__slots__)
+
+    text = message.content[0].text
+    assert text.value == "See the report [0]"
+    assert text.annotations[0].file_citation.file_id == "file_1"
+
+
+def test_to_dict_is_required():
+    from gptcli.openai_types import _Frozen
+
+    class Incomplete(_Frozen):
+        __slots__ = ()
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_sdk_round_trip():
+    sdk_message = SDKThreadMessage(**MESSAGE)
+    message = ThreadMessage.from_sdk(sdk_message)
+    assert message.content[0].text.annotations[0].file_citation.quote == "a quote"
+    assert message.to_dict() == MESSAGE
+    assert message.to_sdk() == sdk_message
+
+
+def test_run_tools():
+    run = ThreadRun(
+        "run_1", "thread.run", 0, "asst_1", "thread_1", "completed", 0, 0,
+        None, None, 0, None, "gpt-4", "", [{"type": "retrieval"}], [], {},
+    )
+    assert [tool.type for tool in run.tools] == ["retrieval"]
+    assert run.to_dict()["tools"] == [{"type": "retrieval"}]
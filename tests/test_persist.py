@@ -0,0 +1,80 @@
+import gzip
+import json
+import os
+from unittest import mock
+
+from gptcli.persist import PersistChatListener, TranscriptWriter
+
+
+def setup_assistant_mock():
+    assistant_mock = mock.MagicMock()
+    assistant_mock.get_assistant_id.return_value = "asst_1"
+    assistant_mock.get_thread_id.return_value = "thread_1"
+    assistant_mock.last_user_message_id = "msg_1"
+    assistant_mock.last_run_id = "run_1"
+    assistant_mock.last_response_message_ids = ["msg_2"]
+    return assistant_mock
+
+
+def test_writer_batches_and_closes(tmp_path):
+    path = str(tmp_path / "logs" / "transcript.log")
+    writer = TranscriptWriter(path)
+    for i in range(100):
+        writer.write(f"line {i}\n")
+    writer.flush()
+    writer.close()
+
+    with open(path) as f:
+        assert f.read() == "".join(f"line {i}\n" for i in range(100))
+
+
+def test_writer_rotates_and_compresses(tmp_path):
+    path = str(tmp_path / "transcript.log")
+    writer = TranscriptWriter(path, max_bytes=10, compression="gzip")
+    writer.write("0123456789")
+    writer.flush()
+    writer.write("abcdefghij")
+    writer.close()
+
+    with gzip.open(path + ".1.gz", "rt") as f:
+        assert f.read() == "0123456789"
+    assert not os.path.exists(path + ".1")
+    with open(path) as f:
+        assert f.read() == "abcdefghij"
+
+
+def test_writer_interval_durability(tmp_path):
+    path = str(tmp_path / "transcript.log")
+    writer = TranscriptWriter(path, durability="interval", fsync_interval=0.01)
+    writer.write("hello\n")
+    writer.close()
+
+    with open(path) as f:
+        assert f.read() == "hello\n"
+
+
+def test_listener_keeps_writing_after_error(tmp_path):
+    listener = PersistChatListener(setup_assistant_mock(), directory=str(tmp_path))
+    listener.on_chat_start()
+    listener.on_error(ValueError("boom"))
+    listener.on_chat_message({"role": "user", "content": "still\nhere"})
+    listener.on_chat_message({"role": "assistant", "content": "answer"})
+    listener.on_chat_end()
+
+    with open(tmp_path / "gptcli-asst_1-thread_1.jsonl") as f:
+        records = [json.loads(line) for line in f]
+
+    assert [record["event"] for record in records] == [
+        "chat_start",
+        "error",
+        "message",
+        "message",
+        "chat_end",
+    ]
+    assert records[1]["error"] == "ValueError: boom"
+    assert records[2]["content"] == "still\nhere"
+    assert records[2]["message_ids"] == ["msg_1"]
+    assert records[3]["run_id"] == "run_1"
+    assert records[3]["message_ids"] == ["msg_2"]
+    assert records[3]["turn"] == 1
+    assert records[3]["latency_ms"] >= 0
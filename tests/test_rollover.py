@@ -0,0 +1,167 @@
+import glob
+from unittest import mock
+
+import pytest
+from openai import OpenAIError
+
+from gptcli.persist import PersistChatListener
+from gptcli.rollover import RolloverPolicy, format_seed_message, recent_turns, split_message
+from gptcli.session import ChatSession
+from gptcli.transcript import EVENT_THREAD_ROLLOVER, TranscriptReader
+
+
+def thread_texts(server, thread_id):
+    return [message["content"][0]["text"]["value"] for message in server.state.messages[thread_id]]
+
+
+def test_policy_limits():
+    assert not RolloverPolicy().enabled
+    assert not RolloverPolicy(max_messages=4).exceeded(4, 10_000)
+    assert RolloverPolicy(max_messages=4).exceeded(5, 0)
+    assert RolloverPolicy(max_tokens=100).exceeded(1, 101)
+
+
+def test_seed_quotes_recent_turns():
+    history = [
+        {"role": "user", "content": "one"},
+        {"role": "assistant", "content": "1"},
+        {"role": "user", "content": "two"},
+        {"role": "assistant", "content": "2"},
+    ]
+    assert recent_turns(history, 1) == history[2:]
+    assert recent_turns(history, 5) == history
+    assert recent_turns(history, 0) == []
+
+    seed = format_seed_message("We counted.", history[2:])
+    assert "We counted." in seed
+    assert "User: two" in seed and "Assistant: 2" in seed
+    assert "User: one" not in seed
+
+
+def test_split_message():
+    text = "\n\n".join(["a" * 40, "b" * 40, "c" * 100, "d" * 10])
+    chunks = split_message(text, max_chars=90)
+    assert chunks == ["a" * 40 + "\n\n" + "b" * 40, "c" * 90, "c" * 10 + "\n\n" + "d" * 10]
+    assert split_message("short") == ["short"]
+
+
+def test_session_rolls_over(server, tmp_path, make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = RolloverPolicy(max_messages=3, keep_turns=1)
+    listener = PersistChatListener(assistant, directory=str(tmp_path))
+    session = ChatSession(assistant, listener)
+    rollovers = mock.MagicMock()
+    assistant.rollover_callbacks.append(rollovers)
+    first_thread = assistant.get_thread_id()
+
+    session.process_input("first", {})
+    session.process_input("second", {})
+    # The summary is being written, the thread only changes with the next message
+    assert assistant.get_thread_id() == first_thread
+    session.process_input("third", {})
+    listener.on_chat_end()
+
+    new_thread = assistant.get_thread_id()
+    assert new_thread != first_thread
+    seed, question, answer = thread_texts(server, new_thread)
+    assert "Summary of our conversation so far" in seed
+    assert "User: second" in seed and "User: first" not in seed
+    assert question == "third"
+    assert answer.startswith("Echo: third")
+    assert session.messages[-1]["content"].startswith("Echo: third")
+    rollovers.assert_called_once_with(first_thread, new_thread, mock.ANY)
+
+    [path] = glob.glob(str(tmp_path / "*.jsonl"))
+    records = list(TranscriptReader(path).records())
+    [event] = [record for record in records if record["event"] == EVENT_THREAD_ROLLOVER]
+    assert event["old_thread_id"] == first_thread
+    assert event["new_thread_id"] == new_thread
+
+
+def test_rerun_while_rolling_over(server, make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = RolloverPolicy(max_messages=3, keep_turns=1)
+    session = ChatSession(assistant, mock.MagicMock())
+    first_thread = assistant.get_thread_id()
+
+    session.process_input("first", {})
+    session.process_input("second", {})
+    session.process_input(":r", {})
+
+    assert session.messages[-1] == {"role": "assistant", "content": "Echo: second\n\n\n"}
+    # The rollover is started again from the new answer
+    session.process_input("third", {})
+    new_thread = assistant.get_thread_id()
+    assert new_thread != first_thread
+    assert thread_texts(server, new_thread)[0].count("Assistant: Echo: second") == 1
+
+
+def test_long_seed_is_split(server, make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = RolloverPolicy(max_messages=1, keep_turns=1)
+    session = ChatSession(assistant, mock.MagicMock())
+    first_thread = assistant.get_thread_id()
+
+    session.process_input("x" * 70_000, {})
+    session.process_input("next", {})
+
+    texts = thread_texts(server, assistant.get_thread_id())
+    assert assistant.get_thread_id() != first_thread
+    *seed, question, answer = texts
+    assert len(seed) > 1 and question == "next"
+    assert seed[0].startswith("Summary of our conversation so far")
+    # The summary (the fake server echoes the message), the message and its answer
+    assert "".join(seed).count("x") >= 3 * 70_000
+    assert all(len(text) <= 32_000 for text in seed)
+
+
+def test_failed_rollover_backs_off(make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = RolloverPolicy(max_messages=1)
+    session = ChatSession(assistant, mock.MagicMock())
+
+    with mock.patch.object(assistant, "_roll_over", side_effect=OpenAIError("boom")) as roll_over:
+        for i in range(8):
+            session.process_input(f"message {i}", {})
+
+    # Started after the 1st, 2nd, 3rd and 5th answer
+    assert roll_over.call_count == 4
+
+
+def test_rollover_error_keeps_thread(make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = RolloverPolicy(max_messages=1)
+    session = ChatSession(assistant, mock.MagicMock())
+    first_thread = assistant.get_thread_id()
+
+    with mock.patch.object(assistant, "_roll_over", side_effect=IndexError("list index out of range")):
+        session.process_input("first", {})
+        session.process_input("second", {})
+
+    assert assistant.get_thread_id() == first_thread
+    assert session.messages[-1]["content"].startswith("Echo: second")
+
+
+def test_summary_run_without_message(make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = RolloverPolicy(max_messages=1)
+    session = ChatSession(assistant, mock.MagicMock())
+    first_thread = assistant.get_thread_id()
+    session.process_input("first", {})
+
+    empty = mock.MagicMock(data=[])
+    with mock.patch.object(assistant.openai_client.beta.threads.messages, "list", return_value=empty):
+        with pytest.raises(ValueError, match="wrote no message"):
+            assistant._roll_over(first_thread, [])
+
+
+def test_no_rollover_without_policy(server, make_assistant):
+    assistant = make_assistant()
+    assistant.rollover_policy = None
+    session = ChatSession(assistant, mock.MagicMock())
+    first_thread = assistant.get_thread_id()
+    server.reset_counts()
+    for i in range(4):
+        session.process_input(f"message {i}", {})
+    assert assistant.get_thread_id() == first_thread
+    assert server.request_counts["threads.create"] == 0
@@ -0,0 +1,58 @@
+from unittest import mock
+
+from gptcli.persist import TranscriptWriter
+from gptcli.search import SearchIndex, SearchIndexChatListener
+from gptcli.transcript import encode_record, make_record
+
+
+def test_search_ranks_hits():
+    index = SearchIndex(":memory:")
+    index.add("asst_1", "thread_1", "assistant", "Use pandas to read the CSV file.", 1.0)
+    index.add("asst_1", "thread_2", "assistant", "CSV CSV CSV: comma separated values", 2.0)
+    index.add("asst_2", "thread_3", "user", "How do I bake bread?", 3.0)
+
+    hits = index.search("csv")
+    assert [hit.thread_id for hit in hits] == ["thread_2", "thread_1"]
+    assert hits[0].assistant_id == "asst_1"
+    assert hits[0].created_at == 2.0
+
+    # FTS5 syntax in the query is treated as plain text
+    assert [hit.thread_id for hit in index.search('bread" OR (')] == []
+    assert [hit.thread_id for hit in index.search('"bread')] == ["thread_3"]
+
+
+def test_listener_indexes_messages():
+    index = SearchIndex(":memory:")
+    assistant = mock.MagicMock()
+    assistant.get_assistant_id.return_value = "asst_1"
+    assistant.get_thread_id.return_value = "thread_1"
+
+    listener = SearchIndexChatListener(assistant, index)
+    listener.on_chat_message({"role": "user", "content": "what is a monad"})
+
+    hits = index.search("monad")
+    assert len(hits) == 1
+    assert hits[0].role == "user"
+
+
+def test_rebuild_from_transcripts(tmp_path):
+    path = str(tmp_path / "t.jsonl")
+    writer = TranscriptWriter(path)
+    writer.write(encode_record(make_record("chat_start")))
+    writer.write(
+        encode_record(
+            make_record(
+                "message",
+                role="assistant",
+                content="kubernetes pods",
+                assistant_id="asst_1",
+                thread_id="thread_1",
+            )
+        )
+    )
+    writer.close()
+
+    index = SearchIndex(":memory:")
+    index.add("asst_1", "thread_0", "user", "stale kubernetes entry")
+    assert index.rebuild([path]) == 1
+    assert [hit.thread_id for hit in index.search("kubernetes")] == ["thread_1"]
@@ -3,7 +3,9 @@ import httpx
 
 from openai import BadRequestError, OpenAIError
 
-from gptcli.session import ChatSession
+from gptcli.assistant import AssistantThread
+from gptcli.attachments import UploadResult
+from gptcli.session import ChatSession, InvalidArgumentError
 from gptcli.openai_types import ThreadMessage
 
 
@@ -192,6 +194,99 @@ def test_rerun():
     )
 
 
+def test_rerun_alternatives_and_pick(server, make_assistant):
+    assistant = make_assistant()
+    listener = mock.MagicMock()
+    session = ChatSession(assistant, listener)
+    session.process_input("first", {})
+    session.process_input("second", {})
+    original_thread = assistant.get_thread_id()
+
+    assert session.process_input(":rerun 3", {})
+    assert [call.args[1] for call in listener.on_rerun_candidate.call_args_list] == [3, 3, 3]
+    forks = [fork.get_thread_id() for fork, _ in session.candidates]
+    assert len(set(forks)) == 3 and original_thread not in forks
+    # Each fork quotes the earlier turns and ends with the rerun question and its new answer
+    seed, question, answer = [
+        message["content"][0]["text"]["value"] for message in server.state.messages[forks[1]]
+    ]
+    assert "User: first" in seed and "Echo: second" not in seed
+    assert (question, answer) == ("second", "Echo: second")
+
+    session.process_input(":pick 2", {})
+    assert assistant.get_thread_id() == forks[1]
+    assert session.candidates == []
+    assert session.messages[-2:] == [
+        {"role": "user", "content": "second"},
+        {"role": "assistant", "content": "Echo: second\n\n\n"},
+    ]
+    session.process_input("third", {})
+    assert session.messages[-1] == {"role": "assistant", "content": "Echo: third\n\n\n"}
+    assert len(server.state.messages[forks[1]]) == 5
+
+
+def test_message_after_rerun_keeps_first_alternative(make_assistant):
+    assistant = make_assistant()
+    session = ChatSession(assistant, mock.MagicMock())
+    session.process_input("first", {})
+    session.process_input(":r 2", {})
+    first_fork = session.candidates[0][0].get_thread_id()
+
+    session.process_input("next", {})
+    assert assistant.get_thread_id() == first_fork
+
+
+def test_rerun_count_is_capped(server, make_assistant):
+    assistant = make_assistant()
+    listener = mock.MagicMock()
+    session = ChatSession(assistant, listener)
+    session.process_input("first", {})
+    server.reset_counts()
+
+    for argument in ["500", "0"]:
+        listener.on_error.reset_mock()
+        session.process_input(f":r {argument}", {})
+        [error] = listener.on_error.call_args.args
+        assert isinstance(error, InvalidArgumentError)
+    assert server.request_counts["threads.create"] == 0
+
+
+def test_failed_candidate_is_still_reported(make_assistant):
+    assistant = make_assistant()
+    listener = mock.MagicMock()
+    session = ChatSession(assistant, listener)
+    session.process_input("first", {})
+
+    with mock.patch.object(AssistantThread, "run_thread", side_effect=[None, RuntimeError("boom")]):
+        session.process_input(":r 2", {})
+
+    assert sorted(call.args[0] for call in listener.on_rerun_candidate.call_args_list) == [0, 1]
+    listener.on_error.assert_called_once()
+    assert sum(answer is None for _, answer in session.candidates) == 1
+
+
+def test_interrupted_rerun_keeps_the_answers_so_far(server, make_assistant):
+    assistant = make_assistant()
+    listener = mock.MagicMock()
+    session = ChatSession(assistant, listener)
+    session.process_input("first", {})
+
+    def answer_one(futures):
+        # The first candidate answers, then the user presses Ctrl-C
+        yield next(iter(futures))
+        raise KeyboardInterrupt
+
+    with mock.patch("gptcli.session.as_completed", side_effect=answer_one):
+        assert session.process_input(":r 2", {})
+
+    assert sorted(call.args[0] for call in listener.on_rerun_candidate.call_args_list) == [0, 1]
+    (first, answer), (second, missing) = session.candidates
+    assert first is not None and answer is not None
+    assert second is None and missing is None
+    session.process_input(":pick 1", {})
+    assert assistant.get_thread_id() == first.get_thread_id()
+
+
 def test_invalid_request_error():
     assistant_mock, listener_mock, session = setup_session()
 
@@ -265,3 +360,78 @@ def test_openai_error():
             mock.call(assistant_message),
         ]
     )
+
+
+def test_search():
+    assistant_mock = setup_assistant_mock()
+    listener_mock, response_streamer_mock = setup_listener_mock()
+    search_index_mock = mock.MagicMock()
+    search_index_mock.search.return_value = []
+    session = ChatSession(assistant_mock, listener_mock, search_index=search_index_mock)
+
+    should_continue = session.process_input(":search some words", {})
+    assert should_continue
+
+    search_index_mock.search.assert_called_once_with("some words")
+    response_streamer_mock.on_next_token.assert_called_once_with(
+        "No results for `some words`."
+    )
+    assistant_mock.add_message.assert_not_called()
+
+
+def test_search_disabled():
+    assistant_mock, listener_mock, session = setup_session()
+
+    should_continue = session.process_input(":search anything", {})
+    assert should_continue
+
+    listener_mock.on_error.assert_called_once()
+    assistant_mock.add_message.assert_not_called()
+
+
+def test_attach():
+    assistant_mock = setup_assistant_mock()
+    assistant_mock.fetch_messages.return_value = [create_thread_message("assistant", "ok")]
+    listener_mock, _ = setup_listener_mock()
+    uploader_mock = mock.MagicMock()
+    uploader_mock.upload.return_value = [
+        UploadResult("/tmp/a b.txt", "file-abc", 10, False, 0.1)
+    ]
+    session = ChatSession(assistant_mock, listener_mock, uploader=uploader_mock)
+
+    should_continue = session.process_input(':attach "/tmp/a b.txt"', {})
+    assert should_continue
+    uploader_mock.upload.assert_called_once_with(["/tmp/a b.txt"], mock.ANY)
+    assistant_mock.add_message.assert_not_called()
+
+    session.process_input("what is in this file?", {})
+    session.process_input("and now?", {})
+
+    user_message = {"role": "user", "content": "what is in this file?"}
+    assert assistant_mock.add_message.call_args_list == [
+        mock.call(user_message, file_ids=["file-abc"]),
+        mock.call({"role": "user", "content": "and now?"}),
+    ]
+
+
+def test_attach_unbalanced_quote():
+    assistant_mock, listener_mock, _ = setup_session()
+    uploader_mock = mock.MagicMock()
+    session = ChatSession(assistant_mock, listener_mock, uploader=uploader_mock)
+
+    should_continue = session.process_input(':attach "my file', {})
+    assert should_continue
+
+    [error] = listener_mock.on_error.call_args.args
+    assert isinstance(error, InvalidArgumentError)
+    uploader_mock.upload.assert_not_called()
+    assistant_mock.add_message.assert_not_called()
+
+
+def test_attach_disabled():
+    assistant_mock, listener_mock, session = setup_session()
+
+    session.process_input(":attach file.txt", {})
+
+    listener_mock.on_error.assert_called_once()
+    assistant_mock.add_message.assert_not_called()
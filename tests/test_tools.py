@@ -0,0 +1,114 @@
+import json
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+from openai import OpenAI
+
+from gptcli.assistant import AssistantThread, RunFailedError
+from gptcli.fake_server import FakeAssistantsServer, FakeServerConfig
+from gptcli.tools import Tool, ToolError, ToolRegistry, command_tool, tool_from_config
+
+
+def tool_call(id, name, arguments):
+    return SimpleNamespace(id=id, function=SimpleNamespace(name=name, arguments=json.dumps(arguments)))
+
+
+def slow_add(arguments):
+    time.sleep(0.3)
+    return {"sum": arguments["a"] + arguments["b"]}
+
+
+def test_calls_run_concurrently():
+    registry = ToolRegistry({"add": Tool(slow_add)})
+    calls = [tool_call(f"call_{i}", "add", {"a": i, "b": 1}) for i in range(4)]
+
+    started = time.monotonic()
+    outputs = registry.run_calls(calls)
+
+    assert time.monotonic() - started < 0.6
+    assert outputs == [
+        {"tool_call_id": f"call_{i}", "output": json.dumps({"sum": i + 1})} for i in range(4)
+    ]
+
+
+def test_failures_become_error_outputs():
+    def fail(arguments):
+        raise RuntimeError("boom")
+
+    registry = ToolRegistry({"slow": Tool(slow_add, timeout=0.05), "fail": Tool(fail)})
+    outputs = registry.run_calls(
+        [
+            tool_call("call_1", "slow", {"a": 1, "b": 2}),
+            tool_call("call_2", "fail", {}),
+            tool_call("call_3", "missing", {}),
+        ]
+    )
+
+    assert [output["output"] for output in outputs] == [
+        "Error: slow timed out after 0.05s",
+        "Error: fail failed: boom",
+        "Error: no tool called missing is configured",
+    ]
+
+
+def test_command_tool():
+    echo = command_tool(f"{sys.executable} -c 'import sys; print(sys.stdin.read())'")
+    assert json.loads(echo.function({"query": "x"})) == {"query": "x"}
+
+    with pytest.raises(Exception, match="exit status 3"):
+        command_tool([sys.executable, "-c", "import sys; sys.exit(3)"]).function({})
+    with pytest.raises(ValueError):
+        tool_from_config("broken", {"timeout": 1})
+
+
+def test_command_tool_does_not_use_a_shell():
+    echo = command_tool(f"{sys.executable} -c 'import sys; print(sys.argv[1:])' $HOME '; exit 3'")
+    assert echo.function({}) == "['$HOME', '; exit 3']\n"
+    with pytest.raises(ToolError, match="can't run"):
+        command_tool(["/nonexistent/tool"]).function({})
+
+
+def test_timeout_starts_when_the_call_does():
+    registry = ToolRegistry({"add": Tool(slow_add, timeout=0.45)}, max_workers=1)
+    calls = [tool_call(f"call_{i}", "add", {"a": i, "b": 1}) for i in range(2)]
+
+    # The second call waits 0.3s for the worker, then finishes within its own timeout
+    outputs = registry.run_calls(calls)
+
+    assert [output["output"] for output in outputs] == [json.dumps({"sum": i + 1}) for i in range(2)]
+
+
+def test_run_with_tool_calls():
+    config = FakeServerConfig(
+        tool_calls=lambda messages: [
+            {"name": "add", "arguments": {"a": 1, "b": 2}},
+            {"name": "add", "arguments": {"a": 3, "b": 4}},
+        ]
+    )
+    with FakeAssistantsServer(config) as server:
+        assistant = AssistantThread(
+            {"id": "asst_fake"}, openai_client=OpenAI(api_key="fake", base_url=server.url)
+        )
+        assistant.poll_interval = 0.01
+        assistant.tool_registry = ToolRegistry({"add": Tool(slow_add)})
+        assistant.add_message({"role": "user", "content": "add"})
+
+        started = time.monotonic()
+        assert assistant.run_thread().status == "completed"
+        assert time.monotonic() - started < 0.6
+
+        messages = assistant.fetch_messages(since_last_user_message=True)
+        assert messages[0].content[0].text.value.split("\n")[:3] == ['Echo: add', '{"sum": 3}', '{"sum": 7}']
+        assert server.request_counts["runs.submit_tool_outputs"] == 1
+
+
+def test_failed_run_raises():
+    with FakeAssistantsServer(FakeServerConfig(run_failure_rate=1.0)) as server:
+        assistant = AssistantThread(
+            {"id": "asst_fake"}, openai_client=OpenAI(api_key="fake", base_url=server.url)
+        )
+        assistant.add_message({"role": "user", "content": "hello"})
+        with pytest.raises(RunFailedError, match="The run failed: Sorry, something went wrong."):
+            assistant.run_thread()
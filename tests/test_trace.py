@@ -0,0 +1,60 @@
+import json
+import pstats
+import threading
+
+from gptcli import trace
+from gptcli.gpt import profile_threads
+
+
+def test_span_is_noop_when_disabled():
+    assert trace.span("anything") is trace.NULL_SPAN
+    with trace.span("anything", "detail"):
+        pass
+
+
+def test_trace_events_are_written(tmp_path):
+    trace.start_tracing()
+    try:
+        with trace.span("outer"):
+            with trace.span("inner", "detail"):
+                pass
+        worker = threading.Thread(target=lambda: trace.span("worker").__enter__().__exit__())
+        worker.start()
+        worker.join()
+    finally:
+        path = str(tmp_path / "trace.json")
+        trace.stop_tracing(path)
+
+    assert trace.span("after") is trace.NULL_SPAN
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    assert set(spans) == {"outer", "inner", "worker"}
+    assert spans["inner"]["args"] == {"detail": "detail"}
+    assert spans["outer"]["dur"] >= spans["inner"]["dur"]
+    assert spans["worker"]["tid"] != spans["outer"]["tid"]
+    assert len([event for event in events if event["ph"] == "M"]) == 2
+
+
+def test_profile_covers_worker_threads():
+    def work_on_worker():
+        return sum(range(1000))
+
+    def session():
+        worker = threading.Thread(target=work_on_worker)
+        worker.start()
+        worker.join()
+        return "done"
+
+    profilers = []
+    assert profile_threads(profilers, session) == "done"
+
+    stats = pstats.Stats(*profilers)
+    assert len(profilers) == 2
+    assert any(function == "work_on_worker" for _, _, function in stats.stats)
+    # Threads started afterwards aren't profiled
+    after = threading.Thread(target=work_on_worker)
+    after.start()
+    after.join()
+    assert len(profilers) == 2
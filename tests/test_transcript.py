@@ -0,0 +1,113 @@
+from unittest import mock
+
+import pytest
+
+from gptcli.persist import TranscriptWriter
+from gptcli.transcript import (
+    TranscriptReader,
+    encode_record,
+    make_record,
+    read_index,
+    records_from_turn,
+    replay_transcript,
+    transcript_segments,
+)
+
+
+def write_turns(path, turns, **kwargs):
+    writer = TranscriptWriter(path, **kwargs)
+    for turn in range(1, turns + 1):
+        user = make_record("message", turn=turn, role="user", content=f"question {turn}")
+        user["ts"] = float(turn * 10)
+        writer.write(encode_record(user), index=(turn, user["ts"]))
+        assistant = make_record("message", turn=turn, role="assistant", content=f"answer {turn}")
+        assistant["ts"] = float(turn * 10 + 1)
+        writer.write(encode_record(assistant))
+    writer.close()
+
+
+def test_index_points_at_turns(tmp_path):
+    path = str(tmp_path / "t.jsonl")
+    write_turns(path, 5)
+
+    index = read_index(path)
+    assert [entry.turn for entry in index] == [1, 2, 3, 4, 5]
+
+    reader = TranscriptReader(path)
+    records = list(reader.from_turn(4))
+    assert [record["content"] for record in records] == [
+        "question 4",
+        "answer 4",
+        "question 5",
+        "answer 5",
+    ]
+
+    records = list(reader.time_range(21, 31))
+    assert [record["content"] for record in records] == ["answer 2", "question 3", "answer 3"]
+
+
+def test_index_follows_compressed_segments(tmp_path):
+    path = str(tmp_path / "t.jsonl")
+    write_turns(path, 6, max_bytes=300, compression="gzip")
+
+    segments = transcript_segments(path)
+    assert len(segments) > 1
+    assert segments[0].endswith(".1.gz")
+
+    records = [
+        record for segment in segments for record in TranscriptReader(segment).records()
+    ]
+    assert [record["content"] for record in records][-2:] == ["question 6", "answer 6"]
+    assert len(records) == 12
+
+    for segment in segments:
+        reader = TranscriptReader(segment)
+        last_turn = reader.index[-1].turn
+        records = list(reader.from_turn(last_turn))
+        assert records[0]["content"] == f"question {last_turn}"
+
+
+def test_zstd_segments(tmp_path):
+    pytest.importorskip("zstandard")
+    path = str(tmp_path / "t.jsonl")
+    write_turns(path, 6, max_bytes=300, compression="zstd")
+    segments = transcript_segments(path)
+    assert segments[0].endswith(".1.zst")
+
+    contents = [record["content"] for record in records_from_turn(segments, 2)]
+    assert contents == [f"{kind} {n}" for n in range(2, 7) for kind in ("question", "answer")]
+
+
+def test_from_turn_across_rotated_segments(tmp_path):
+    path = str(tmp_path / "t.jsonl")
+    # Small segments, so turns are split between them
+    write_turns(path, 6, max_bytes=300)
+    segments = transcript_segments(path)
+    assert len(segments) > 2
+
+    for turn in range(1, 7):
+        contents = [record["content"] for record in records_from_turn(segments, turn)]
+        expected = [f"{kind} {n}" for n in range(turn, 7) for kind in ("question", "answer")]
+        assert contents == expected
+
+
+def test_replay_renders_through_listener(tmp_path):
+    path = str(tmp_path / "t.jsonl")
+    write_turns(path, 2)
+
+    listener = mock.MagicMock()
+    stream = mock.MagicMock()
+    stream.__enter__.return_value = stream
+    listener.response_streamer.return_value = stream
+
+    replay_transcript(TranscriptReader(path).records(), listener, mock.MagicMock())
+
+    listener.on_chat_message.assert_has_calls(
+        [
+            mock.call({"role": "user", "content": "question 1"}),
+            mock.call({"role": "assistant", "content": "answer 1"}),
+            mock.call({"role": "user", "content": "question 2"}),
+            mock.call({"role": "assistant", "content": "answer 2"}),
+        ]
+    )
+    stream.on_next_token.assert_has_calls([mock.call("answer 1"), mock.call("answer 2")])
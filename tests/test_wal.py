@@ -0,0 +1,103 @@
+import subprocess
+import sys
+import time
+from unittest import mock
+
+import pytest
+
+from gptcli.fake_server import FakeServerConfig
+from gptcli.gpt import resume_orphaned_run
+from gptcli.session import ChatSession
+from gptcli.wal import RunLog
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    return process.pid
+
+
+@pytest.fixture
+def server_config():
+    return FakeServerConfig(run_duration=0.2)
+
+
+def test_only_dead_processes_leave_orphans(tmp_path):
+    log = RunLog(str(tmp_path))
+    ours = log.begin("thread_1", "run_1", "asst_1", "msg_1", {"role": "user", "content": "hi"})
+    theirs = log.begin("thread_2", "run_2", "asst_1", "msg_2", {"role": "user", "content": "ho"})
+    log._write(theirs._replace(pid=dead_pid()))
+
+    assert [run.run_id for run in log.pending()] == ["run_1", "run_2"]
+    assert [run.run_id for run in log.orphaned("asst_1")] == ["run_2"]
+    assert log.orphaned("asst_2") == []
+
+    log.end(ours)
+    assert [run.run_id for run in log.pending()] == ["run_2"]
+
+
+def test_finished_runs_are_cleared(tmp_path, make_assistant):
+    log = RunLog(str(tmp_path))
+    assistant = make_assistant(poll_interval=0.02)
+    assistant.run_log = log
+    session = ChatSession(assistant, mock.MagicMock())
+
+    with mock.patch.object(log, "begin", wraps=log.begin) as begin:
+        session.process_input("hello", {})
+
+    assert begin.call_count == 1
+    assert log.pending() == []
+
+
+def test_resume_reads_the_answer_without_a_new_run(server, tmp_path, make_assistant):
+    log = RunLog(str(tmp_path))
+    crashed = make_assistant(poll_interval=0.02)
+    crashed.run_log = log
+    crashed.add_message({"role": "user", "content": "hello"})
+    # The process is killed while polling, so the record stays
+    with mock.patch.object(crashed, "_wait_for_run", side_effect=KeyboardInterrupt), mock.patch.object(log, "end"):
+        with pytest.raises(KeyboardInterrupt):
+            crashed.run_thread()
+    log._write(log.pending()[0]._replace(pid=dead_pid()))
+    (pending,) = log.orphaned()
+
+    assistant = make_assistant(poll_interval=0.02)
+    assistant.run_log = log
+    assistant.resume_thread(pending)
+    session = ChatSession(assistant, mock.MagicMock(), messages=[pending.user_message])
+    session.resume()
+
+    assert assistant.get_thread_id() == crashed.get_thread_id()
+    assert session.messages[-1] == {"role": "assistant", "content": "Echo: hello\n\n\n"}
+    assert server.request_counts["runs.create"] == 1
+    assert log.pending() == []
+
+
+def test_only_the_latest_orphan_is_resumed(tmp_path, make_assistant):
+    log = RunLog(str(tmp_path))
+    pid = dead_pid()
+    for index in range(2):
+        crashed = make_assistant(poll_interval=0.02)
+        crashed.add_message({"role": "user", "content": f"question {index}"})
+        run = crashed.run_thread()
+        pending = log.begin(
+            crashed.get_thread_id(), run.id, crashed.get_assistant_id(), "msg", crashed.last_user_message
+        )
+        log._write(pending._replace(pid=pid, started_at=time.time() + index))
+
+    assistant = make_assistant(poll_interval=0.02)
+    messages = resume_orphaned_run(assistant, log)
+
+    assert messages[-1] == {"role": "user", "content": "question 1"}
+    assert assistant.resumed_run.run_id == run.id
+    # The older run is forgotten rather than resumed by the next session
+    assert [pending.run_id for pending in log.pending()] == [run.id]
+
+
+def test_old_orphans_expire(tmp_path):
+    log = RunLog(str(tmp_path), max_age=60)
+    old = log.begin("thread_1", "run_1", "asst_1", "msg_1", {"role": "user", "content": "hi"})
+    log._write(old._replace(pid=dead_pid(), started_at=time.time() - 120))
+
+    assert log.orphaned("asst_1") == []
+    assert log.pending() == []